@@ -1,18 +1,55 @@
+import time
+_startup_mark = time.perf_counter()  # Start of the startup timing report
+
 import discord
 from discord.ext import commands
 import asyncio
 import sqlite3
 import json
 import os
-import time
+import shutil
+import hashlib
+import hmac
+from collections import namedtuple, deque, OrderedDict, Counter
+from array import array
+import csv
+import io
+import base64
+import zlib
+import gzip
+import re
+import sys
+import math
+import bisect
+import functools
+import random
+import contextvars
+import socket
+import subprocess
+import signal
 from datetime import datetime
 import uuid
-from flask import Flask, render_template, request, jsonify
 import threading
 import queue
+import logging
+import logging.handlers
+import atexit
+import gc
+import tracemalloc
+import multiprocessing
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 import aiohttp
+import yarl
 from dotenv import load_dotenv
 
+from workers import normalize_image, compute_insights
+
+try:
+    import brotli  # Optional: lets the dashboard assets be served brotli-compressed
+except ImportError:
+    brotli = None
+
 # Load environment variables
 load_dotenv()
 
@@ -21,22 +58,192 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# SHARD_COUNT switches to AutoShardedBot ('auto' lets Discord choose); SHARD_IDS
+# limits this process to some of the shards, as the cluster launcher does
+SHARD_COUNT = os.getenv('SHARD_COUNT')
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()] or None
+
+# MEMBER_CACHE=compact keeps no discord.py Member objects: guilds are chunked in
+# the background after login into `member_index`, which holds only names and role ids
+MEMBER_CACHE = os.getenv('MEMBER_CACHE', 'full')
+# Every Discord HTTP request is timed through this trace; see the Metrics section
+discord_http_trace = aiohttp.TraceConfig()
+bot_options = {"http_trace": discord_http_trace}
+if MEMBER_CACHE == 'compact':
+    bot_options.update(member_cache_flags=discord.MemberCacheFlags.none(), chunk_guilds_at_startup=False)
+
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix="!",
+        intents=intents,
+        shard_count=None if SHARD_COUNT == 'auto' else int(SHARD_COUNT),
+        shard_ids=SHARD_IDS,
+        **bot_options
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, **bot_options)
 
 # Environment Variables
 DISCORD_BOT_TOKEN = os.getenv('DISCORD_BOT_TOKEN')
 BOT_ID = os.getenv('BOT_ID', 'bot_123')
 API_BASE_URL = os.getenv('API_BASE_URL', 'https://myapp.base44.com')
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'marketing_bot.db')
+
+# DISCORD_API_BASE points the bot at a Discord stand-in such as tools/mock_discord.py
+DISCORD_API_BASE = os.getenv('DISCORD_API_BASE', '').rstrip('/')
+if DISCORD_API_BASE:
+    discord.http.Route.BASE = f"{DISCORD_API_BASE}/api/v10"
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(DISCORD_API_BASE.replace('http', 'ws', 1) + '/gateway/')
+
+# Process layout: 'all' runs everything in one process (legacy), 'gateway' runs only
+# the bot, 'dashboard' only the web app, and 'split' runs the bot and launches the
+# dashboard under gunicorn as a child process. Split processes talk over IPC_SOCKET.
+BOT_MODE = os.getenv('BOT_MODE', 'all')
+IPC_SOCKET = os.getenv('IPC_SOCKET', '/tmp/marketing-bot.sock')
+DASHBOARD_WORKERS = int(os.getenv('DASHBOARD_WORKERS', '4'))
+DASHBOARD_THREADS = int(os.getenv('DASHBOARD_THREADS', '16'))  # each open event stream holds a thread
+
+# Shard clusters: with SHARD_CLUSTERS > 1 the gateway launcher starts one process
+# per cluster, each owning every SHARD_CLUSTERS-th shard. The dashboard manages
+# DASHBOARD_GUILD_ID (default: the first guild) and talks to the cluster owning it.
+SHARD_CLUSTERS = int(os.getenv('SHARD_CLUSTERS', '1'))
+CLUSTER_ID = int(os.getenv('CLUSTER_ID')) if os.getenv('CLUSTER_ID') else None
+DASHBOARD_GUILD_ID = int(os.getenv('DASHBOARD_GUILD_ID')) if os.getenv('DASHBOARD_GUILD_ID') else None
+
+# Media store: uploads are kept on disk under their SHA-256. Embeds need a URL
+# Discord can fetch, either MEDIA_PUBLIC_URL (where /media/<hash> is reachable)
+# or a CDN URL from uploading the file once to MEDIA_CHANNEL_ID. With neither,
+# the file is attached to every DM that shows it.
+MEDIA_DIR = os.getenv('MEDIA_DIR', 'media')
+MEDIA_PUBLIC_URL = os.getenv('MEDIA_PUBLIC_URL', '').rstrip('/')
+MEDIA_CHANNEL_ID = os.getenv('MEDIA_CHANNEL_ID')
+MEDIA_CDN_URL_TTL = 20 * 60 * 60  # Discord attachment URLs expire after about a day
+DASHBOARD_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard.html')
+
+# Tracking retention: raw events live in monthly partition files, older months
+# are compacted into daily aggregates and the aggregates expire after N days
+TRACKING_DIR = os.getenv('TRACKING_DIR', 'tracking')
+TRACKING_RAW_MONTHS = min(max(int(os.getenv('TRACKING_RAW_MONTHS', '3')), 1), 10)
+TRACKING_AGGREGATE_DAYS = int(os.getenv('TRACKING_AGGREGATE_DAYS', '365'))
+TRACKING_MAINTENANCE_INTERVAL = int(os.getenv('TRACKING_MAINTENANCE_INTERVAL', '3600'))
+
+# Background insight engine
+INSIGHTS_INTERVAL = int(os.getenv('INSIGHTS_INTERVAL', '900'))
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '1'))
+# Seconds to wait for one job in the worker pool (an image or an insight refresh)
+WORKER_TASK_TIMEOUT = int(os.getenv('WORKER_TASK_TIMEOUT', '60'))
+
+# Rows fetched per round-trip when streaming exports
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '1000'))
+
+# How long a built /api/bootstrap body may be reused
+BOOTSTRAP_CACHE_SECONDS = float(os.getenv('BOOTSTRAP_CACHE_SECONDS', '2'))
+
+# Shutdown: how long in-flight work may take to finish after SIGTERM, and how
+# many campaign sends are buffered between checkpoints
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '20'))
+CAMPAIGN_CHECKPOINT_EVERY = 20
+
+# Role DMs: member updates only queue (member, role) pairs, and ROLE_DM_WORKERS
+# tasks deliver them at no more than ROLE_DM_RATE DMs per second. A pair queued
+# again within ROLE_DM_DEDUP_SECONDS is ignored; beyond ROLE_DM_QUEUE_SIZE waiting
+# DMs new ones are dropped.
+ROLE_DM_WORKERS = int(os.getenv('ROLE_DM_WORKERS', '4'))
+ROLE_DM_RATE = float(os.getenv('ROLE_DM_RATE', '5'))
+ROLE_DM_DEDUP_SECONDS = float(os.getenv('ROLE_DM_DEDUP_SECONDS', '300'))
+ROLE_DM_QUEUE_SIZE = int(os.getenv('ROLE_DM_QUEUE_SIZE', '10000'))
+
+# Prometheus metrics are served at /metrics; METRICS_PORT also serves them from
+# processes without a dashboard (each shard cluster on METRICS_PORT + CLUSTER_ID)
+METRICS_PORT = int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None
+EVENT_LOOP_LAG_INTERVAL = 0.5
+
+# Tracing: spans are exported as OTLP/JSON to TRACE_FILE and/or an OTLP/HTTP
+# collector at TRACE_OTLP_ENDPOINT. TRACE_SAMPLE_RATE is the share of traces kept;
+# TRACE_SAMPLE_RATES overrides it per root span, e.g. "campaign.send=0.01,on_member_update=1"
+TRACE_FILE = os.getenv('TRACE_FILE')
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', '').rstrip('/')
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'marketing-bot')
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.05'))
+TRACE_SAMPLE_RATES = {name.strip(): float(rate) for name, _, rate in (item.partition('=') for item in os.getenv('TRACE_SAMPLE_RATES', '').split(',')) if rate}
+TRACING_ENABLED = bool(TRACE_FILE or TRACE_OTLP_ENDPOINT)
+
+# Logging: hot paths log through a queue drained by a writer thread. LOG_FORMAT=json
+# writes JSON lines (text keeps the plain messages); LOG_LEVEL=DEBUG adds a line per
+# DM recipient, otherwise DM outcomes are summarized every LOG_SUMMARY_INTERVAL
+# seconds. LOG_SAMPLE_RATES keeps a share of a category's records below ERROR,
+# e.g. "dm=0.01"; LOG_QUEUE_SIZE records may wait before new ones are dropped.
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATES = {name.strip(): float(rate) for name, _, rate in (item.partition('=') for item in os.getenv('LOG_SAMPLE_RATES', '').split(',')) if rate}
+LOG_SUMMARY_INTERVAL = float(os.getenv('LOG_SUMMARY_INTERVAL', '30'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# Admin endpoints (/api/admin/*) need "Authorization: Bearer $ADMIN_TOKEN" and are
+# disabled while it is unset. PROFILE_INTERVAL is the CPU profiler's sample period.
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.01'))
+PROFILE_MAX_SECONDS = 120
+MEMORY_TRACE_FRAMES = 10  # Stack depth tracemalloc keeps per allocation
+
+# Results of dashboard operations nobody waits for any more (the caller timed out,
+# or the operation was only queued) are dropped after this many seconds
+OPERATION_RESULT_TTL = float(os.getenv('OPERATION_RESULT_TTL', '300'))
+
+# Gateway recorder: GATEWAY_RECORD_FILE appends every GATEWAY_RECORD_EVENTS dispatch
+# as a JSON line (gzipped when the name ends in .gz) for tools/replay.py.
+# Recordings hold member names and DM contents, so keep them private.
+GATEWAY_RECORD_FILE = os.getenv('GATEWAY_RECORD_FILE')
+GATEWAY_RECORD_EVENTS = {event.strip() for event in os.getenv('GATEWAY_RECORD_EVENTS', 'GUILD_MEMBER_ADD,GUILD_MEMBER_UPDATE,GUILD_MEMBER_REMOVE,MESSAGE_CREATE').split(',') if event.strip()}
+
+# List API page sizes
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
 
-# Check if token is provided
-if not DISCORD_BOT_TOKEN:
+# Check if token is provided (the dashboard process never talks to Discord itself)
+if SHARD_CLUSTERS > 1 and not (SHARD_COUNT or '').isdigit():
+    print("❌ Error: SHARD_CLUSTERS needs a numeric SHARD_COUNT to split shards between processes!")
+    exit(1)
+
+if not DISCORD_BOT_TOKEN and BOT_MODE != 'dashboard':
     print("❌ Error: DISCORD_BOT_TOKEN environment variable is required!")
     exit(1)
 
+# Startup timing
+startup_timings = {}
+
+def startup_phase(name):
+    """Record how long the startup phase that just ended took"""
+    global _startup_mark
+    now = time.perf_counter()
+    startup_timings[name] = round(now - _startup_mark, 3)
+    _startup_mark = now
+
 # Flask Dashboard
-app = Flask(__name__)
-app.config['TEMPLATES_AUTO_RELOAD'] = True
-app.secret_key = 'your-secret-key-here'
+# Flask is only imported when a dashboard is actually served; until then routes
+# are collected by @route and registered on the app by create_app().
+app = None
+_routes = []
+
+def route(rule, **options):
+    def register(view):
+        _routes.append((rule, options, view))
+        return view
+    return register
+
+def create_app():
+    """Build the dashboard app on first use"""
+    global app, Flask, render_template, request, jsonify, Response, stream_with_context, send_file
+    if app is None:
+        from flask import Flask, render_template, request, jsonify, Response, stream_with_context, send_file
+        init_database()
+        app = Flask(__name__)
+        # DASHBOARD_DEV=1 reloads templates and rebuilds dashboard assets when dashboard.html changes
+        app.config['TEMPLATES_AUTO_RELOAD'] = os.getenv('DASHBOARD_DEV') == '1'
+        app.secret_key = 'your-secret-key-here'
+        for rule, options, view in _routes:
+            app.add_url_rule(rule, view_func=traced_view(rule, view), **options)
+    return app
 
 # Global variables
 bot_status = {"running": False, "guilds": [], "commands": [], "last_sync": None}
@@ -44,17 +251,826 @@ get_now_buttons = {}
 role_dms = {}
 marketing_campaigns = {}
 leads = []
-server_logo_url = ""
 
 # Operation queue for dashboard operations
+class ExpiringResults:
+    """Operation results by id; entries not collected within `ttl` seconds are evicted on the next store"""
+    
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.results = OrderedDict()  # id -> (stored at, result), oldest first
+        self.expired = 0
+        self.lock = threading.Lock()
+    
+    def __setitem__(self, operation_id, result):
+        with self.lock:
+            self.evict()
+            self.results[operation_id] = (time.monotonic(), result)
+    
+    def __contains__(self, operation_id):
+        return operation_id in self.results
+    
+    def __len__(self):
+        return len(self.results)
+    
+    def pop(self, operation_id, default=None):
+        with self.lock:
+            entry = self.results.pop(operation_id, None)
+        return entry[1] if entry else default
+    
+    def evict(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.results:
+            operation_id, (stored_at, _) = next(iter(self.results.items()))
+            if stored_at > cutoff:
+                break
+            del self.results[operation_id]
+            self.expired += 1
+
 operation_queue = queue.Queue()
-operation_results = {}
+operation_results = ExpiringResults(OPERATION_RESULT_TTL)
+
+# Change notifications for the dashboard event stream
+class ChangeFeed:
+    """Thread-safe, versioned log of recent changes that stream readers block on"""
+    
+    def __init__(self, history=256):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._listeners = []
+        self.version = 0
+    
+    def publish(self, topic, data=None, version=None):
+        """Append an event; `version` is given when mirroring another process's feed"""
+        with self._condition:
+            self.version = self.version + 1 if version is None else version
+            self._events.append((self.version, topic, data))
+            self._condition.notify_all()
+            for listener in self._listeners:
+                listener(self.version, topic, data)
+    
+    def add_listener(self, listener):
+        """Call `listener(version, topic, data)` on every publish, from the publishing thread"""
+        with self._condition:
+            self._listeners.append(listener)
+    
+    def wait(self, after_version, timeout):
+        """Block until something newer than `after_version` is published or `timeout` passes
+
+        Returns (events, missed) where `missed` is True when events older than the
+        retained history were skipped and the reader has to resync from scratch.
+        """
+        with self._condition:
+            if self.version <= after_version:
+                self._condition.wait(timeout)
+            events = [event for event in self._events if event[0] > after_version]
+            missed = bool(events) and events[0][0] > after_version + 1
+            if not events and self.version > after_version:
+                missed = True
+            return events, missed
+
+change_feed = ChangeFeed()
+
+def notify_change(topic, **data):
+    """Tell connected dashboards that `topic` changed, with an optional delta"""
+    if BOT_MODE == 'dashboard':
+        # The gateway numbers the event and fans it out to every dashboard worker
+        try:
+            ipc_call('publish', {"topic": topic, "data": data}, timeout=5)
+            return
+        except (OSError, ValueError):
+            pass  # Gateway unreachable: at least this worker's clients hear about it
+    change_feed.publish(topic, data or None)
+
+# Logging
+# `log` never writes on the caller's thread: LogQueueHandler formats the message,
+# notes the active trace and hands the record to a bounded queue, and a
+# QueueListener thread writes it out. When stdout can't keep up, records are
+# dropped and counted rather than stalling the bot loop.
+log = logging.getLogger('marketing_bot')
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per record: time, level, category, message and the record's fields"""
+    
+    def format(self, record):
+        entry = {
+            "time": datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + "Z",
+            "level": record.levelname.lower(),
+            "category": getattr(record, 'category', 'bot'),
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if getattr(record, 'trace_id', None):
+            entry["trace_id"] = record.trace_id
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class LogSampler(logging.Filter):
+    """Keeps LOG_SAMPLE_RATES[category] of a category's records; errors are always kept"""
+    
+    def filter(self, record):
+        rate = LOG_SAMPLE_RATES.get(getattr(record, 'category', 'bot'))
+        return rate is None or record.levelno >= logging.ERROR or random.random() < rate
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Queues records for the writer thread, dropping them when the queue is full"""
+    
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record):
+        # Resolve everything tied to the calling thread; the writer formats the rest
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        active = current_span.get()
+        if active is not None and active.sampled:
+            record.trace_id = active.trace_id
+        return record
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class DeliverySummary:
+    """DM outcomes per kind and campaign, logged as one line each per LOG_SUMMARY_INTERVAL"""
+    
+    def __init__(self, interval):
+        self.interval = interval
+        self.counts = Counter()
+        self.window_started = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def add(self, kind, status, campaign=''):
+        with self.lock:
+            self.counts[(kind, campaign, status)] += 1
+    
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            window = time.monotonic() - self.window_started
+            self.window_started = time.monotonic()
+        by_send = {}
+        for (kind, campaign, status), count in counts.items():
+            by_send.setdefault((kind, campaign), {})[status] = count
+        for (kind, campaign), statuses in sorted(by_send.items()):
+            outcomes = ", ".join(f"{count} {status.replace('_', ' ')}" for status, count in sorted(statuses.items()))
+            log.info(f"📬 {kind}{f' {campaign}' if campaign else ''}: {outcomes} in the last {window:.0f}s",
+                     extra={"category": "dm_summary", "fields": {"kind": kind, "campaign": campaign, "window_seconds": round(window, 1), **statuses}})
+        if log_queue_handler.dropped:
+            dropped, log_queue_handler.dropped = log_queue_handler.dropped, 0
+            log.warning(f"⚠️ Dropped {dropped} log records: the log writer fell behind", extra={"category": "logging", "fields": {"dropped": dropped}})
+    
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+def dm_log_fields(kind, status, user, campaign='', **fields):
+    """`extra` for a per-recipient DM record"""
+    return {"category": "dm", "fields": {"kind": kind, "status": status, "user_id": str(user.id), "campaign": campaign, **fields}}
+
+def setup_logging():
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonLogFormatter() if LOG_FORMAT == 'json' else logging.Formatter('%(message)s'))
+    queue_handler = LogQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    queue_handler.addFilter(LogSampler())
+    log.addHandler(queue_handler)
+    log.setLevel(LOG_LEVEL)
+    log.propagate = False
+    listener = logging.handlers.QueueListener(queue_handler.queue, handler)
+    listener.start()
+    return listener, queue_handler
+
+def flush_logs(timeout=5):
+    """Write out the DM summary and wait (up to `timeout`) for queued records to reach stdout"""
+    delivery_summary.flush()
+    deadline = time.monotonic() + timeout
+    while log_queue_handler.queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sys.stdout.flush()
+
+log_listener, log_queue_handler = setup_logging()
+delivery_summary = DeliverySummary(LOG_SUMMARY_INTERVAL)
+threading.Thread(target=delivery_summary.run, name='log-summary', daemon=True).start()
+atexit.register(flush_logs)
+
+# Metrics
+# Counters, gauges and histograms live in this process and are rendered in the
+# Prometheus text format on scrape. Recording is a dict update under one lock and
+# a scrape only copies the numbers, so frequent scrapes never hold up the bot loop.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+class Metrics:
+    """Thread-safe registry of labelled counters, gauges and histograms"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}
+        self._values = {}  # (name, labels) -> number, or bucket counts + [sum, count] for histograms
+        self._collectors = []
+    
+    def define(self, name, kind, help_text, buckets=None):
+        self._families[name] = (kind, help_text, buckets)
+    
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+    
+    def observe(self, name, value, **labels):
+        buckets = self._families[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(buckets) + 3)
+            counts[bisect.bisect_left(buckets, value)] += 1  # Last bucket slot is +Inf
+            counts[-2] += value
+            counts[-1] += 1
+    
+    def add_collector(self, collector):
+        """Call `collector()` before every scrape to refresh gauges that mirror live state"""
+        self._collectors.append(collector)
+    
+    def render(self):
+        """The current values in the Prometheus text exposition format"""
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"❌ Metrics collector failed: {e}")
+        with self._lock:
+            series = {}
+            for (name, labels), value in self._values.items():
+                series.setdefault(name, []).append((labels, list(value) if isinstance(value, list) else value))
+        
+        lines = []
+        for name, (kind, help_text, buckets) in self._families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series.get(name, []), key=lambda item: item[0]):
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(buckets + (math.inf,), value):
+                        cumulative += count
+                        le = '+Inf' if bound == math.inf else f"{bound:g}"
+                        lines.append(f"{name}_bucket{format_metric_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{format_metric_labels(labels)} {value[-2]!r}")
+                    lines.append(f"{name}_count{format_metric_labels(labels)} {value[-1]}")
+                else:
+                    lines.append(f"{name}{format_metric_labels(labels)} {float(value)!r}")
+        return '\n'.join(lines) + '\n'
+
+def format_metric_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+metrics = Metrics()
+metrics.define('discord_dms_total', 'counter', 'DM attempts by kind, campaign and outcome')
+metrics.define('discord_dm_send_seconds', 'histogram', 'Time to open the DM channel and send one DM', LATENCY_BUCKETS)
+metrics.define('discord_http_request_seconds', 'histogram', 'Discord HTTP API request latency', LATENCY_BUCKETS)
+metrics.define('discord_http_responses_total', 'counter', 'Discord HTTP API responses by status code')
+metrics.define('discord_rate_limits_total', 'counter', 'Discord 429 responses by rate limit scope')
+metrics.define('gateway_latency_seconds', 'gauge', 'Gateway heartbeat latency by shard')
+metrics.define('event_loop_lag_seconds', 'histogram', 'How late the bot event loop wakes up from a timed sleep', QUERY_BUCKETS)
+metrics.define('operation_queue_depth', 'gauge', 'Dashboard operations waiting for the bot')
+metrics.define('operation_queue_wait_seconds', 'histogram', 'Time dashboard operations spend queued', LATENCY_BUCKETS)
+metrics.define('operation_seconds', 'histogram', 'Time to run a dashboard operation', LATENCY_BUCKETS)
+metrics.define('sqlite_query_seconds', 'histogram', 'SQLite statement latency by statement kind and table', QUERY_BUCKETS)
+metrics.define('process_resident_memory_bytes', 'gauge', 'Resident memory of this process')
+metrics.define('operation_results_pending', 'gauge', 'Operation results stored and not yet collected')
+metrics.define('asyncio_tasks', 'gauge', 'Tasks alive on the bot event loop')
+metrics.define('role_dm_queue_depth', 'gauge', 'Role DMs waiting for a worker')
+metrics.define('role_dm_queue_wait_seconds', 'histogram', 'Time role DMs wait between the member update and delivery', LATENCY_BUCKETS)
+metrics.define('role_dm_skipped_total', 'counter', 'Role DMs not queued, by reason (duplicate, queue_full)')
+
+def record_dm_send(kind, status, started, campaign=''):
+    """Count one DM attempt started at perf_counter() value `started`"""
+    metrics.observe('discord_dm_send_seconds', time.perf_counter() - started, kind=kind)
+    metrics.inc('discord_dms_total', kind=kind, campaign=campaign, status=status)
+    delivery_summary.add(kind, status, campaign)
+
+async def _trace_request_start(session, context, params):
+    context.started = time.perf_counter()
+
+async def _trace_request_end(session, context, params):
+    metrics.observe('discord_http_request_seconds', time.perf_counter() - context.started, method=params.method)
+    metrics.inc('discord_http_responses_total', status=str(params.response.status))
+    if params.response.status == 429:
+        metrics.inc('discord_rate_limits_total', scope=params.response.headers.get('X-RateLimit-Scope', 'unknown'))
+
+discord_http_trace.on_request_start.append(_trace_request_start)
+discord_http_trace.on_request_end.append(_trace_request_end)
+
+def process_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+def collect_bot_metrics():
+    metrics.set('operation_queue_depth', operation_queue.qsize())
+    metrics.set('operation_results_pending', len(operation_results))
+    rss = process_rss_bytes()
+    if rss is not None:
+        metrics.set('process_resident_memory_bytes', rss)
+    if bot_loop is not None:
+        metrics.set('asyncio_tasks', len(asyncio.all_tasks(bot_loop[0])))
+    metrics.set('role_dm_queue_depth', role_dm_queue.depth())
+    latencies = bot.latencies if isinstance(bot, commands.AutoShardedBot) else [(0, bot.latency)]
+    for shard_id, latency in latencies:
+        if math.isfinite(latency):
+            metrics.set('gateway_latency_seconds', latency, shard=str(shard_id))
+
+metrics.add_collector(collect_bot_metrics)
+
+async def monitor_event_loop():
+    """Measure how far behind schedule the bot loop runs"""
+    while not supervisor.stopping:
+        started = time.perf_counter()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        metrics.observe('event_loop_lag_seconds', max(time.perf_counter() - started - EVENT_LOOP_LAG_INTERVAL, 0))
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(sql):
+    """'SELECT campaign_runs' style label for a statement, keeping the metric's cardinality small"""
+    verb = sql.split(None, 1)[0].upper() if sql.strip() else ''
+    match = re.search(r'\b(?:FROM|INTO|UPDATE|JOIN|TABLE(?:\s+IF\s+NOT\s+EXISTS)?)\s+([\w.]+)', sql, re.IGNORECASE)
+    return f"{verb} {match.group(1)}" if match else verb
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records each statement's latency in sqlite_query_seconds, and as a span inside a trace"""
+    
+    def execute(self, sql, parameters=()):
+        label = statement_label(sql)
+        started = time.perf_counter()
+        try:
+            with span(f"sqlite {label}", kind='client', optional=True, **{"db.system": "sqlite", "db.statement": sql}):
+                return super().execute(sql, parameters)
+        finally:
+            metrics.observe('sqlite_query_seconds', time.perf_counter() - started, statement=label)
+    
+    def executemany(self, sql, seq_of_parameters):
+        label = statement_label(sql)
+        started = time.perf_counter()
+        try:
+            with span(f"sqlite {label}", kind='client', optional=True, **{"db.system": "sqlite", "db.statement": sql}):
+                return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe('sqlite_query_seconds', time.perf_counter() - started, statement=label)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind conn.execute(), are TimedCursors"""
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+# Tracing
+# Spans follow the OpenTelemetry data model. Whether a trace is recorded is decided
+# once, when its root span starts, and inherited by every span started under it
+# (including across IPC and queued operations via a W3C traceparent); unsampled
+# work only pays for a context variable lookup. Finished spans are batched and
+# written by a background thread.
+TRACE_SPAN_KINDS = {'internal': 1, 'server': 2, 'client': 3}
+current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """A recorded unit of work; entering it makes it the parent of spans started inside"""
+    sampled = True
+    
+    def __init__(self, name, kind, attributes, trace_id, parent_id):
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.error = None
+        self.start = time.time_ns()
+        self.end = None
+        self._token = None
+    
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+    
+    def record_error(self, error):
+        self.error = f"{type(error).__name__}: {error}"
+    
+    def finish(self):
+        self.end = time.time_ns()
+        trace_exporter.add(self)
+    
+    def __enter__(self):
+        self._token = current_span.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        current_span.reset(self._token)
+        if isinstance(exc, Exception):
+            self.record_error(exc)
+        self.finish()
+        return False
+
+class UnsampledSpan:
+    """Stands in for a span that isn't recorded; as the root of a trace it keeps its children unrecorded too"""
+    sampled = False
+    
+    def __init__(self, root=False):
+        self._root = root
+        self._token = None
+    
+    def set_attribute(self, key, value):
+        pass
+    
+    def record_error(self, error):
+        pass
+    
+    def finish(self):
+        pass
+    
+    def __enter__(self):
+        if self._root:
+            self._token = current_span.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self._root:
+            current_span.reset(self._token)
+        return False
+
+NOOP_SPAN = UnsampledSpan()
+
+def span(name, kind='internal', optional=False, traceparent=None, **attributes):
+    """Start a span under the current one, or a new trace (sampled per TRACE_SAMPLE_RATES)
+
+    `optional` spans are only recorded inside an existing trace. `traceparent`
+    continues a trace started in another process or before an operation was queued.
+    """
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    parent = current_span.get()
+    if parent is not None:
+        if not parent.sampled:
+            return NOOP_SPAN
+        return Span(name, TRACE_SPAN_KINDS[kind], attributes, parent.trace_id, parent.span_id)
+    if traceparent:
+        match = re.match(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$', traceparent)
+        if match:
+            if not int(match.group(3), 16) & 1:
+                return UnsampledSpan(root=True)
+            return Span(name, TRACE_SPAN_KINDS[kind], attributes, match.group(1), match.group(2))
+    if optional or random.random() >= TRACE_SAMPLE_RATES.get(name, TRACE_SAMPLE_RATE):
+        return UnsampledSpan(root=True)
+    return Span(name, TRACE_SPAN_KINDS[kind], attributes, os.urandom(16).hex(), None)
+
+def current_traceparent():
+    """W3C traceparent of the current span, to hand the trace on to other processes"""
+    parent = current_span.get()
+    if parent is None or not parent.sampled:
+        return None
+    return f"00-{parent.trace_id}-{parent.span_id}-01"
+
+def traced_view(rule, view):
+    """Wrap a Flask view in a server span"""
+    if not TRACING_ENABLED:
+        return view
+    
+    @functools.wraps(view)
+    def traced(*args, **kwargs):
+        with span(f"{request.method} {rule}", kind='server', traceparent=request.headers.get('traceparent'), **{"http.route": rule, "http.method": request.method}):
+            return view(*args, **kwargs)
+    return traced
+
+def add_http_tracing(trace_config, peer, propagate=False):
+    """Record a client span for each request made through `trace_config` within a trace"""
+    async def on_request_start(session, context, params):
+        context.span = span(f"{peer} {params.method}", kind='client', optional=True, **{
+            "http.method": params.method,
+            "url.path": params.url.path,
+            "server.address": params.url.host
+        })
+        if propagate and context.span.sampled:
+            params.headers['traceparent'] = f"00-{context.span.trace_id}-{context.span.span_id}-01"
+    
+    async def on_request_end(session, context, params):
+        context.span.set_attribute("http.status_code", params.response.status)
+        context.span.finish()
+    
+    async def on_request_exception(session, context, params):
+        context.span.record_error(params.exception)
+        context.span.finish()
+    
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+add_http_tracing(discord_http_trace, 'discord')
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def otlp_attributes(attributes):
+    return [{"key": key, "value": otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+def otlp_payload(spans):
+    """An OTLP/JSON ExportTraceServiceRequest for `spans`"""
+    resource = {"service.name": TRACE_SERVICE_NAME, "process.pid": os.getpid(), "bot.mode": BOT_MODE, "bot.cluster": CLUSTER_ID}
+    records = []
+    for finished in spans:
+        record = {
+            "traceId": finished.trace_id,
+            "spanId": finished.span_id,
+            "name": finished.name,
+            "kind": finished.kind,
+            "startTimeUnixNano": str(finished.start),
+            "endTimeUnixNano": str(finished.end),
+            "attributes": otlp_attributes(finished.attributes)
+        }
+        if finished.parent_id:
+            record["parentSpanId"] = finished.parent_id
+        if finished.error:
+            record["status"] = {"code": 2, "message": finished.error}
+        records.append(record)
+    return {"resourceSpans": [{
+        "resource": {"attributes": otlp_attributes(resource)},
+        "scopeSpans": [{"scope": {"name": "bot"}, "spans": records}]
+    }]}
+
+class TraceExporter:
+    """Batches finished spans and exports them from a daemon thread, dropping spans rather than blocking"""
+    
+    def __init__(self, batch_size=512, interval=2, capacity=10000):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=capacity)
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def add(self, finished):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+    
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self.export(batch)
+    
+    def flush(self):
+        """Export whatever is still queued, e.g. on shutdown"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.export(batch)
+    
+    def export(self, spans):
+        body = json.dumps(otlp_payload(spans), default=str).encode('utf-8')
+        try:
+            if TRACE_FILE:
+                # One write per batch, so processes sharing the file never interleave lines
+                fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, body + b'\n')
+                finally:
+                    os.close(fd)
+            if TRACE_OTLP_ENDPOINT:
+                import urllib.request
+                request_object = urllib.request.Request(f"{TRACE_OTLP_ENDPOINT}/v1/traces", data=body, headers={'Content-Type': 'application/json'})
+                urllib.request.urlopen(request_object, timeout=5).close()
+        except Exception as e:
+            print(f"❌ Failed to export {len(spans)} trace spans: {e}")
+
+trace_exporter = TraceExporter()
+
+# Profiling
+# A sampling profiler that is cheap enough for the live process: a daemon thread
+# reads every thread's stack from sys._current_frames() each PROFILE_INTERVAL and
+# counts them in collapsed form ("thread;outer;inner count", as flamegraph.pl and
+# speedscope read it). Samples of the bot loop thread are filed under the asyncio
+# task that was running, so busy coroutines can be ranked.
+bot_loop = None  # (event loop, thread id) of the bot, set by run_bot_async
+_profile_lock = threading.Lock()
+
+def profile_frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+class SamplingProfiler:
+    """Counts the stacks of every thread, and the running asyncio task, for `seconds`"""
+    
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = {}
+        self.coroutines = {}
+        self.tasks = {}
+        self.samples = 0
+        self.sampling_time = 0
+        self.duration = 0
+    
+    def sample(self):
+        own_thread = threading.get_ident()
+        loop, loop_thread = bot_loop or (None, None)
+        task = asyncio.current_task(loop) if loop is not None else None
+        names = {thread.ident: re.sub(r'-\d+', '', thread.name) for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            stack = []
+            while frame is not None and len(stack) < 128:
+                stack.append(profile_frame_name(frame.f_code))
+                frame = frame.f_back
+            root = names.get(thread_id, f"thread {thread_id}").replace(';', ',')
+            if thread_id == loop_thread:
+                root = 'event loop'
+                if task is not None:
+                    coroutine = getattr(task.get_coro(), '__qualname__', 'coroutine')
+                    root += f";task {coroutine}"
+                    self.coroutines[coroutine] = self.coroutines.get(coroutine, 0) + 1
+                    entry = self.tasks.setdefault(task.get_name(), [coroutine, 0])
+                    entry[1] += 1
+            key = ';'.join([root] + stack[::-1])
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+    
+    def run(self, seconds):
+        started = time.perf_counter()
+        deadline = started + seconds
+        while True:
+            before = time.perf_counter()
+            if before >= deadline:
+                break
+            self.sample()
+            after = time.perf_counter()
+            self.sampling_time += after - before
+            time.sleep(max(self.interval - (after - before), 0))
+        self.duration = time.perf_counter() - started
+        return self
+    
+    def collapsed(self, prefix=''):
+        return ''.join(f"{prefix}{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+    
+    def summary(self, prefix=''):
+        """Collapsed stacks plus the coroutines and tasks that held the loop longest"""
+        per_sample_ms = self.duration * 1000 / self.samples if self.samples else 0
+        return {
+            "seconds": round(self.duration, 3),
+            "samples": self.samples,
+            "overhead_percent": round(self.sampling_time / self.duration * 100, 2) if self.duration else 0,
+            "collapsed": self.collapsed(prefix),
+            "coroutines": [{"coroutine": name, "samples": count, "cpu_ms": round(count * per_sample_ms, 1)}
+                           for name, count in sorted(self.coroutines.items(), key=lambda item: -item[1])[:20]],
+            "tasks": [{"task": name, "coroutine": coroutine, "samples": count, "cpu_ms": round(count * per_sample_ms, 1)}
+                      for name, (coroutine, count) in sorted(self.tasks.items(), key=lambda item: -item[1][1])[:20]]
+        }
+
+def run_profile(seconds, prefix=''):
+    """Profile this process for `seconds`; one profile runs at a time"""
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        return SamplingProfiler().run(seconds).summary(prefix)
+    finally:
+        _profile_lock.release()
+
+# Memory diagnostics
+# Counts of what usually leaks here (views, tasks, uncollected results, caches)
+# and tracemalloc snapshots diffed against the previous one. Tracing starts with
+# the first snapshot and costs memory and CPU until it is stopped again.
+_memory_baseline = None
+
+def memory_report():
+    """Resident memory and the sizes of the structures that can grow with uptime"""
+    gc.collect()  # Count only what is still reachable
+    live = Counter()
+    tracked = {discord.ui.View: 'views', discord.Member: 'members', discord.Message: 'messages', discord.User: 'users'}
+    for obj in gc.get_objects():
+        name = tracked.get(type(obj)) or next((label for cls, label in tracked.items() if isinstance(obj, cls)), None)
+        if name:
+            live[name] += 1
+    tasks = asyncio.all_tasks(bot_loop[0]) if bot_loop is not None else set()
+    coroutines = Counter(getattr(task.get_coro(), '__qualname__', 'coroutine') for task in tasks)
+    traced, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+    return {
+        "rss_bytes": process_rss_bytes(),
+        "live_objects": dict(live),
+        "tasks": {"count": len(tasks), "by_coroutine": dict(coroutines.most_common(15))},
+        "operation_results": {"pending": len(operation_results), "expired": operation_results.expired, "ttl_seconds": operation_results.ttl},
+        "operation_queue": operation_queue.qsize(),
+        "caches": {
+            "users": len(bot.users),
+            "messages": len(bot.cached_messages),
+            "member_index": sum(len(members) for members in member_index.guilds.values()),
+            "leads": len(leads),
+            "role_dms": len(role_dms),
+            "get_now_buttons": len(get_now_buttons),
+            "marketing_campaigns": len(marketing_campaigns)
+        },
+        "gc": {"counts": gc.get_count(), "collections": [generation["collections"] for generation in gc.get_stats()]},
+        "tracemalloc": {"tracing": tracemalloc.is_tracing(), "traced_bytes": traced, "peak_bytes": traced_peak}
+    }
+
+def memory_snapshot_diff(limit=25, group='lineno'):
+    """Allocation growth since the previous snapshot; the first call starts tracing"""
+    global _memory_baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(MEMORY_TRACE_FRAMES)
+        _memory_baseline = tracemalloc.take_snapshot()
+        return {"started": True, "message": "Tracing started; take another snapshot later to see what grew"}
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    stats = snapshot.compare_to(_memory_baseline, 'traceback' if group == 'traceback' else 'lineno')
+    _memory_baseline = snapshot
+    return {"started": False, "top": [{
+        "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        "size_diff": stat.size_diff,
+        "size": stat.size,
+        "count_diff": stat.count_diff,
+        "count": stat.count
+    } for stat in stats[:limit]]}
+
+def stop_memory_tracing():
+    global _memory_baseline
+    tracemalloc.stop()
+    _memory_baseline = None
+    return {"started": False, "stopped": True}
+
+def memory_action(action, params):
+    """Run one diagnostics action: report, snapshot or stop"""
+    if action == 'snapshot':
+        return memory_snapshot_diff(int(params.get('limit', 25)), params.get('group', 'lineno'))
+    if action == 'stop':
+        return stop_memory_tracing()
+    return memory_report()
 
 # Database setup
+def db_connect():
+    """Open a connection to the main database"""
+    return sqlite3.connect(DATABASE_PATH, timeout=30, uri=True, factory=TimedConnection)
+
+# Bump whenever init_database() changes; a matching PRAGMA user_version skips the schema checks
+SCHEMA_VERSION = 1
+# In BOT_MODE=all the bot thread and create_app() both initialize the database at startup
+_init_database_lock = threading.Lock()
+
 def init_database():
-    conn = sqlite3.connect('marketing_bot.db')
+    with _init_database_lock:
+        migrate_database()
+
+def migrate_database():
+    conn = db_connect()
     cursor = conn.cursor()
     
+    cursor.execute('PRAGMA user_version')
+    if cursor.fetchone()[0] == SCHEMA_VERSION:
+        conn.close()
+        return
+    
+    # WAL lets the dashboard read while the bot writes
+    cursor.execute('PRAGMA journal_mode=WAL')
+    
     # Create all necessary tables
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS get_now_buttons (
@@ -136,21 +1152,21 @@ def init_database():
         )
     ''')
     
-    # AI Tracking tables
+    # AI Tracking tables (raw user_tracking events live in the partition files, see below)
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_tracking (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            user_name TEXT,
+        CREATE TABLE IF NOT EXISTS user_tracking_daily (
+            day TEXT NOT NULL,
             interaction_type TEXT NOT NULL,
-            interaction_data TEXT,
-            server_id TEXT,
-            channel_id TEXT,
-            message_id TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            ip_address TEXT,
-            user_agent TEXT,
-            session_id TEXT
+            events INTEGER DEFAULT 0,
+            unique_users INTEGER DEFAULT 0,
+            PRIMARY KEY (day, interaction_type)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tracking_compacted_partitions (
+            partition_name TEXT PRIMARY KEY,
+            compacted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
     
@@ -203,28 +1219,485 @@ def init_database():
         )
     ''')
     
+    # Per-recipient campaign send log (feeds the opt-out rate insights)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS campaign_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_campaign_deliveries_campaign ON campaign_deliveries (campaign_id, user_id)')
+    
+    # Campaign runs; a run without finished_at was interrupted and is resumed
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS campaign_runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign_id TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_campaign_runs_campaign ON campaign_runs (campaign_id, run_id)')
+    cursor.execute('PRAGMA table_info(campaign_deliveries)')
+    if 'run_id' not in [column[1] for column in cursor.fetchall()]:
+        try:
+            cursor.execute('ALTER TABLE campaign_deliveries ADD COLUMN run_id INTEGER')
+        except sqlite3.OperationalError as e:
+            # Another process (e.g. a gunicorn worker) added it since the check
+            if 'duplicate column' not in str(e):
+                raise
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_campaign_deliveries_run ON campaign_deliveries (run_id)')
+    
+    # Hourly rollup of the raw tracking partitions, maintained incrementally by the insight engine
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_tracking_hourly (
+            hour TEXT NOT NULL,
+            interaction_type TEXT NOT NULL,
+            events INTEGER DEFAULT 0,
+            PRIMARY KEY (hour, interaction_type)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_watermarks (
+            source TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+    ''')
+    
+    # Content-addressed media (server logo, bot avatar)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_blobs (
+            sha256 TEXT PRIMARY KEY,
+            content_type TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_refs (
+            name TEXT PRIMARY KEY,
+            sha256 TEXT,
+            external_url TEXT,
+            cdn_url TEXT,
+            cdn_url_at REAL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_variants (
+            source_sha256 TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (source_sha256, variant)
+        )
+    ''')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ai_insights_active ON ai_insights (is_active, insight_type)')
+    
+    # Indexes backing the keyset-paginated list APIs
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_opt_outs_created ON marketing_opt_outs (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_opt_outs_type_created ON marketing_opt_outs (opt_out_type, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_leads_timestamp ON leads (timestamp, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_leads_action_timestamp ON leads (action, timestamp, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_leads_user ON leads (user_id, timestamp, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_campaigns_active ON marketing_campaigns (is_active, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_getnow_channel ON get_now_buttons (channel_id, id)')
+    
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    conn.commit()
+    conn.close()
+
+# Tracking partitions
+# Every month of raw tracking events is its own SQLite file in TRACKING_DIR, so
+# expiring a month is an unlink and clearing everything is a directory swap.
+TRACKING_COLUMNS = ('id', 'user_id', 'user_name', 'interaction_type', 'interaction_data', 'server_id',
+                    'channel_id', 'message_id', 'timestamp', 'ip_address', 'user_agent', 'session_id')
+
+TRACKING_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS user_tracking (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        user_name TEXT,
+        interaction_type TEXT NOT NULL,
+        interaction_data TEXT,
+        server_id TEXT,
+        channel_id TEXT,
+        message_id TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        ip_address TEXT,
+        user_agent TEXT,
+        session_id TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_user_tracking_timestamp ON user_tracking (timestamp);
+    -- One row naming this file, so a partition recreated after a clear is not mistaken for the old one
+    CREATE TABLE IF NOT EXISTS tracking_partition (partition_id TEXT NOT NULL);
+'''
+
+def tracking_partition_name(moment=None):
+    """Get the partition name for the month containing `moment` (UTC now by default)"""
+    moment = moment or datetime.utcnow()
+    return f"user_tracking_{moment.year:04d}_{moment.month:02d}"
+
+def tracking_partition_path(name):
+    return os.path.join(TRACKING_DIR, f"{name}.db")
+
+def list_tracking_partitions():
+    """List existing partition names, oldest first"""
+    try:
+        files = os.listdir(TRACKING_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(f[:-3] for f in files if f.startswith('user_tracking_') and f.endswith('.db'))
+
+def create_tracking_partition(name):
+    """Create a partition file atomically so no writer ever sees it without its schema"""
+    path = tracking_partition_path(name)
+    os.makedirs(TRACKING_DIR, exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    conn = sqlite3.connect(temp_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(TRACKING_SCHEMA)
+    conn.execute('INSERT INTO tracking_partition (partition_id) VALUES (?)', (uuid.uuid4().hex,))
+    conn.commit()
+    conn.close()
+    try:
+        # link() fails instead of replacing, so a concurrent creator can't clobber rows
+        os.link(temp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(temp_path)
+
+def tracking_connect(name=None):
+    """Open a raw tracking partition (the current month by default), creating it on first use"""
+    name = name or tracking_partition_name()
+    path = tracking_partition_path(name)
+    if not os.path.exists(path):
+        create_tracking_partition(name)
+    return sqlite3.connect(path, timeout=30, factory=TimedConnection)
+
+def tracking_reader():
+    """Open the main database with the raw partitions attached behind the temp view user_tracking_all"""
+    conn = db_connect()
+    selects = []
+    # SQLite attaches at most 10 databases by default; TRACKING_RAW_MONTHS is capped to match
+    for name in list_tracking_partitions()[-10:]:
+        alias = f"p{len(selects)}"
+        try:
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (f"file:{tracking_partition_path(name)}?mode=ro",))
+        except sqlite3.OperationalError:
+            # Partition was dropped or cleared between listing and attaching
+            continue
+        selects.append(f"SELECT * FROM {alias}.user_tracking")
+    if not selects:
+        selects.append("SELECT " + ", ".join(f"NULL AS {col}" for col in TRACKING_COLUMNS) + " WHERE 0")
+    conn.execute("CREATE TEMP VIEW user_tracking_all AS " + " UNION ALL ".join(selects))
+    return conn
+
+def clear_tracking_partitions():
+    """Swap the tracking directory for an empty one and delete the old files in the background"""
+    trash_dir = f"{TRACKING_DIR}.cleared-{uuid.uuid4().hex[:8]}"
+    try:
+        os.rename(TRACKING_DIR, trash_dir)
+    except FileNotFoundError:
+        return
+    threading.Thread(target=shutil.rmtree, args=(trash_dir, True), daemon=True).start()
+
+def compact_tracking_partition(name):
+    """Roll a raw partition up into user_tracking_daily, then drop its file"""
+    conn = db_connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT 1 FROM tracking_compacted_partitions WHERE partition_name = ?', (name,))
+        if not cursor.fetchone():
+            cursor.execute("ATTACH DATABASE ? AS old", (tracking_partition_path(name),))
+            cursor.execute('''
+                INSERT INTO user_tracking_daily (day, interaction_type, events, unique_users)
+                SELECT date(timestamp), interaction_type, COUNT(*), COUNT(DISTINCT user_id)
+                FROM old.user_tracking
+                WHERE 1
+                GROUP BY date(timestamp), interaction_type
+                ON CONFLICT(day, interaction_type) DO UPDATE SET
+                    events = events + excluded.events,
+                    unique_users = MAX(unique_users, excluded.unique_users)
+            ''')
+            cursor.execute('INSERT INTO tracking_compacted_partitions (partition_name) VALUES (?)', (name,))
+            conn.commit()
+            cursor.execute("DETACH DATABASE old")
+    finally:
+        conn.close()
+    
+    path = tracking_partition_path(name)
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.unlink(path + suffix)
+        except FileNotFoundError:
+            pass
+
+def migrate_legacy_tracking():
+    """Move rows from the old single user_tracking table into monthly partitions"""
+    conn = db_connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_tracking'")
+        if not cursor.fetchone():
+            return
+        
+        columns = ", ".join(TRACKING_COLUMNS[1:])
+        cursor.execute("SELECT DISTINCT strftime('%Y_%m', COALESCE(timestamp, CURRENT_TIMESTAMP)) FROM user_tracking")
+        for (month,) in cursor.fetchall():
+            name = f"user_tracking_{month}"
+            if not os.path.exists(tracking_partition_path(name)):
+                create_tracking_partition(name)
+            cursor.execute("ATTACH DATABASE ? AS part", (tracking_partition_path(name),))
+            cursor.execute(f'''
+                INSERT INTO part.user_tracking ({columns})
+                SELECT {columns} FROM user_tracking
+                WHERE strftime('%Y_%m', COALESCE(timestamp, CURRENT_TIMESTAMP)) = ?
+            ''', (month,))
+            conn.commit()
+            cursor.execute("DETACH DATABASE part")
+        
+        cursor.execute('DROP TABLE user_tracking')
+        conn.commit()
+        print("✅ Migrated legacy user_tracking table into monthly partitions")
+    finally:
+        conn.close()
+
+def run_tracking_maintenance():
+    """Apply the tracking retention policy"""
+    migrate_legacy_tracking()
+    
+    # Compact every month that has fallen out of the raw window
+    now = datetime.utcnow()
+    index = now.year * 12 + now.month - 1 - (TRACKING_RAW_MONTHS - 1)
+    oldest_raw = tracking_partition_name(datetime(index // 12, index % 12 + 1, 1))
+    for name in list_tracking_partitions():
+        if name < oldest_raw:
+            compact_tracking_partition(name)
+            print(f"🗜️ Compacted tracking partition {name}")
+    
+    conn = db_connect()
+    conn.execute("DELETE FROM user_tracking_daily WHERE day < date('now', ?)", (f"-{TRACKING_AGGREGATE_DAYS} days",))
     conn.commit()
     conn.close()
 
-# Initialize database
-init_database()
+def start_tracking_maintenance():
+    """Run tracking maintenance now and then every TRACKING_MAINTENANCE_INTERVAL seconds"""
+    def maintenance_loop():
+        while True:
+            try:
+                run_tracking_maintenance()
+            except Exception as e:
+                print(f"❌ Error in tracking maintenance: {e}")
+            time.sleep(TRACKING_MAINTENANCE_INTERVAL)
+    
+    threading.Thread(target=maintenance_loop, name="tracking-maintenance", daemon=True).start()
+
+# Media store
+MEDIA_EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/gif': 'gif', 'image/webp': 'webp'}
+_media_upload_lock = None
+
+def media_path(sha256):
+    # Fan out by the first two hex digits to keep directories small
+    return os.path.join(MEDIA_DIR, sha256[:2], sha256)
+
+def store_media(data, content_type):
+    """Store bytes under their SHA-256 (deduplicated) and return the hash"""
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = media_path(sha256)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    
+    conn = db_connect()
+    conn.execute('INSERT OR IGNORE INTO media_blobs (sha256, content_type, size) VALUES (?, ?, ?)', (sha256, content_type, len(data)))
+    conn.commit()
+    conn.close()
+    return sha256
+
+def read_media(sha256):
+    with open(media_path(sha256), 'rb') as f:
+        return f.read()
+
+# Image normalization
+# Target bounding box per use; Discord renders avatars at up to 1024px and embed thumbnails far smaller
+IMAGE_VARIANTS = {
+    'avatar': 1024,
+    'logo': 512,
+}
+def store_image_variant(data, variant):
+    """Normalize an upload for `variant` in the process pool and store it; returns the derived blob's hash
+
+    Results are cached by the source hash, so uploading the same file again skips the pool entirely.
+    """
+    source_sha256 = hashlib.sha256(data).hexdigest()
+    conn = db_connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT sha256 FROM media_variants WHERE source_sha256 = ? AND variant = ?', (source_sha256, variant))
+    row = cursor.fetchone()
+    conn.close()
+    if row and os.path.exists(media_path(row[0])):
+        return row[0]
+    
+    try:
+        normalized, content_type = get_process_pool().submit(normalize_image, data, IMAGE_VARIANTS[variant]).result(timeout=WORKER_TASK_TIMEOUT)
+    except FutureTimeoutError:
+        raise ValueError("Image processing timed out")
+    sha256 = store_media(normalized, content_type)
+    
+    conn = db_connect()
+    conn.execute('INSERT OR REPLACE INTO media_variants (source_sha256, variant, sha256) VALUES (?, ?, ?)',
+                 (source_sha256, variant, sha256))
+    conn.commit()
+    conn.close()
+    print(f"🖼️ Normalized {variant} image: {len(data)} -> {len(normalized)} bytes")
+    return sha256
+
+def get_media_ref(name):
+    """Look up what a named reference (e.g. 'server_logo') points at"""
+    conn = db_connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT r.sha256, r.external_url, r.cdn_url, r.cdn_url_at, b.content_type
+        FROM media_refs r LEFT JOIN media_blobs b ON b.sha256 = r.sha256
+        WHERE r.name = ?
+    ''', (name,))
+    row = cursor.fetchone()
+    conn.close()
+    if not row:
+        return None
+    return {"sha256": row[0], "external_url": row[1], "cdn_url": row[2], "cdn_url_at": row[3], "content_type": row[4]}
+
+def set_media_ref(name, sha256=None, external_url=None):
+    conn = db_connect()
+    conn.execute('''
+        INSERT OR REPLACE INTO media_refs (name, sha256, external_url, cdn_url, cdn_url_at, updated_at)
+        VALUES (?, ?, ?, NULL, NULL, CURRENT_TIMESTAMP)
+    ''', (name, sha256, external_url))
+    conn.commit()
+    conn.close()
+
+def delete_media_ref(name):
+    conn = db_connect()
+    conn.execute('DELETE FROM media_refs WHERE name = ?', (name,))
+    conn.commit()
+    conn.close()
+
+async def resolve_media_url(name):
+    """Get a URL Discord can fetch for a media reference, uploading to the CDN at most once per TTL"""
+    global _media_upload_lock
+    ref = get_media_ref(name)
+    if not ref:
+        return None
+    if ref["external_url"]:
+        return ref["external_url"]
+    if MEDIA_PUBLIC_URL:
+        return f"{MEDIA_PUBLIC_URL}/media/{ref['sha256']}"
+    if ref["cdn_url"] and time.time() - (ref["cdn_url_at"] or 0) < MEDIA_CDN_URL_TTL:
+        return ref["cdn_url"]
+    if not MEDIA_CHANNEL_ID:
+        return None
+    
+    if _media_upload_lock is None:
+        _media_upload_lock = asyncio.Lock()
+    async with _media_upload_lock:
+        # Another task may have uploaded while we waited
+        ref = get_media_ref(name)
+        if ref and ref["cdn_url"] and time.time() - (ref["cdn_url_at"] or 0) < MEDIA_CDN_URL_TTL:
+            return ref["cdn_url"]
+        if not ref or not ref["sha256"]:
+            return None
+        channel = bot.get_channel(int(MEDIA_CHANNEL_ID))
+        if channel is None:
+            log.warning(f"⚠️ MEDIA_CHANNEL_ID {MEDIA_CHANNEL_ID} not found; attaching {name} to DMs instead")
+            return None
+        
+        filename = f"{name}.{MEDIA_EXTENSIONS.get(ref['content_type'], 'png')}"
+        data = await asyncio.get_event_loop().run_in_executor(None, read_media, ref["sha256"])
+        try:
+            message = await channel.send(file=discord.File(io.BytesIO(data), filename=filename))
+        except discord.HTTPException as e:
+            log.warning(f"⚠️ Could not upload {name} to MEDIA_CHANNEL_ID: {e}; attaching it to DMs instead")
+            return None
+        cdn_url = message.attachments[0].url
+        
+        conn = db_connect()
+        conn.execute('UPDATE media_refs SET cdn_url = ?, cdn_url_at = ? WHERE name = ? AND sha256 = ?',
+                     (cdn_url, time.time(), name, ref["sha256"]))
+        conn.commit()
+        conn.close()
+        print(f"✅ Uploaded {name} to the Discord CDN")
+        return cdn_url
+
+class MediaImage:
+    """An embed image: a URL Discord can fetch, or stored bytes sent along as an attachment"""
+    
+    def __init__(self, url, filename=None, data=None):
+        self.url = url
+        self.filename = filename
+        self.data = data
+    
+    def file(self):
+        """A fresh attachment for one send (a discord.File is consumed when sent), or None for URLs"""
+        return discord.File(io.BytesIO(self.data), filename=self.filename) if self.data is not None else None
+
+async def resolve_media(name):
+    """Resolve a media reference for an embed, falling back to attaching the stored file"""
+    url = await resolve_media_url(name)
+    if url:
+        return MediaImage(url)
+    ref = get_media_ref(name)
+    if not ref or not ref["sha256"]:
+        return None
+    try:
+        data = await asyncio.get_event_loop().run_in_executor(None, read_media, ref["sha256"])
+    except OSError as e:
+        log.warning(f"⚠️ Stored {name} could not be read: {e}")
+        return None
+    filename = f"{name}.{MEDIA_EXTENSIONS.get(ref['content_type'], 'png')}"
+    return MediaImage(f"attachment://{filename}", filename, data)
 
 # API Functions for Web Dashboard Integration
+_api_session = None
+
+def api_session():
+    """Pooled HTTP session for the dashboard API, closed on shutdown"""
+    global _api_session
+    if _api_session is None or _api_session.closed:
+        _api_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15), trace_configs=[add_http_tracing(aiohttp.TraceConfig(), 'dashboard_api', propagate=True)])
+    return _api_session
+
+async def close_api_session():
+    global _api_session
+    if _api_session is not None and not _api_session.closed:
+        await _api_session.close()
+    _api_session = None
+
 async def get_bot_config():
     """Get bot configuration from web dashboard"""
     try:
-        async with aiohttp.ClientSession() as session:
-            url = f"{API_BASE_URL}/functions/getBotConfig"
-            payload = {
-                "bot_id": BOT_ID,
-                "bot_token": DISCORD_BOT_TOKEN
-            }
-            async with session.post(url, json=payload) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    print(f"❌ Failed to get bot config: {response.status}")
-                    return {"active": False}
+        session = api_session()
+        url = f"{API_BASE_URL}/functions/getBotConfig"
+        payload = {
+            "bot_id": BOT_ID,
+            "bot_token": DISCORD_BOT_TOKEN
+        }
+        async with session.post(url, json=payload) as response:
+            if response.status == 200:
+                return await response.json()
+            else:
+                print(f"❌ Failed to get bot config: {response.status}")
+                return {"active": False}
     except Exception as e:
         print(f"❌ Error getting bot config: {e}")
         return {"active": False}
@@ -232,38 +1705,38 @@ async def get_bot_config():
 async def log_activity(activity_type, **kwargs):
     """Log bot activity to web dashboard"""
     try:
-        async with aiohttp.ClientSession() as session:
-            url = f"{API_BASE_URL}/functions/logBotActivity"
-            payload = {
-                "bot_id": BOT_ID,
-                "activity_type": activity_type,
-                "timestamp": datetime.utcnow().isoformat() + "Z",
-                **kwargs
-            }
-            async with session.post(url, json=payload) as response:
-                if response.status == 200:
-                    print(f"✅ Logged activity: {activity_type}")
-                else:
-                    print(f"❌ Failed to log activity: {response.status}")
+        session = api_session()
+        url = f"{API_BASE_URL}/functions/logBotActivity"
+        payload = {
+            "bot_id": BOT_ID,
+            "activity_type": activity_type,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            **kwargs
+        }
+        async with session.post(url, json=payload) as response:
+            if response.status == 200:
+                print(f"✅ Logged activity: {activity_type}")
+            else:
+                print(f"❌ Failed to log activity: {response.status}")
     except Exception as e:
         print(f"❌ Error logging activity: {e}")
 
 async def update_bot_status(status, message=None, stats=None):
     """Update bot status on web dashboard"""
     try:
-        async with aiohttp.ClientSession() as session:
-            url = f"{API_BASE_URL}/functions/updateBotStatus"
-            payload = {
-                "bot_id": BOT_ID,
-                "status": status,
-                "message": message,
-                "stats": stats or {}
-            }
-            async with session.post(url, json=payload) as response:
-                if response.status == 200:
-                    print(f"✅ Updated bot status: {status}")
-                else:
-                    print(f"❌ Failed to update status: {response.status}")
+        session = api_session()
+        url = f"{API_BASE_URL}/functions/updateBotStatus"
+        payload = {
+            "bot_id": BOT_ID,
+            "status": status,
+            "message": message,
+            "stats": stats or {}
+        }
+        async with session.post(url, json=payload) as response:
+            if response.status == 200:
+                print(f"✅ Updated bot status: {status}")
+            else:
+                print(f"❌ Failed to update status: {response.status}")
     except Exception as e:
         print(f"❌ Error updating status: {e}")
 
@@ -280,15 +1753,17 @@ def process_message_template(template, user, affiliate_id, guild):
     
     return message
 
-def get_users_by_roles(guild, target_roles):
+async def get_users_by_roles(guild, target_roles):
     """Get users who have any of the target roles"""
     target_users = []
+    seen = set()
     
     for role_name in target_roles:
         role = discord.utils.get(guild.roles, name=role_name)
         if role:
-            for member in role.members:
-                if member not in target_users:
+            for member in await role_members(guild, role):
+                if member.id not in seen:
+                    seen.add(member.id)
                     target_users.append(member)
     
     return target_users
@@ -309,22 +1784,81 @@ async def create_discord_buttons(template):
         )
         view.add_item(button)
     
+    view.stop()  # Nothing handles these clicks, so don't keep the view alive
     return view
 
+# Claim buttons
+# A claim DM carries a plain button whose custom_id names the role to grant, and
+# clicks are answered by the on_interaction listener below. Stopped views are not
+# kept by discord.py, so no View or callback closure stays alive per DM, and the
+# buttons keep working past the view timeout and across restarts.
+CLAIM_BUTTON_PREFIX = 'claim_role:'
+
+def claim_view(role_name, label="Claim Now", style=discord.ButtonStyle.primary, emoji="🎁"):
+    view = discord.ui.View(timeout=None)
+    view.add_item(discord.ui.Button(label=label, style=style, emoji=emoji, custom_id=f"{CLAIM_BUTTON_PREFIX}{role_name}"[:100]))
+    view.stop()
+    return view
+
+async def grant_claimed_role(interaction, claim_role_name, truncated=False):
+    """Give the clicking user the claim role, looked up by name in the bot's guilds"""
+    try:
+        # Find the guild and role
+        claim_role_obj = None
+        target_guild = None
+        
+        for guild in bot.guilds:
+            role = discord.utils.find(lambda role: role.name == claim_role_name or (truncated and role.name.startswith(claim_role_name)), guild.roles)
+            if role:
+                claim_role_obj = role
+                target_guild = guild
+                break
+        
+        if claim_role_obj and target_guild:
+            # Get the member in the guild
+            member = await fetch_guild_member(target_guild, interaction.user.id)
+            if member:
+                await member.add_roles(claim_role_obj)
+                await interaction.response.send_message(
+                    f"✅ You've been given the {claim_role_obj.name} role!", 
+                    ephemeral=True
+                )
+            else:
+                await interaction.response.send_message(
+                    "❌ You must be in the server to claim this role!", 
+                    ephemeral=True
+                )
+        else:
+            await interaction.response.send_message(
+                f"❌ Role '{claim_role_name}' not found in any server", 
+                ephemeral=True
+            )
+    except Exception as e:
+        await interaction.response.send_message(
+            f"❌ Error: {e}", 
+            ephemeral=True
+        )
+
+@bot.listen('on_interaction')
+async def claim_button_clicked(interaction):
+    custom_id = (interaction.data or {}).get('custom_id', '') if interaction.type == discord.InteractionType.component else ''
+    if custom_id.startswith(CLAIM_BUTTON_PREFIX):
+        await grant_claimed_role(interaction, custom_id[len(CLAIM_BUTTON_PREFIX):], truncated=len(custom_id) == 100)
+
 # Main Bot Loop
 async def main_bot_loop():
     """Main bot loop for web dashboard integration"""
-    while True:
+    while not supervisor.stopping:
         try:
             # 1. Get configuration from dashboard
             config = await get_bot_config()
             
             if not config.get("active"):
-                print("⏸️ Bot is inactive, waiting 5 minutes...")
-                await asyncio.sleep(300)  # 5 minutes
+                log.info("⏸️ Bot is inactive, waiting 5 minutes...", extra={"category": "templates"})
+                await supervisor.sleep(300)  # 5 minutes
                 continue
             
-            print("🔄 Processing bot configuration...")
+            log.info("🔄 Processing bot configuration...", extra={"category": "templates"})
             
             # 2. Process each message template
             message_templates = config.get("config", {}).get("message_templates", [])
@@ -333,9 +1867,9 @@ async def main_bot_loop():
             
             for guild in bot.guilds:
                 # Get target users by roles
-                target_users = get_users_by_roles(guild, target_roles)
+                target_users = await get_users_by_roles(guild, target_roles)
                 
-                print(f"📊 Found {len(target_users)} target users in {guild.name}")
+                log.info(f"📊 Found {len(target_users)} target users in {guild.name}", extra={"category": "templates"})
                 
                 # Send messages to each user
                 for user in target_users:
@@ -344,6 +1878,7 @@ async def main_bot_loop():
                             template, user, affiliate_id, guild
                         )
                         
+                        started = time.perf_counter()
                         try:
                             # Create buttons if template has them
                             view = await create_discord_buttons(template)
@@ -352,6 +1887,7 @@ async def main_bot_loop():
                                 await user.send(processed_message, view=view)
                             else:
                                 await user.send(processed_message)
+                            record_dm_send('template', 'sent', started)
                             
                             # Log successful message
                             await log_activity("message_sent", 
@@ -361,38 +1897,436 @@ async def main_bot_loop():
                                              role_targeted=target_roles[0] if target_roles else "unknown", 
                                              success=True)
                             
-                            print(f"✅ Sent message to {user.display_name}")
+                            log.debug("✅ Sent message to %s", user.display_name, extra=dm_log_fields('template', 'sent', user))
                             
                         except discord.Forbidden:
                             # User has DMs disabled
+                            record_dm_send('template', 'dm_disabled', started)
                             await log_activity("error",
                                              affiliate_email="system@bot.com",
                                              user_id=str(user.id),
                                              success=False,
                                              error_message="User has DMs disabled")
-                            print(f"❌ User {user.display_name} has DMs disabled")
+                            log.debug("❌ User %s has DMs disabled", user.display_name, extra=dm_log_fields('template', 'dm_disabled', user))
                             
                         except Exception as e:
                             # Log failed message  
+                            record_dm_send('template', 'error', started)
                             await log_activity("error",
                                              affiliate_email="system@bot.com",
                                              user_id=str(user.id),
                                              success=False,
                                              error_message=str(e))
-                            print(f"❌ Error sending to {user.display_name}: {e}")
+                            log.warning("❌ Error sending to %s: %s", user.display_name, e, extra=dm_log_fields('template', 'error', user, error=str(e)))
                         
                         # Rate limiting - wait between messages
                         await asyncio.sleep(1)
                         
         except Exception as e:
-            print(f"❌ Error in main loop: {e}")
+            log.error(f"❌ Error in main loop: {e}", extra={"category": "templates"})
             await log_activity("error", success=False, error_message=str(e))
             
-        await asyncio.sleep(300)  # Wait 5 minutes before next cycle
+        await supervisor.sleep(300)  # Wait 5 minutes before next cycle
+
+# Shards and the dashboard guild
+def shard_for_guild(guild_id):
+    """Shard that receives a guild's events (Discord's sharding formula)"""
+    return (guild_id >> 22) % int(SHARD_COUNT)
+
+def cluster_shard_ids(cluster_id):
+    return list(range(cluster_id, int(SHARD_COUNT), SHARD_CLUSTERS))
+
+def dashboard_cluster():
+    """Cluster whose process owns the dashboard guild"""
+    if SHARD_CLUSTERS <= 1 or DASHBOARD_GUILD_ID is None:
+        return 0
+    return shard_for_guild(DASHBOARD_GUILD_ID) % SHARD_CLUSTERS
+
+def owns_dashboard_guild():
+    return SHARD_CLUSTERS <= 1 or CLUSTER_ID == dashboard_cluster()
+
+def ipc_socket_path():
+    """Socket this process serves (gateway) or talks to (dashboard)"""
+    if SHARD_CLUSTERS <= 1:
+        return IPC_SOCKET
+    if BOT_MODE == 'dashboard':
+        return f"{IPC_SOCKET}.{dashboard_cluster()}"
+    return f"{IPC_SOCKET}.{CLUSTER_ID}"
+
+def dashboard_guild():
+    """The guild the dashboard manages, if this process has it"""
+    if DASHBOARD_GUILD_ID is not None:
+        return bot.get_guild(DASHBOARD_GUILD_ID)
+    return bot.guilds[0] if bot.guilds else None
+
+# Compact member index
+class CompactMember:
+    """Just enough of a member to target and DM it"""
+    __slots__ = ('id', 'name', 'role_ids')
+    
+    def __init__(self, member_id, name, role_ids):
+        self.id = member_id
+        self.name = name
+        self.role_ids = array('Q', role_ids)  # 8 bytes per role instead of an int object each
+    
+    @property
+    def display_name(self):
+        return self.name
+    
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+    
+    async def create_dm(self):
+        return await bot.create_dm(self)
+    
+    async def send(self, *args, **kwargs):
+        return await (await self.create_dm()).send(*args, **kwargs)
+
+class MemberIndex:
+    """guild id -> {member id -> CompactMember}, kept current from raw gateway events"""
+    
+    def __init__(self):
+        self.guilds = {}
+    
+    def load(self, guild, members):
+        self.guilds[guild.id] = {
+            member.id: CompactMember(member.id, member.display_name, [role.id for role in member.roles if role.id != guild.id])
+            for member in members
+        }
+    
+    def update(self, guild_id, member_id, name, role_ids):
+        """Store a member's current roles; returns the role ids it had before (None if unknown)"""
+        members = self.guilds.get(guild_id)
+        if members is None:
+            return None
+        previous = members.get(member_id)
+        members[member_id] = CompactMember(member_id, name, role_ids)
+        return list(previous.role_ids) if previous else None
+    
+    def remove(self, guild_id, member_id):
+        members = self.guilds.get(guild_id)
+        if members is not None:
+            members.pop(member_id, None)
+    
+    def memory_bytes(self, guild_id):
+        """Approximate heap held for one guild's index"""
+        members = self.guilds.get(guild_id, {})
+        total = sys.getsizeof(members)
+        for member_id, member in members.items():
+            total += sys.getsizeof(member_id) + sys.getsizeof(member) + sys.getsizeof(member.name) + sys.getsizeof(member.role_ids)
+        return total
+
+member_index = MemberIndex()
+_chunk_locks = {}
+
+def raw_member_name(data):
+    user = data['user']
+    return data.get('nick') or user.get('global_name') or user['username']
+
+async def guild_member_index(guild):
+    """Compact members of `guild`, chunking it from the gateway on first use"""
+    if guild.id not in member_index.guilds:
+        lock = _chunk_locks.setdefault(guild.id, asyncio.Lock())
+        async with lock:
+            if guild.id not in member_index.guilds:
+                started = time.time()
+                members = await guild.chunk(cache=False)
+                member_index.load(guild, members)
+                del members
+                size_mb = member_index.memory_bytes(guild.id) / (1024 * 1024)
+                print(f"📇 Indexed {len(member_index.guilds[guild.id])} members of {guild.name} in {time.time() - started:.1f}s (~{size_mb:.1f} MB)")
+    return member_index.guilds[guild.id]
+
+async def index_member_guilds():
+    """Chunk every guild into the compact index; until a guild is indexed its role changes are not seen"""
+    while True:
+        guilds = [guild for guild in bot.guilds if guild.id not in member_index.guilds]
+        if not guilds:
+            return
+        for guild in guilds:
+            await guild_member_index(guild)
+
+async def role_members(guild, role):
+    """Members holding `role`, from discord.py's cache or the compact index"""
+    if MEMBER_CACHE != 'compact':
+        return role.members
+    members = await guild_member_index(guild)
+    return [member for member in members.values() if role.id in member.role_ids]
+
+async def find_member(guild, user_id):
+    if MEMBER_CACHE != 'compact':
+        return guild.get_member(user_id)
+    return (await guild_member_index(guild)).get(user_id)
+
+async def fetch_guild_member(guild, user_id):
+    """A full Member for role changes; fetched over HTTP when members are not cached"""
+    member = guild.get_member(user_id)
+    if member is None and MEMBER_CACHE == 'compact':
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return None
+    return member
+
+def install_member_index_hooks():
+    """Feed raw member updates into the index; discord.py drops them when members aren't cached"""
+    parsers = bot._connection.parsers
+    parse_member_update = parsers['GUILD_MEMBER_UPDATE']
+    
+    def parse_guild_member_update(data):
+        guild_id = int(data['guild_id'])
+        member_id = int(data['user']['id'])
+        role_ids = [int(role_id) for role_id in data.get('roles', [])]
+        previous = member_index.update(guild_id, member_id, raw_member_name(data), role_ids)
+        if previous is not None:
+            added = [role_id for role_id in role_ids if role_id not in previous]
+            if added:
+                bot.dispatch('member_roles_added', guild_id, member_id, added)
+        parse_member_update(data)
+    
+    parsers['GUILD_MEMBER_UPDATE'] = parse_guild_member_update
+
+if MEMBER_CACHE == 'compact':
+    install_member_index_hooks()
+    
+    @bot.listen('on_member_join')
+    async def index_member_join(member):
+        member_index.update(member.guild.id, member.id, member.display_name, [role.id for role in member.roles if role.id != member.guild.id])
+    
+    @bot.listen('on_guild_join')
+    async def index_joined_guild(guild):
+        supervisor.start("member_index", index_member_guilds)
+    
+    @bot.listen('on_raw_member_remove')
+    async def index_member_remove(payload):
+        member_index.remove(payload.guild_id, payload.user.id)
+    
+    @bot.listen('on_member_roles_added')
+    async def compact_role_dms(guild_id, member_id, role_ids):
+        guild = bot.get_guild(guild_id)
+        member = member_index.guilds.get(guild_id, {}).get(member_id)
+        if guild and member:
+            with span("on_member_update", **{"member.id": str(member_id), "roles.added": len(role_ids)}):
+                for role in filter(None, (guild.get_role(role_id) for role_id in role_ids)):
+                    role_dm_queue.put(member, role)
+
+# Gateway recorder
+# Each line is [unix time, event, raw payload]. The first time a guild shows up
+# its roles and channels are written as a {"guild": ...} line so a replay can
+# rebuild it; a {"recording": ...} line marks each process that appended.
+class GatewayRecorder:
+    """Appends raw gateway dispatches to a compact file for tools/replay.py"""
+    
+    def __init__(self, path, events):
+        self.path = path
+        self.events = events
+        self.file = None
+        self.guilds = set()
+        self.last_flush = 0
+    
+    def install(self):
+        parsers = bot._connection.parsers
+        for event in self.events:
+            if event in parsers:
+                parsers[event] = self.wrap(event, parsers[event])
+        print(f"🎙️ Recording {', '.join(sorted(self.events))} to {self.path}")
+    
+    def wrap(self, event, parse):
+        def record_and_parse(data):
+            # Serialized before parsing: discord.py's parsers may modify the payload
+            try:
+                self.record(event, data)
+            except Exception as e:
+                print(f"⚠️ Gateway recorder error: {e}")
+            parse(data)
+        return record_and_parse
+    
+    def write(self, line):
+        self.file.write(json.dumps(line, separators=(',', ':')) + '\n')
+    
+    def record(self, event, data):
+        if self.file is None:
+            if self.path.endswith('.gz'):
+                self.file = gzip.open(self.path, 'at', encoding='utf-8', compresslevel=6)
+            else:
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.write({"recording": {"started": round(time.time(), 3), "bot_user_id": str(bot.user.id) if bot.user else None, "events": sorted(self.events)}})
+        guild_id = data.get('guild_id')
+        if guild_id and guild_id not in self.guilds:
+            guild = bot.get_guild(int(guild_id))
+            if guild is not None:
+                self.guilds.add(guild_id)
+                self.write({"guild": {
+                    "id": str(guild.id),
+                    "name": guild.name,
+                    "roles": [[str(role.id), role.name, role.position] for role in guild.roles if not role.is_default()],
+                    "channels": [[str(channel.id), channel.name, channel.type.value] for channel in guild.channels if hasattr(channel, 'send')]
+                }})
+        now = time.time()
+        self.write([round(now, 3), event, data])
+        if now - self.last_flush >= 1:
+            self.file.flush()
+            self.last_flush = now
+    
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+gateway_recorder = None
+if GATEWAY_RECORD_FILE and BOT_MODE != 'dashboard':
+    gateway_recorder = GatewayRecorder(GATEWAY_RECORD_FILE, GATEWAY_RECORD_EVENTS)
+    gateway_recorder.install()
+
+# Guild metadata snapshot
+# Roles, channels and emojis are serialized once on the bot loop whenever the
+# gateway reports a change, then published by rebinding `guild_snapshot`.
+# Flask threads only ever read the current snapshot object and never walk
+# discord.py's live cache.
+SnapshotEntry = namedtuple('SnapshotEntry', ['body', 'etag'])
+
+def snapshot_entry(payload):
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return SnapshotEntry(body, hashlib.sha256(body).hexdigest()[:32])
+
+def build_guild_snapshot():
+    """Serialize the first guild's roles, channels and emojis into immutable response bodies"""
+    guild = dashboard_guild()
+    if guild is None:
+        payloads = {
+            "roles": [],
+            "channels": [],
+            "emojis": [],
+            "server_emojis": {"success": False, "error": "Bot is not connected to any servers"}
+        }
+    else:
+        emojis = [{
+            "id": str(emoji.id),
+            "name": emoji.name,
+            "animated": emoji.animated,
+            "url": str(emoji.url),
+            "display": f"<{'a' if emoji.animated else ''}:{emoji.name}:{emoji.id}>"
+        } for emoji in guild.emojis]
+        payloads = {
+            "roles": [{"id": str(role.id), "name": role.name, "color": str(role.color)} for role in guild.roles if not role.managed and role.name != "@everyone"],
+            "channels": [{"id": str(channel.id), "name": channel.name, "type": str(channel.type)} for channel in guild.channels if hasattr(channel, 'send')],
+            "emojis": [{"id": emoji["id"], "name": emoji["name"], "url": emoji["url"]} for emoji in emojis],
+            "server_emojis": {"success": True, "emojis": emojis, "count": len(emojis)}
+        }
+    return {key: snapshot_entry(payload) for key, payload in payloads.items()}
+
+guild_snapshot = build_guild_snapshot()
+_snapshot_refresh_pending = False
+
+def publish_guild_snapshot():
+    global guild_snapshot, _snapshot_refresh_pending
+    _snapshot_refresh_pending = False
+    try:
+        guild_snapshot = build_guild_snapshot()
+        notify_change("guild")
+    except Exception as e:
+        print(f"❌ Error building guild snapshot: {e}")
+
+def schedule_guild_snapshot():
+    """Rebuild the snapshot shortly, coalescing bursts of gateway events into one rebuild"""
+    global _snapshot_refresh_pending
+    if not _snapshot_refresh_pending:
+        _snapshot_refresh_pending = True
+        asyncio.get_event_loop().call_later(0.5, publish_guild_snapshot)
+
+# Background services
+class TaskSupervisor:
+    """Runs each background service exactly once, restarting it with backoff if it crashes"""
+    
+    def __init__(self):
+        self.services = {}
+        self.stopping = False
+        self._stop_event = None
+    
+    def _event(self):
+        if self._stop_event is None:
+            self._stop_event = asyncio.Event()
+        return self._stop_event
+    
+    def start(self, name, factory):
+        """Start `factory()` as service `name` unless it is already running"""
+        service = self.services.get(name)
+        if self.stopping or (service and not service["task"].done()):
+            return False
+        service = {"state": "starting", "restarts": 0, "last_error": None, "started_at": None, "task": None}
+        self.services[name] = service
+        service["task"] = asyncio.get_event_loop().create_task(self._run(name, factory))
+        print(f"✅ Service {name} started")
+        return True
+    
+    async def _run(self, name, factory):
+        service = self.services[name]
+        delay = 1
+        while not self.stopping:
+            service["state"] = "running"
+            service["started_at"] = time.time()
+            try:
+                await factory()
+                break
+            except asyncio.CancelledError:
+                service["state"] = "stopped"
+                raise
+            except Exception as e:
+                service["restarts"] += 1
+                service["last_error"] = f"{type(e).__name__}: {e}"
+                if time.time() - service["started_at"] > 60:
+                    delay = 1  # It ran for a while, so this is not a crash loop
+                service["state"] = "backoff"
+                print(f"❌ Service {name} crashed: {e}; restarting in {delay}s")
+                await self.sleep(delay)
+                delay = min(delay * 2, 300)
+        service["state"] = "stopped"
+    
+    async def sleep(self, seconds):
+        """Sleep that ends early once shutdown starts"""
+        try:
+            await asyncio.wait_for(self._event().wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+    
+    def health(self):
+        now = time.time()
+        return {name: {
+            "state": service["state"],
+            "restarts": service["restarts"],
+            "last_error": service["last_error"],
+            "uptime": int(now - service["started_at"]) if service["state"] == "running" else None
+        } for name, service in self.services.items()}
+    
+    async def stop(self, timeout=30):
+        """Let services finish their current work, cancelling any still running after `timeout`"""
+        self.stopping = True
+        self._event().set()
+        tasks = [service["task"] for service in self.services.values() if not service["task"].done()]
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        print(f"🛑 Stopped {len(tasks)} services ({len(pending)} cancelled)")
+
+supervisor = TaskSupervisor()
 
 # Bot Events
+@bot.event
+async def setup_hook():
+    global ipc_server
+    startup_phase("login")
+    if BOT_MODE in ('gateway', 'split'):
+        ipc_server = await start_ipc_server()
+
 @bot.event
 async def on_ready():
+    first_ready = "gateway" not in startup_timings
+    if first_ready:
+        startup_phase("gateway")
     print(f"✅ Logged in as {bot.user}")
     print(f"📊 Bot is in {len(bot.guilds)} server(s)")
     for guild in bot.guilds:
@@ -403,146 +2337,239 @@ async def on_ready():
     bot_status["guilds"] = [{"id": g.id, "name": g.name, "member_count": g.member_count} for g in bot.guilds]
     bot_status["commands"] = [cmd.name for cmd in bot.commands]
     bot_status["last_sync"] = int(time.time())
+    bot_status["user"] = str(bot.user)
+    bot_status["shards"] = sorted(bot.shards) if isinstance(bot, commands.AutoShardedBot) else None
     
-    # Log startup to web dashboard
-    await log_activity("startup", success=True)
-    await update_bot_status("active", "Bot started successfully")
-    
+    # on_ready fires again after every reconnect; the supervisor only starts services that aren't running
     # Start main bot loop for web dashboard integration
-    asyncio.create_task(main_bot_loop())
+    supervisor.start("main_bot_loop", main_bot_loop)
     
-    print(f"✅ Synced {len(bot.commands)} commands to {bot.guilds[0].name if bot.guilds else 'No servers'}")
+    print(f"✅ Synced {len(bot.commands)} commands to {dashboard_guild().name if dashboard_guild() else 'No servers'}")
     print(f"✅ Global sync: {len(bot.commands)} commands")
     print(f"📋 Available commands: {[cmd.name for cmd in bot.commands]}")
     
     # Start the operation queue handler
-    asyncio.create_task(handle_operation_queue())
-    print("✅ Operation queue handler started")
+    supervisor.start("operation_queue", handle_operation_queue)
+    supervisor.start("event_loop_monitor", monitor_event_loop)
+    for worker in range(ROLE_DM_WORKERS):
+        supervisor.start(f"role_dms_{worker + 1}", role_dm_queue.worker)
+    if MEMBER_CACHE == 'compact':
+        # Role DMs are detected from the index, so build it now rather than on the first campaign
+        supervisor.start("member_index", index_member_guilds)
+    
+    # Start marketing campaign handler; with shard clusters the dashboard guild's cluster sends every campaign,
+    # gathering the other clusters' targets over IPC
+    if owns_dashboard_guild():
+        supervisor.start("marketing_campaigns", handle_marketing_campaigns)
+    
+    if first_ready:
+        # Non-essential warm-up waits until the gateway is serving; database housekeeping runs in one process only
+        if BOT_MODE in ('gateway', 'split') and CLUSTER_ID in (None, 0):
+            start_database_jobs()
+        if not MEDIA_PUBLIC_URL and not MEDIA_CHANNEL_ID and get_media_ref("server_logo"):
+            log.warning("⚠️ Neither MEDIA_PUBLIC_URL nor MEDIA_CHANNEL_ID is set; the server logo is attached to every DM instead")
+        startup_phase("services")
+        total = sum(startup_timings.values())
+        print(f"⏱️ Ready in {total:.2f}s: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_timings.items()))
+        bot_status["startup"] = dict(startup_timings, total=round(total, 3))
     
-    # Start marketing campaign handler
-    asyncio.create_task(handle_marketing_campaigns())
-    print("✅ Marketing campaign handler started")
+    publish_guild_snapshot()
+    notify_change("status", **bot_status)
+    
+    # Log startup to web dashboard
+    await log_activity("startup", success=True, startup_timings=bot_status.get("startup"))
+    await update_bot_status("active", "Bot started successfully")
+
+@bot.listen('on_guild_join')
+@bot.listen('on_guild_remove')
+@bot.listen('on_guild_update')
+@bot.listen('on_guild_role_create')
+@bot.listen('on_guild_role_delete')
+@bot.listen('on_guild_role_update')
+@bot.listen('on_guild_channel_create')
+@bot.listen('on_guild_channel_delete')
+@bot.listen('on_guild_channel_update')
+@bot.listen('on_guild_emojis_update')
+async def on_guild_metadata_change(*args):
+    schedule_guild_snapshot()
 
 @bot.event
 async def on_member_update(before, after):
     if before.roles != after.roles:
         new_roles = [role for role in after.roles if role not in before.roles]
-        print(f"🔍 Member update detected for {after.name}: {len(new_roles)} new roles")
-        
-        # Check for role DMs
-        for role in new_roles:
-            conn = sqlite3.connect('marketing_bot.db')
-            cursor = conn.cursor()
-            # Check by both role_id (numeric ID) and role_name (for backward compatibility)
-            cursor.execute('SELECT * FROM role_dms WHERE role_id = ? OR role_name = ?', (str(role.id), role.name))
-            role_dm = cursor.fetchone()
+        if new_roles:
+            with span("on_member_update", **{"member.id": str(after.id), "roles.added": len(new_roles)}):
+                for role in new_roles:
+                    role_dm_queue.put(after, role)
+
+class RoleDMQueue:
+    """Role DMs waiting for delivery, deduplicated per (member, role) and paced across the workers"""
+    
+    def __init__(self, maxsize, dedup_seconds, rate):
+        self.maxsize = maxsize
+        self.dedup_seconds = dedup_seconds
+        self.interval = 1 / rate if rate > 0 else 0
+        self.queue = None
+        self.recent = OrderedDict()  # (member id, role id) -> when it was queued, oldest first
+        self.active = 0
+        self.next_send = 0
+    
+    def _queue(self):
+        # Created on first use so it belongs to the bot's event loop
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.maxsize)
+        return self.queue
+    
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+    
+    def pending(self):
+        """Queued plus in-delivery role DMs"""
+        return self.depth() + self.active
+    
+    def put(self, member, role):
+        """Queue a role DM from an event handler; returns at once"""
+        now = time.monotonic()
+        while self.recent and next(iter(self.recent.values())) < now - self.dedup_seconds:
+            self.recent.popitem(last=False)
+        key = (member.id, role.id)
+        if key in self.recent:
+            metrics.inc('role_dm_skipped_total', reason='duplicate')
+            return False
+        try:
+            self._queue().put_nowait((member, role, now, current_traceparent()))
+        except asyncio.QueueFull:
+            metrics.inc('role_dm_skipped_total', reason='queue_full')
+            log.warning(f"⚠️ Role DM queue is full; dropped the {role.name} DM for {member.name}", extra={"category": "role_dm"})
+            return False
+        self.recent[key] = now
+        return True
+    
+    async def pace(self):
+        """Wait for this worker's turn to send, keeping all workers within ROLE_DM_RATE"""
+        now = time.monotonic()
+        send_at = max(now, self.next_send)
+        self.next_send = send_at + self.interval
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+    
+    async def worker(self):
+        """Deliver queued role DMs; on shutdown, keep going until the queue is empty"""
+        role_dms_queue = self._queue()
+        while not (supervisor.stopping and role_dms_queue.empty()):
+            try:
+                member, role, queued_at, traceparent = await asyncio.wait_for(role_dms_queue.get(), 1)
+            except asyncio.TimeoutError:
+                continue
+            self.active += 1
+            try:
+                with span("role_dm", traceparent=traceparent, **{"member.id": str(member.id), "role.id": str(role.id)}):
+                    await send_role_dm(member, role, queued_at)
+            except Exception as e:
+                log.error(f"❌ Role DM worker error: {e}", extra={"category": "role_dm"})
+            finally:
+                self.active -= 1
+                role_dms_queue.task_done()
+
+role_dm_queue = RoleDMQueue(ROLE_DM_QUEUE_SIZE, ROLE_DM_DEDUP_SECONDS, ROLE_DM_RATE)
+
+async def send_role_dm(after, role, queued_at=None):
+    """DM a member the message configured for a role they just gained, if there is one"""
+    conn = db_connect()
+    cursor = conn.cursor()
+    # Check by both role_id (numeric ID) and role_name (for backward compatibility)
+    cursor.execute('SELECT * FROM role_dms WHERE role_id = ? OR role_name = ?', (str(role.id), role.name))
+    role_dm = cursor.fetchone()
+    conn.close()
+    
+    if role_dm:
+        await role_dm_queue.pace()
+        if queued_at is not None:
+            metrics.observe('role_dm_queue_wait_seconds', time.monotonic() - queued_at)
+        started = time.perf_counter()
+        try:
+            # Create embed
+            embed = discord.Embed(
+                title=role_dm[3] or f"Welcome to {role.name}!",  # dm_title
+                description=role_dm[4],  # dm_message
+                color=0x8b5cf6
+            )
             
-            if role_dm:
+            logo = await resolve_media("server_logo") if role_dm[10] else None  # include_logo (updated index)
+            if logo:
+                embed.set_thumbnail(url=logo.url)
+            
+            # Add claim button if enabled
+            if role_dm[5]:  # claim_button
+                # Get button style from database
+                button_style = role_dm[8] if len(role_dm) > 8 else 'success'  # button_color
+                button_emoji = role_dm[9] if len(role_dm) > 9 else '🎁'  # button_emoji
+                
+                # Convert color string to ButtonStyle
+                style_map = {
+                    'primary': discord.ButtonStyle.primary,
+                    'secondary': discord.ButtonStyle.secondary,
+                    'success': discord.ButtonStyle.primary,  # Discord doesn't have success, use primary
+                    'danger': discord.ButtonStyle.danger,
+                    'blurple': discord.ButtonStyle.primary
+                }
+                button_style_enum = style_map.get(button_style, discord.ButtonStyle.primary)
+                
                 try:
-                    # Create embed
-                    embed = discord.Embed(
-                        title=role_dm[3] or f"Welcome to {role.name}!",  # dm_title
-                        description=role_dm[4],  # dm_message
-                        color=0x8b5cf6
+                    view = claim_view(
+                        role_dm[6],  # claim_role_id (holds the role name)
+                        label=role_dm[7] or "Claim Rewards",  # button_text
+                        style=button_style_enum,
+                        emoji=button_emoji if button_emoji else None
                     )
-                    
-                    if role_dm[10] and server_logo_url:  # include_logo (updated index)
-                        embed.set_thumbnail(url=server_logo_url)
-                    
-                    # Add claim button if enabled
-                    if role_dm[5]:  # claim_button
-                        view = discord.ui.View()
-                        
-                        # Get button style from database
-                        button_style = role_dm[8] if len(role_dm) > 8 else 'success'  # button_color
-                        button_emoji = role_dm[9] if len(role_dm) > 9 else '🎁'  # button_emoji
-                        
-                        # Convert color string to ButtonStyle
-                        style_map = {
-                            'primary': discord.ButtonStyle.primary,
-                            'secondary': discord.ButtonStyle.secondary,
-                            'success': discord.ButtonStyle.primary,  # Discord doesn't have success, use primary
-                            'danger': discord.ButtonStyle.danger,
-                            'blurple': discord.ButtonStyle.primary
-                        }
-                        button_style_enum = style_map.get(button_style, discord.ButtonStyle.primary)
-                        
-                        try:
-                            # Create claim button with callback
-                            claim_role_name = role_dm[6]  # claim_role_id
-                            
-                            async def role_claim_callback(interaction):
-                                try:
-                                    # Get the user who clicked the button
-                                    user = interaction.user
-                                    
-                                    # Find the guild and role
-                                    claim_role_obj = None
-                                    target_guild = None
-                                    
-                                    for guild in bot.guilds:
-                                        role = discord.utils.get(guild.roles, name=claim_role_name)
-                                        if role:
-                                            claim_role_obj = role
-                                            target_guild = guild
-                                            break
-                                    
-                                    if claim_role_obj and target_guild:
-                                        # Get the member in the guild
-                                        member = target_guild.get_member(user.id)
-                                        if member:
-                                            await member.add_roles(claim_role_obj)
-                                            await interaction.response.send_message(
-                                                f"✅ You've been given the {claim_role_name} role!", 
-                                                ephemeral=True
-                                            )
-                                        else:
-                                            await interaction.response.send_message(
-                                                "❌ You must be in the server to claim this role!", 
-                                                ephemeral=True
-                                            )
-                                    else:
-                                        await interaction.response.send_message(
-                                            f"❌ Role '{claim_role_name}' not found in any server", 
-                                            ephemeral=True
-                                        )
-                                except Exception as e:
-                                    await interaction.response.send_message(
-                                        f"❌ Error: {e}", 
-                                        ephemeral=True
-                                    )
-                            
-                            button = discord.ui.Button(
-                                label=role_dm[7] or "Claim Rewards",  # button_text
-                                style=button_style_enum,
-                                emoji=button_emoji if button_emoji else None
-                            )
-                            button.callback = role_claim_callback
-                            view.add_item(button)
-                            await after.send(embed=embed, view=view)
-                        except Exception as button_error:
-                            print(f"❌ Error creating button: {button_error}")
-                            # Send without button if button creation fails
-                            await after.send(embed=embed)
-                    else:
-                        await after.send(embed=embed)
-                    
-                    print(f"✅ Sent role DM to {after.name} for role {role.name}")
-                except Exception as e:
-                    print(f"❌ Error sending role DM: {e}")
+                    await after.send(embed=embed, view=view, file=logo.file() if logo else None)
+                except Exception as button_error:
+                    log.warning(f"❌ Error creating button: {button_error}", extra={"category": "role_dm"})
+                    # Send without button if button creation fails
+                    await after.send(embed=embed, file=logo.file() if logo else None)
+            else:
+                await after.send(embed=embed, file=logo.file() if logo else None)
             
-            conn.close()
+            record_dm_send('role_dm', 'sent', started)
+            log.debug("✅ Sent role DM to %s for role %s", after.name, role.name, extra=dm_log_fields('role_dm', 'sent', after, role_id=str(role.id)))
+        except discord.Forbidden:
+            record_dm_send('role_dm', 'dm_disabled', started)
+            log.debug("🚫 Cannot send role DM to %s (DMs disabled)", after.name, extra=dm_log_fields('role_dm', 'dm_disabled', after, role_id=str(role.id)))
+        except Exception as e:
+            record_dm_send('role_dm', 'error', started)
+            log.warning("❌ Error sending role DM: %s", e, extra=dm_log_fields('role_dm', 'error', after, role_id=str(role.id), error=str(e)))
 
 # Marketing Campaign Handler
+async def campaign_role_members(role_names):
+    """(id, name) of members holding any of `role_names` in this process's guilds"""
+    members = []
+    for guild in bot.guilds:
+        for role_name in role_names:
+            role = discord.utils.get(guild.roles, name=role_name)
+            if role:
+                members.extend((member.id, member.name) for member in await role_members(guild, role))
+    return members
+
+async def other_cluster_role_members(role_names):
+    """Campaign targets in the guilds of every other shard cluster, fetched over their IPC sockets"""
+    members = []
+    for cluster_id in range(SHARD_CLUSTERS):
+        if cluster_id != CLUSTER_ID:
+            reply = await cluster_call(cluster_id, 'role_members', {"role_names": role_names}, timeout=120)
+            if not reply.get("success"):
+                raise ConnectionError(f"cluster {cluster_id}: {reply.get('error')}")
+            members.extend(CompactMember(int(member_id), name, ()) for member_id, name in reply["members"])
+    return members
+
 async def handle_marketing_campaigns():
     """Handle recurring marketing campaigns"""
-    while True:
+    while not supervisor.stopping:
         try:
             if not bot.is_ready():
-                await asyncio.sleep(10)
+                await supervisor.sleep(10)
                 continue
                 
-            conn = sqlite3.connect('marketing_bot.db')
+            conn = db_connect()
             cursor = conn.cursor()
             
             # Get active campaigns
@@ -561,129 +2588,147 @@ async def handle_marketing_campaigns():
                 claim_role = campaign[9]  # claim_role
                 include_server_logo = campaign[10]  # include_server_logo
                 
-                # Check if it's time to send
-                last_sent_key = f"last_sent_{campaign_id}"
+                # Runs are recorded in campaign_runs and every send in campaign_deliveries,
+                # so a run cut short by a restart resumes with the members it hadn't reached
                 current_time = time.time()
-                last_sent = getattr(handle_marketing_campaigns, last_sent_key, 0)
+                cursor.execute('''
+                    SELECT run_id, started_at, finished_at FROM campaign_runs
+                    WHERE campaign_id = ? ORDER BY run_id DESC LIMIT 1
+                ''', (campaign_id,))
+                last_run = cursor.fetchone()
                 
                 # Handle different campaign types
+                run_id = None
                 should_send = False
-                if interval_minutes == 0:
-                    # One-time campaign: send once and deactivate
-                    if last_sent == 0:  # Never sent before
-                        should_send = True
-                        # Deactivate after sending
-                        cursor.execute('UPDATE marketing_campaigns SET is_active = 0 WHERE campaign_id = ?', (campaign_id,))
-                        conn.commit()
+                if last_run and last_run[2] is None:
+                    # Interrupted run: pick it back up
+                    run_id = last_run[0]
+                elif interval_minutes == 0:
+                    # One-time campaign: send once, deactivated when the run completes
+                    should_send = last_run is None
                 else:
                     # Recurring campaign: send every interval_minutes
-                    if current_time - last_sent >= (interval_minutes * 60):
-                        should_send = True
+                    should_send = last_run is None or current_time - last_run[1] >= (interval_minutes * 60)
                 
                 if should_send:
-                    # Send to all users with the specified roles
-                    for guild in bot.guilds:
-                        for role_name in role_names:
-                            role = discord.utils.get(guild.roles, name=role_name)
-                            if role:
-                                for member in role.members:
-                                    try:
-                                        # Check if user has opted out
-                                        cursor.execute('''
-                                            SELECT * FROM marketing_opt_outs 
-                                            WHERE user_id = ? AND opt_out_type = 'marketing'
-                                        ''', (str(member.id),))
-                                        
-                                        if cursor.fetchone():
-                                            continue  # Skip opted out users
-                                        
-                                        # Create DM channel
-                                        dm_channel = await member.create_dm()
-                                        
-                                        # Create embed
-                                        embed = discord.Embed(
-                                            title="📢 Marketing Update",
-                                            description=message,
-                                            color=0x8b5cf6
-                                        )
-                                        
-                                        if include_server_logo and server_logo_url:
-                                            embed.set_thumbnail(url=server_logo_url)
-                                        
-                                        # Add claim button if enabled
-                                        if claim and claim_role:
-                                            view = discord.ui.View()
-                                            claim_button = discord.ui.Button(
-                                                label="Claim Now",
-                                                style=discord.ButtonStyle.primary,
-                                                emoji="🎁"
-                                            )
-                                            
-                                            async def claim_callback(interaction):
-                                                try:
-                                                    # Get the user who clicked the button
-                                                    user = interaction.user
-                                                    
-                                                    # Find the guild and role
-                                                    claim_role_obj = None
-                                                    target_guild = None
-                                                    
-                                                    for guild in bot.guilds:
-                                                        role = discord.utils.get(guild.roles, name=claim_role)
-                                                        if role:
-                                                            claim_role_obj = role
-                                                            target_guild = guild
-                                                            break
-                                                    
-                                                    if claim_role_obj and target_guild:
-                                                        # Get the member in the guild
-                                                        member = target_guild.get_member(user.id)
-                                                        if member:
-                                                            await member.add_roles(claim_role_obj)
-                                                            await interaction.response.send_message(
-                                                                f"✅ You've been given the {claim_role} role!", 
-                                                                ephemeral=True
-                                                            )
-                                                        else:
-                                                            await interaction.response.send_message(
-                                                                "❌ You must be in the server to claim this role!", 
-                                                                ephemeral=True
-                                                            )
-                                                    else:
-                                                        await interaction.response.send_message(
-                                                            f"❌ Role '{claim_role}' not found in any server", 
-                                                            ephemeral=True
-                                                        )
-                                                except Exception as e:
-                                                    await interaction.response.send_message(
-                                                        f"❌ Error: {e}", 
-                                                        ephemeral=True
-                                                    )
-                                            
-                                            claim_button.callback = claim_callback
-                                            view.add_item(claim_button)
-                                            
-                                            await dm_channel.send(embed=embed, view=view)
-                                        else:
-                                            await dm_channel.send(embed=embed)
-                                        
-                                        print(f"✅ Sent marketing DM to {member.name} for campaign {campaign_id}")
-                                        
-                                    except discord.Forbidden:
-                                        print(f"🚫 Cannot send DM to {member.name} (DMs disabled)")
-                                    except Exception as e:
-                                        print(f"❌ Error sending marketing DM to {member.name}: {e}")
+                    cursor.execute('INSERT INTO campaign_runs (campaign_id, started_at) VALUES (?, ?)', (campaign_id, current_time))
+                    run_id = cursor.lastrowid
+                    conn.commit()
+                
+                if run_id is not None:
+                    cursor.execute('SELECT user_id FROM campaign_deliveries WHERE run_id = ?', (run_id,))
+                    reached = {row[0] for row in cursor.fetchall()}
+                    deliveries = []
+                    logo = await resolve_media("server_logo") if include_server_logo else None
+                    
+                    # Everyone with any of the specified roles, once, minus whoever this run already reached
+                    audience = []
+                    with span("campaign.audience", **{"campaign.id": campaign_id, "campaign.run_id": run_id}) as audience_span:
+                        for guild in bot.guilds:
+                            for role_name in role_names:
+                                role = discord.utils.get(guild.roles, name=role_name)
+                                if role:
+                                    for member in await role_members(guild, role):
+                                        if str(member.id) not in reached:
+                                            reached.add(str(member.id))
+                                            audience.append(member)
+                        if SHARD_CLUSTERS > 1 and CLUSTER_ID is not None:
+                            # Only this cluster runs campaigns, so it also sends to the other clusters' guilds
+                            try:
+                                remote = await other_cluster_role_members(role_names)
+                            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                                # The run stays unfinished and is picked up again on the next pass
+                                log.warning(f"⏸️ Campaign {campaign_id} is waiting for every shard cluster: {e}",
+                                            extra={"category": "campaigns", "fields": {"campaign": campaign_id}})
+                                continue
+                            for member in remote:
+                                if str(member.id) not in reached:
+                                    reached.add(str(member.id))
+                                    audience.append(member)
+                        audience_span.set_attribute("campaign.audience", len(audience))
+                    
+                    interrupted = False
+                    try:
+                        for position, member in enumerate(audience):
+                            if supervisor.stopping:
+                                # Shutting down: checkpoint here and send the rest after the restart
+                                interrupted = True
+                                break
+                        
+                            # Each send is its own trace: opt-out check, create_dm and the send itself
+                            with span("campaign.send", **{"campaign.id": campaign_id, "member.id": str(member.id)}):
+                                started = time.perf_counter()
+                                try:
+                                    # Check if user has opted out
+                                    cursor.execute('''
+                                        SELECT * FROM marketing_opt_outs 
+                                        WHERE user_id = ? AND opt_out_type = 'marketing'
+                                    ''', (str(member.id),))
+                            
+                                    if cursor.fetchone():
+                                        continue  # Skip opted out users
+                            
+                                    # Create DM channel
+                                    dm_channel = await member.create_dm()
+                            
+                                    # Create embed
+                                    embed = discord.Embed(
+                                        title="📢 Marketing Update",
+                                        description=message,
+                                        color=0x8b5cf6
+                                    )
+                            
+                                    if logo:
+                                        embed.set_thumbnail(url=logo.url)
+                            
+                                    # Add claim button if enabled
+                                    if claim and claim_role:
+                                        await dm_channel.send(embed=embed, view=claim_view(claim_role), file=logo.file() if logo else None)
+                                    else:
+                                        await dm_channel.send(embed=embed, file=logo.file() if logo else None)
+                            
+                                    deliveries.append((campaign_id, run_id, str(member.id), 'sent'))
+                                    record_dm_send('campaign', 'sent', started, campaign_id)
+                                    log.debug("✅ Sent marketing DM to %s for campaign %s", member.name, campaign_id, extra=dm_log_fields('campaign', 'sent', member, campaign_id))
+                            
+                                except discord.Forbidden:
+                                    deliveries.append((campaign_id, run_id, str(member.id), 'dm_disabled'))
+                                    record_dm_send('campaign', 'dm_disabled', started, campaign_id)
+                                    log.debug("🚫 Cannot send DM to %s (DMs disabled)", member.name, extra=dm_log_fields('campaign', 'dm_disabled', member, campaign_id))
+                                except Exception as e:
+                                    deliveries.append((campaign_id, run_id, str(member.id), 'error'))
+                                    record_dm_send('campaign', 'error', started, campaign_id)
+                                    log.warning("❌ Error sending marketing DM to %s: %s", member.name, e, extra=dm_log_fields('campaign', 'error', member, campaign_id, error=str(e)))
+
+                        
+                            if len(deliveries) >= CAMPAIGN_CHECKPOINT_EVERY:
+                                cursor.executemany('INSERT INTO campaign_deliveries (campaign_id, run_id, user_id, status) VALUES (?, ?, ?, ?)', deliveries)
+                                conn.commit()
+                                deliveries = []
+                    finally:
+                        # Record who got the rest of this run, also when the loop is cancelled or fails mid-send
+                        cursor.executemany('INSERT INTO campaign_deliveries (campaign_id, run_id, user_id, status) VALUES (?, ?, ?, ?)', deliveries)
+                        conn.commit()
                     
-                    # Update last sent time
-                    setattr(handle_marketing_campaigns, last_sent_key, current_time)
+                    if not interrupted:
+                        cursor.execute('UPDATE campaign_runs SET finished_at = ? WHERE run_id = ?', (time.time(), run_id))
+                        if interval_minutes == 0:
+                            cursor.execute('UPDATE marketing_campaigns SET is_active = 0 WHERE campaign_id = ?', (campaign_id,))
+                            notify_change("campaigns", key=campaign_id, is_active=False)
+                    conn.commit()
+                    
+                    if interrupted:
+                        log.info(f"⏸️ Campaign {campaign_id} checkpointed with {len(audience) - position} members left to reach",
+                                 extra={"category": "campaigns", "fields": {"campaign": campaign_id, "remaining": len(audience) - position}})
+                        break
             
             conn.close()
             
         except Exception as e:
-            print(f"❌ Error in marketing campaign handler: {e}")
+            log.error(f"❌ Error in marketing campaign handler: {e}", extra={"category": "campaigns"})
         
         # Check every minute
-        await asyncio.sleep(60)
+        await supervisor.sleep(60)
 
 # Handle opt-out messages
 @bot.event
@@ -702,7 +2747,7 @@ async def on_message(message):
         if content in opt_out_commands:
             try:
                 # Add user to opt-out list
-                conn = sqlite3.connect('marketing_bot.db')
+                conn = db_connect()
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -712,6 +2757,7 @@ async def on_message(message):
                 
                 conn.commit()
                 conn.close()
+                notify_change("optouts")
                 
                 # Send confirmation message
                 embed = discord.Embed(
@@ -727,10 +2773,10 @@ async def on_message(message):
                 embed.set_footer(text="Thank you for using our service!")
                 
                 await message.channel.send(embed=embed)
-                print(f"✅ User {message.author.name} ({message.author.id}) opted out of marketing messages")
+                log.info(f"✅ User {message.author.name} ({message.author.id}) opted out of marketing messages", extra={"category": "optouts", "fields": {"user_id": str(message.author.id), "action": "opt_out"}})
                 
             except Exception as e:
-                print(f"❌ Error processing opt-out for {message.author.name}: {e}")
+                log.error(f"❌ Error processing opt-out for {message.author.name}: {e}", extra={"category": "optouts", "fields": {"user_id": str(message.author.id)}})
                 await message.channel.send("❌ Sorry, there was an error processing your request. Please try again later.")
         
         # Check for resubscribe commands
@@ -739,7 +2785,7 @@ async def on_message(message):
         if content in resubscribe_commands:
             try:
                 # Remove user from opt-out list
-                conn = sqlite3.connect('marketing_bot.db')
+                conn = db_connect()
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -749,6 +2795,7 @@ async def on_message(message):
                 
                 conn.commit()
                 conn.close()
+                notify_change("optouts")
                 
                 # Send confirmation message
                 embed = discord.Embed(
@@ -764,10 +2811,10 @@ async def on_message(message):
                 embed.set_footer(text="Welcome back!")
                 
                 await message.channel.send(embed=embed)
-                print(f"✅ User {message.author.name} ({message.author.id}) resubscribed to marketing messages")
+                log.info(f"✅ User {message.author.name} ({message.author.id}) resubscribed to marketing messages", extra={"category": "optouts", "fields": {"user_id": str(message.author.id), "action": "resubscribe"}})
                 
             except Exception as e:
-                print(f"❌ Error processing resubscribe for {message.author.name}: {e}")
+                log.error(f"❌ Error processing resubscribe for {message.author.name}: {e}", extra={"category": "optouts", "fields": {"user_id": str(message.author.id)}})
                 await message.channel.send("❌ Sorry, there was an error processing your request. Please try again later.")
     
     # Process other commands
@@ -776,26 +2823,19 @@ async def on_message(message):
 # Operation handler functions for dashboard operations
 async def handle_operation_queue():
     """Handle operations from the dashboard queue"""
-    while True:
+    while not supervisor.stopping:
         try:
             if not operation_queue.empty():
                 operation = operation_queue.get()
                 operation_id = operation.get('id')
                 operation_type = operation.get('type')
+                if operation.get('queued_at'):
+                    metrics.observe('operation_queue_wait_seconds', max(time.time() - operation['queued_at'], 0), type=operation_type)
                 
                 print(f"🔍 Processing operation: {operation_type}")
                 
                 try:
-                    if operation_type == 'quick_dm':
-                        result = await handle_quick_dm_operation(operation)
-                    elif operation_type == 'test_dm_permissions':
-                        result = await handle_test_dm_permissions_operation(operation)
-                    elif operation_type == 'bot_avatar':
-                        result = await handle_bot_avatar_operation(operation)
-                    elif operation_type == 'bot_customize':
-                        result = await handle_bot_customize_operation(operation)
-                    else:
-                        result = {"success": False, "error": f"Unknown operation type: {operation_type}"}
+                    result = await dispatch_operation(operation)
                     
                     # Store result
                     operation_results[operation_id] = result
@@ -812,6 +2852,27 @@ async def handle_operation_queue():
             print(f"❌ Error in operation queue handler: {e}")
             await asyncio.sleep(1)
 
+async def dispatch_operation(operation):
+    """Run a dashboard operation on the bot loop and return its result dict"""
+    operation_type = operation.get('type')
+    started = time.perf_counter()
+    try:
+        # Continues the trace of the dashboard request that queued it, if that one was sampled
+        with span(f"operation {operation_type}", traceparent=operation.get('traceparent'), **{"operation.id": operation.get('id')}):
+            if operation_type == 'quick_dm':
+                return await handle_quick_dm_operation(operation)
+            elif operation_type == 'test_dm_permissions':
+                return await handle_test_dm_permissions_operation(operation)
+            elif operation_type == 'test_simple_dm':
+                return await handle_test_simple_dm_operation(operation)
+            elif operation_type == 'bot_avatar':
+                return await handle_bot_avatar_operation(operation)
+            elif operation_type == 'bot_customize':
+                return await handle_bot_customize_operation(operation)
+            return {"success": False, "error": f"Unknown operation type: {operation_type}"}
+    finally:
+        metrics.observe('operation_seconds', time.perf_counter() - started, type=str(operation_type))
+
 async def handle_quick_dm_operation(operation):
     """Handle Quick DM operation"""
     try:
@@ -821,16 +2882,16 @@ async def handle_quick_dm_operation(operation):
         message = data.get('message', '').strip()
         include_logo = data.get('include_logo', False)
         
-        if not bot.guilds:
+        guild = dashboard_guild()
+        if not guild:
             return {"success": False, "error": "Bot is not connected to any servers"}
         
-        guild = bot.guilds[0]
         role = guild.get_role(role_id)
         
         if not role:
             return {"success": False, "error": "Role not found"}
         
-        members_with_role = [member for member in guild.members if role in member.roles]
+        members_with_role = await role_members(guild, role)
         
         if not members_with_role:
             return {"success": False, "error": f"No members found with the role '{role.name}'"}
@@ -845,11 +2906,12 @@ async def handle_quick_dm_operation(operation):
                 "timestamp": datetime.now().isoformat()
             }
             
-            if include_logo and server_logo_url:
-                embed_data["thumbnail"] = {"url": server_logo_url}
+            logo = await resolve_media("server_logo") if include_logo else None
+            if logo:
+                embed_data["thumbnail"] = {"url": logo.url}
         
         # Check for opt-outs
-        conn = sqlite3.connect('marketing_bot.db')
+        conn = db_connect()
         cursor = conn.cursor()
         cursor.execute('SELECT user_id FROM marketing_opt_outs WHERE opt_out_type = "marketing"')
         opted_out_users = {row[0] for row in cursor.fetchall()}
@@ -866,6 +2928,7 @@ async def handle_quick_dm_operation(operation):
                 skipped_count += 1
                 continue
             
+            started = time.perf_counter()
             try:
                 if embed_data:
                     embed = discord.Embed(
@@ -878,19 +2941,22 @@ async def handle_quick_dm_operation(operation):
                         embed.set_thumbnail(url=embed_data["thumbnail"]["url"])
                     
                     embed.timestamp = datetime.now()
-                    await member.send(embed=embed)
+                    await member.send(embed=embed, file=logo.file() if logo else None)
                 else:
                     await member.send(message)
                 
                 success_count += 1
-                print(f"✅ Sent DM to {member.name}")
+                record_dm_send('quick_dm', 'sent', started)
+                log.debug("✅ Sent DM to %s", member.name, extra=dm_log_fields('quick_dm', 'sent', member))
                 
             except discord.Forbidden:
                 dm_disabled_count += 1
-                print(f"⏭️ Skipped {member.name} - DMs disabled")
+                record_dm_send('quick_dm', 'dm_disabled', started)
+                log.debug("⏭️ Skipped %s - DMs disabled", member.name, extra=dm_log_fields('quick_dm', 'dm_disabled', member))
             except Exception as e:
                 error_count += 1
-                print(f"❌ Error sending DM to {member.name}: {e}")
+                record_dm_send('quick_dm', 'error', started)
+                log.warning("❌ Error sending DM to %s: %s", member.name, e, extra=dm_log_fields('quick_dm', 'error', member, error=str(e)))
         
         return {
             "success": True,
@@ -912,16 +2978,16 @@ async def handle_test_dm_permissions_operation(operation):
         data = operation.get('data', {})
         role_id = int(data.get('role_id'))
         
-        if not bot.guilds:
+        guild = dashboard_guild()
+        if not guild:
             return {"success": False, "error": "Bot is not connected to any servers"}
         
-        guild = bot.guilds[0]
         role = guild.get_role(role_id)
         
         if not role:
             return {"success": False, "error": "Role not found"}
         
-        members_with_role = [member for member in guild.members if role in member.roles]
+        members_with_role = await role_members(guild, role)
         
         if not members_with_role:
             return {"success": False, "error": f"No members found with the role '{role.name}'"}
@@ -970,11 +3036,14 @@ async def handle_bot_avatar_operation(operation):
     """Handle Bot Avatar operation"""
     try:
         data = operation.get('data', {})
-        avatar_data = data.get('avatar_data')
+        avatar_sha256 = data.get('avatar_sha256')
         
-        if not avatar_data:
+        if not avatar_sha256:
             return {"success": False, "error": "No avatar data provided"}
         
+        # Only the hash crosses the queue; the bytes come straight from the media store
+        avatar_data = await asyncio.get_event_loop().run_in_executor(None, read_media, avatar_sha256)
+        
         if bot.user:
             await bot.user.edit(avatar=avatar_data)
             return {"success": True, "message": "Bot avatar updated successfully!"}
@@ -1032,6 +3101,256 @@ async def handle_bot_customize_operation(operation):
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+async def handle_test_simple_dm_operation(operation):
+    """Handle the simple test DM operation"""
+    try:
+        user_id = int(operation.get('data', {}).get('user_id'))
+        
+        guild = dashboard_guild()
+        if not guild:
+            return {"success": False, "error": "Bot is not connected to any servers"}
+        
+        member = await find_member(guild, user_id)
+        if not member:
+            return {"success": False, "error": "User not found in server"}
+        
+        try:
+            print(f"🔍 Sending test message to {member.name}...")
+            dm_channel = await member.create_dm()
+            await dm_channel.send("🧪 Test DM from bot - this is a test message")
+            print(f"✅ Test message sent successfully to {member.name}")
+            return {"success": True, "message": "Test DM sent successfully"}
+        except discord.Forbidden as e:
+            print(f"🚫 DMs disabled for {member.name}: {e}")
+            return {"success": False, "error": "Test DM failed"}
+        
+    except Exception as e:
+        return {"success": False, "error": f"Test DM exception: {e}"}
+
+# Gateway <-> dashboard IPC
+# In split mode the gateway process listens on a Unix socket. Each request is one
+# JSON line answered by one JSON line; 'subscribe' instead keeps the connection
+# open and streams the gateway's change feed, status and guild snapshot to a
+# dashboard worker, which mirrors them locally so requests never wait on the bot.
+gateway_connected = False
+ipc_server = None
+_ipc_subscribers = set()
+
+def snapshot_payload(snapshot):
+    return {key: {"body": entry.body.decode('utf-8'), "etag": entry.etag} for key, entry in snapshot.items()}
+
+def ipc_connect(timeout):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(ipc_socket_path())
+    return sock
+
+def ipc_call(method, params=None, timeout=30):
+    """Send one request to the gateway process and wait for its reply"""
+    sock = ipc_connect(timeout)
+    try:
+        sock.sendall(json.dumps({"method": method, "params": params}, default=str).encode('utf-8') + b'\n')
+        line = sock.makefile('rb').readline()
+        if not line:
+            raise ConnectionError("Gateway closed the connection")
+        return json.loads(line)
+    finally:
+        sock.close()
+
+async def cluster_call(cluster_id, method, params=None, timeout=30):
+    """Send one request to another shard cluster's gateway process and wait for its reply"""
+    reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(f"{IPC_SOCKET}.{cluster_id}"), timeout)
+    try:
+        writer.write(json.dumps({"method": method, "params": params}, default=str).encode('utf-8') + b'\n')
+        await writer.drain()
+        # One line, then the gateway closes; read() avoids readline's 64 KiB limit on large replies
+        data = await asyncio.wait_for(reader.read(), timeout)
+        if not data:
+            raise ConnectionError("Cluster closed the connection")
+        return json.loads(data)
+    finally:
+        writer.close()
+
+def _ipc_broadcast(line):
+    for writer in list(_ipc_subscribers):
+        # A worker that stops reading is dropped; it reconnects and resyncs
+        if writer.transport.get_write_buffer_size() > 1024 * 1024:
+            _ipc_subscribers.discard(writer)
+            writer.close()
+            continue
+        writer.write(line)
+
+def _ipc_change_listener(loop):
+    def listener(version, topic, data):
+        event = {"version": version, "topic": topic, "data": data}
+        if topic == "guild":
+            event["snapshot"] = snapshot_payload(guild_snapshot)
+        line = json.dumps(event, default=str).encode('utf-8') + b'\n'
+        loop.call_soon_threadsafe(_ipc_broadcast, line)
+    return listener
+
+async def handle_ipc_client(reader, writer):
+    """Serve one dashboard connection"""
+    try:
+        request_line = await reader.readline()
+        if not request_line:
+            return
+        message = json.loads(request_line)
+        method = message.get('method')
+        params = message.get('params') or {}
+        
+        if method == 'subscribe':
+            hello = {
+                "version": change_feed.version,
+                "status": bot_status,
+                "snapshot": snapshot_payload(guild_snapshot)
+            }
+            writer.write(json.dumps(hello, default=str).encode('utf-8') + b'\n')
+            _ipc_subscribers.add(writer)
+            try:
+                await reader.read()  # Returns at EOF, when the worker goes away
+            finally:
+                _ipc_subscribers.discard(writer)
+            return
+        
+        if method in ('operation', 'queue') and supervisor.stopping:
+            result = {"success": False, "error": "Bot is shutting down"}
+        elif method == 'operation':
+            result = await dispatch_operation(params)
+        elif method == 'queue':
+            operation_queue.put(params)
+            result = {"success": True}
+        elif method == 'publish':
+            notify_change(params.get('topic'), **(params.get('data') or {}))
+            result = {"success": True}
+        elif method == 'health':
+            result = {"gateway": gateway_info(), "services": supervisor.health()}
+        elif method == 'role_members':
+            # The campaign cluster asks every other cluster for targets in the guilds it owns
+            if bot.is_ready():
+                result = {"success": True, "members": await campaign_role_members(params.get('role_names') or [])}
+            else:
+                result = {"success": False, "error": "Cluster is not ready"}
+        elif method == 'metrics':
+            result = {"success": True, "text": metrics.render()}
+        elif method == 'profile':
+            # Sampled from a worker thread so the loop being profiled keeps running
+            try:
+                profile = await asyncio.get_running_loop().run_in_executor(None, run_profile, float(params.get('seconds', 10)), 'gateway;')
+                result = {"success": True, **profile}
+            except RuntimeError as e:
+                result = {"success": False, "error": str(e)}
+        elif method == 'memory':
+            # gc and tracemalloc walks take a while on a big heap; keep them off the loop
+            report = await asyncio.get_running_loop().run_in_executor(None, memory_action, params.get('action', 'report'), params)
+            result = {"success": True, **report}
+        else:
+            result = {"success": False, "error": f"Unknown IPC method: {method}"}
+        
+        writer.write(json.dumps(result, default=str).encode('utf-8') + b'\n')
+        await writer.drain()
+    except Exception as e:
+        print(f"❌ IPC error: {e}")
+    finally:
+        writer.close()
+
+async def start_ipc_server():
+    """Listen for dashboard processes on this gateway's IPC socket"""
+    path = ipc_socket_path()
+    if os.path.exists(path):
+        os.unlink(path)  # Left behind by a previous run
+    server = await asyncio.start_unix_server(handle_ipc_client, path=path)
+    os.chmod(path, 0o600)
+    change_feed.add_listener(_ipc_change_listener(asyncio.get_running_loop()))
+    print(f"✅ IPC server listening on {path}")
+    return server
+
+def apply_gateway_event(event):
+    """Mirror one gateway event into this dashboard worker"""
+    global bot_status, guild_snapshot
+    if "snapshot" in event:
+        guild_snapshot = {key: SnapshotEntry(entry["body"].encode('utf-8'), entry["etag"]) for key, entry in event["snapshot"].items()}
+    if event.get("topic") == "status" and event.get("data"):
+        bot_status = event["data"]
+    change_feed.publish(event["topic"], event.get("data"), version=event["version"])
+
+def follow_gateway():
+    """Keep this dashboard worker subscribed to the gateway, reconnecting with backoff"""
+    global bot_status, gateway_connected
+    delay = 1
+    while True:
+        sock = None
+        try:
+            sock = ipc_connect(timeout=10)
+            sock.sendall(b'{"method": "subscribe"}\n')
+            stream = sock.makefile('rb')
+            hello = json.loads(stream.readline())
+            sock.settimeout(None)
+            bot_status = hello["status"]
+            # Anything this worker missed while disconnected is covered by a resync
+            apply_gateway_event({"version": hello["version"], "topic": "resync", "data": None, "snapshot": hello["snapshot"]})
+            if not gateway_connected:
+                print("✅ Connected to gateway process")
+            gateway_connected = True
+            delay = 1
+            for line in stream:
+                apply_gateway_event(json.loads(line))
+        except (OSError, ValueError) as e:
+            if gateway_connected or delay == 1:
+                print(f"⚠️ Gateway process not reachable: {e}")
+        finally:
+            gateway_connected = False
+            if sock:
+                sock.close()
+        time.sleep(delay)
+        delay = min(delay * 2, 30)
+
+def gateway_info():
+    """Readiness and identity of the bot, whether it runs in this process or not"""
+    if BOT_MODE == 'dashboard':
+        return {
+            "ready": gateway_connected and bool(bot_status.get("running")),
+            "user": bot_status.get("user"),
+            "guilds": len(bot_status.get("guilds") or []),
+            "commands": len(bot_status.get("commands") or [])
+        }
+    return {
+        "ready": bot.is_ready(),
+        "user": str(bot.user) if bot.user else None,
+        "guilds": len(bot.guilds),
+        "commands": len(bot.commands)
+    }
+
+def queue_operation(operation_type, data):
+    """Hand an operation to the bot without waiting for it"""
+    operation = {'id': str(uuid.uuid4()), 'type': operation_type, 'data': data, 'queued_at': time.time(), 'traceparent': current_traceparent()}
+    if BOT_MODE == 'dashboard':
+        ipc_call('queue', operation, timeout=5)
+    else:
+        operation_queue.put(operation)
+    print(f"🔍 Queued {operation_type} operation: {operation['id']}")
+    return operation['id']
+
+def run_operation(operation_type, data, timeout=30):
+    """Run an operation on the bot and wait up to `timeout` seconds for its result"""
+    if BOT_MODE == 'dashboard':
+        try:
+            operation = {'id': str(uuid.uuid4()), 'type': operation_type, 'data': data, 'traceparent': current_traceparent()}
+            return ipc_call('operation', operation, timeout=timeout)
+        except socket.timeout:
+            return {"success": False, "error": "Operation timeout"}
+        except (OSError, ValueError):
+            return {"success": False, "error": "Bot process is not reachable"}
+    
+    operation_id = queue_operation(operation_type, data)
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        if operation_id in operation_results:
+            return operation_results.pop(operation_id)
+        time.sleep(0.1)
+    
+    return {"success": False, "error": "Operation timeout"}
+
 # Bot Commands
 @bot.command(name='sync')
 async def sync_commands(ctx):
@@ -1045,26 +3364,540 @@ async def sync_commands(ctx):
 async def test_command(ctx):
     await ctx.send("✅ Bot is working!")
 
-@bot.command(name='check')
-async def check_status(ctx):
-    embed = discord.Embed(title="Bot Status", color=0x00ff00)
-    embed.add_field(name="Servers", value=len(bot.guilds), inline=True)
-    embed.add_field(name="Commands", value=len(bot.commands), inline=True)
-    embed.add_field(name="Uptime", value="Online", inline=True)
-    await ctx.send(embed=embed)
+@bot.command(name='check')
+async def check_status(ctx):
+    embed = discord.Embed(title="Bot Status", color=0x00ff00)
+    embed.add_field(name="Servers", value=len(bot.guilds), inline=True)
+    embed.add_field(name="Commands", value=len(bot.commands), inline=True)
+    embed.add_field(name="Uptime", value="Online", inline=True)
+    await ctx.send(embed=embed)
+
+# Worker process pool
+# Image normalization and the insight engine (see workers.py) run here, off the GIL
+# shared with the gateway and Flask threads. There is one pool per process.
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """Get the shared worker process pool, creating it on first use"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            main = sys.modules['__main__']
+            if main is sys.modules[__name__]:
+                # Spawned workers re-run the main module; under `python bot.py` that would
+                # be all of bot.py, so have them run the side-effect-free workers.py instead
+                main.__spec__ = importlib.util.find_spec('workers')
+            # spawn rather than fork: the parent has the gateway and Flask threads running
+            _process_pool = ProcessPoolExecutor(
+                max_workers=WORKER_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+def shutdown_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False)
+            _process_pool = None
+
+# Insight engine
+# Insights are computed in the worker pool from incremental rollups and stored
+# in ai_insights, so /api/analytics/insights only ever reads precomputed rows.
+def start_insight_engine():
+    """Regenerate insights in the worker pool every INSIGHTS_INTERVAL seconds"""
+    def insight_loop():
+        while True:
+            try:
+                future = get_process_pool().submit(compute_insights, os.path.abspath(DATABASE_PATH), os.path.abspath(TRACKING_DIR))
+                count = future.result(timeout=WORKER_TASK_TIMEOUT)
+                print(f"🧠 Generated {count} insights")
+            except FutureTimeoutError:
+                print(f"❌ Insight refresh took longer than {WORKER_TASK_TIMEOUT}s")
+            except Exception as e:
+                print(f"❌ Error generating insights: {e}")
+            time.sleep(INSIGHTS_INTERVAL)
+    
+    threading.Thread(target=insight_loop, name="insight-engine", daemon=True).start()
+
+_database_jobs_started = False
+
+def start_database_jobs():
+    """Start tracking maintenance and the insight engine once per process"""
+    global _database_jobs_started
+    if not _database_jobs_started:
+        _database_jobs_started = True
+        start_tracking_maintenance()
+        start_insight_engine()
+
+# Streaming exports
+def iter_query_chunks(connect, query, params=()):
+    """Yield lists of at most EXPORT_CHUNK_SIZE rows from a query, holding one cursor open"""
+    conn = connect()
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            yield rows
+    except sqlite3.OperationalError as e:
+        # A tracking partition can disappear mid-export when analytics are cleared. Re-raise so
+        # the server aborts the transfer instead of ending a truncated file as if it were complete
+        log.error("❌ Export query stopped early: %s", e, extra={"category": "exports"})
+        raise
+    finally:
+        conn.close()
+
+def csv_safe(value):
+    """Neutralize values a spreadsheet would otherwise evaluate as a formula"""
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + value
+    return value
+
+def export_response(chunks, columns, basename):
+    """Build a streaming download from row chunks, honouring ?format=csv|ndjson and ?gzip=1"""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ('csv', 'ndjson'):
+        export_format = 'csv'
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # wbits=31 produces a gzip container rather than a raw zlib stream
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        
+        def encode(text):
+            data = text.encode('utf-8')
+            return compressor.compress(data) if compressor else data
+        
+        try:
+            if export_format == 'csv':
+                writer.writerow(columns)
+            for rows in chunks:
+                if export_format == 'csv':
+                    writer.writerows([csv_safe(value) for value in row] for row in rows)
+                else:
+                    for row in rows:
+                        buffer.write(json.dumps(dict(zip(columns, row)), default=str))
+                        buffer.write("\n")
+                data = encode(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+                if data:
+                    yield data
+            
+            if export_format == 'csv' and buffer.tell():
+                yield encode(buffer.getvalue())
+            if compressor:
+                yield compressor.flush()
+        finally:
+            # Close the DB cursor even when the client disconnects mid-download
+            if hasattr(chunks, 'close'):
+                chunks.close()
+    
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    filename = f"{basename}_{int(time.time())}.{extension}"
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+# Keyset pagination
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode an opaque page cursor back into the sort key of the last row served"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(values, list) or not values:
+        raise InvalidCursor("Invalid cursor")
+    # Only scalars can be bound as SQL parameters
+    if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+def page_limit(args):
+    try:
+        limit = int(args.get('limit', PAGE_SIZE_DEFAULT))
+    except (TypeError, ValueError):
+        limit = PAGE_SIZE_DEFAULT
+    return min(max(limit, 1), PAGE_SIZE_MAX)
+
+def fetch_page(cursor, args, table, columns, filters, sort_column=None, descending=True):
+    """Fetch one page ordered by (sort_column, id), seeking past the cursor instead of using OFFSET
+
+    `filters` is a list of (sql, value) pairs ANDed together. Returns the rows
+    and the cursor for the next page (None on the last page).
+    """
+    limit = page_limit(args)
+    where = [clause for clause, _ in filters]
+    params = [value for _, value in filters]
+    
+    key_columns = f"{sort_column}, id" if sort_column else "id"
+    after = decode_cursor(args.get('cursor'))
+    if after:
+        if len(after) != (2 if sort_column else 1):
+            raise InvalidCursor("Invalid cursor")
+        where.append(f"({key_columns}) {'<' if descending else '>'} ({', '.join('?' for _ in after)})")
+        params.extend(after)
+    
+    direction = 'DESC' if descending else 'ASC'
+    order = ", ".join(f"{col.strip()} {direction}" for col in key_columns.split(','))
+    query = f"SELECT {columns}, {key_columns} FROM {table}"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += f" ORDER BY {order} LIMIT ?"
+    cursor.execute(query, params + [limit + 1])
+    rows = cursor.fetchall()
+    
+    key_width = 2 if sort_column else 1
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(list(rows[-1][-key_width:]))
+    return [row[:-key_width] for row in rows], next_cursor
+
+def page_envelope(items, next_cursor, **extra):
+    """The response shape shared by every paginated list endpoint"""
+    return {"success": True, "items": items, "next_cursor": next_cursor, "has_more": next_cursor is not None, **extra}
+
+def format_interval(minutes):
+    if minutes == 0:
+        return "once"
+    elif minutes < 60:
+        return f"{minutes}min"
+    elif minutes < 1440:  # Less than 24 hours
+        hours = minutes // 60
+        return f"{hours}h"
+    else:
+        days = minutes // 1440
+        return f"{days}d"
+
+def optouts_page(cursor, args):
+    """One page of opt-outs, newest first (filters: type, user_id, q username prefix)"""
+    filters = []
+    if args.get('type'):
+        filters.append(("opt_out_type = ?", args.get('type')))
+    if args.get('user_id'):
+        filters.append(("user_id = ?", args.get('user_id')))
+    if args.get('q'):
+        prefix = args.get('q').replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        filters.append(("username LIKE ? ESCAPE '\\'", prefix + '%'))
+    rows, next_cursor = fetch_page(cursor, args, 'marketing_opt_outs', 'user_id, username, opt_out_type, created_at',
+                                   filters, sort_column='created_at')
+    
+    extra = {}
+    if not args.get('cursor'):
+        # Totals are only computed for the first page
+        cursor.execute('SELECT COUNT(*) FROM marketing_opt_outs')
+        extra["total_optouts"] = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT COUNT(*) FROM marketing_opt_outs 
+            WHERE created_at >= datetime('now', '-7 days')
+        ''')
+        extra["this_week_optouts"] = cursor.fetchone()[0]
+    
+    return page_envelope([{
+        "user_id": row[0],
+        "username": row[1],
+        "opt_out_type": row[2],
+        "created_at": row[3]
+    } for row in rows], next_cursor, **extra)
+
+def leads_page(cursor, args):
+    """One page of leads, newest first (filters: action, user_id)"""
+    filters = []
+    if args.get('action'):
+        filters.append(("action = ?", args.get('action')))
+    if args.get('user_id'):
+        filters.append(("user_id = ?", args.get('user_id')))
+    rows, next_cursor = fetch_page(cursor, args, 'leads', '*', filters, sort_column='timestamp')
+    return page_envelope([{
+        "id": row[0],
+        "user_id": row[1],
+        "username": row[2],
+        "action": row[3],
+        "timestamp": row[4]
+    } for row in rows], next_cursor)
+
+def roledms_page(cursor, args):
+    """One page of role DMs in creation order (filters: role_id, role_name)"""
+    filters = []
+    if args.get('role_id'):
+        filters.append(("role_id = ?", args.get('role_id')))
+    if args.get('role_name'):
+        filters.append(("role_name = ?", args.get('role_name')))
+    rows, next_cursor = fetch_page(cursor, args, 'role_dms', '*', filters, descending=False)
+    return page_envelope([{
+        "id": row[0],
+        "role_id": row[1],
+        "role_name": row[2],
+        "title": row[3],  # dm_title
+        "message": row[4],  # dm_message
+        "claim": bool(row[5]),  # claim_button
+        "claim_role": row[6],  # claim_role_id
+        "button_text": row[7],
+        "button_color": row[8],
+        "button_emoji": row[9],
+        "include_logo": bool(row[10])
+    } for row in rows], next_cursor)
+
+def campaigns_page(cursor, args):
+    """One page of campaigns in creation order (filters: active=1|0|all, default active only)"""
+    filters = []
+    active = args.get('active', '1')
+    if active in ('0', '1'):
+        filters.append(("is_active = ?", int(active)))
+    rows, next_cursor = fetch_page(cursor, args, 'marketing_campaigns', '*', filters, descending=False)
+    return page_envelope([{
+        "id": row[0],
+        "key": row[1],  # campaign_id
+        "name": row[2],
+        "message": row[3],
+        "channel_id": row[4],
+        "interval": format_interval(row[5]),  # interval_minutes formatted
+        "is_active": bool(row[6]),
+        "role_names": row[7].split(',') if row[7] else [],  # role_names
+        "claim": bool(row[8]),
+        "claim_role": row[9],
+        "include_server_logo": bool(row[10])
+    } for row in rows], next_cursor)
+
+def getnow_page(cursor, args):
+    """One page of Get Now buttons in creation order (filters: id, channel_id, role_id)"""
+    filters = []
+    if args.get('id'):
+        filters.append(("id = ?", args.get('id')))
+    if args.get('channel_id'):
+        filters.append(("channel_id = ?", args.get('channel_id')))
+    if args.get('role_id'):
+        filters.append(("role_id = ?", args.get('role_id')))
+    rows, next_cursor = fetch_page(cursor, args, 'get_now_buttons', '*', filters, descending=False)
+    return page_envelope([{
+        "id": row[0],
+        "button_id": row[1],
+        "button_text": row[2],
+        "button_style": row[3],
+        "channel_id": row[4],
+        "role_id": row[6]
+    } for row in rows], next_cursor)
+
+def opt_out_summary(cursor):
+    """Opt-out totals and the ten most recent marketing opt-outs"""
+    # Get opt-out statistics
+    cursor.execute('''
+        SELECT COUNT(*) as total_opt_outs,
+               COUNT(CASE WHEN created_at >= datetime('now', '-7 days') THEN 1 END) as recent_opt_outs
+        FROM marketing_opt_outs 
+        WHERE opt_out_type = 'marketing'
+    ''')
+    stats = cursor.fetchone()
+    
+    # Get recent opt-outs
+    cursor.execute('''
+        SELECT username, created_at 
+        FROM marketing_opt_outs 
+        WHERE opt_out_type = 'marketing' 
+        ORDER BY created_at DESC 
+        LIMIT 10
+    ''')
+    recent_opt_outs = cursor.fetchall()
+    
+    return {
+        "success": True,
+        "total_opt_outs": stats[0],
+        "recent_opt_outs": stats[1],
+        "recent_list": [{"username": row[0], "date": row[1]} for row in recent_opt_outs]
+    }
+
+def customization_payload(cursor):
+    """The saved bot customization, if any"""
+    cursor.execute('SELECT * FROM bot_customization ORDER BY updated_at DESC LIMIT 1')
+    customization = cursor.fetchone()
+    if not customization:
+        return {"success": True, "customization": None}
+    return {
+        "success": True,
+        "customization": {
+            "name": customization[1],
+            "status": customization[2],
+            "activity_type": customization[3],
+            "activity_text": customization[4],
+            "active": bool(customization[5])
+        }
+    }
+
+def paged_response(page_function):
+    """Run a page function on a fresh connection and wrap errors the way the other endpoints do"""
+    conn = db_connect()
+    try:
+        return jsonify(page_function(conn.cursor(), request.args))
+    except InvalidCursor as e:
+        return jsonify({"success": False, "error": str(e)})
+    finally:
+        conn.close()
+
+def entry_response(entry, cache_control='no-cache'):
+    """Serve a pre-serialized JSON body, answering 304 when the client already has it"""
+    if request.if_none_match.contains(entry.etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def snapshot_response(key):
+    return entry_response(guild_snapshot[key])
+
+# Dashboard bootstrap
+# Everything the dashboard needs for first paint, read in one transaction and
+# serialized once. Snapshot bodies are spliced in as already-encoded JSON.
+_bootstrap_cache = None
+
+def build_bootstrap_body():
+    snapshot = guild_snapshot
+    version = change_feed.version
+    
+    conn = db_connect()
+    cursor = conn.cursor()
+    try:
+        # One read transaction, so every section reflects the same database state
+        cursor.execute('BEGIN')
+        sections = {
+            "/api/status": bot_status,
+            "/api/campaigns": campaigns_page(cursor, {}),
+            "/api/roledms": roledms_page(cursor, {}),
+            "/api/getnow": getnow_page(cursor, {}),
+            "/api/leads": leads_page(cursor, {}),
+            "/api/optouts": optouts_page(cursor, {}),
+            "/api/opt-outs": opt_out_summary(cursor),
+            "/api/bot-customize": customization_payload(cursor)
+        }
+    finally:
+        conn.rollback()
+        conn.close()
+    
+    parts = [json.dumps(path).encode('utf-8') + b':' + json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+             for path, payload in sections.items()]
+    for path, key in (("/api/roles", "roles"), ("/api/channels", "channels"), ("/api/server-emojis", "server_emojis")):
+        parts.append(json.dumps(path).encode('utf-8') + b':' + snapshot[key].body)
+    
+    body = b'{"success":true,"version":' + str(version).encode('ascii') + b',"responses":{' + b','.join(parts) + b'}}'
+    return (version, snapshot), SnapshotEntry(body, hashlib.sha256(body).hexdigest()[:32])
+
+# Dashboard asset pipeline
+# At startup the inline <style> and <script> blocks of dashboard.html are split
+# into content-hashed files, precompressed once and served with immutable
+# cache headers; only the remaining HTML shell is rendered per request.
+ASSET_MIMETYPES = {'css': 'text/css; charset=utf-8', 'js': 'application/javascript; charset=utf-8'}
+_dashboard_build = None
+_dashboard_build_lock = threading.Lock()
+
+def build_asset(content, extension):
+    data = content.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    encodings = {'identity': data, 'gzip': gzip.compress(data, 9, mtime=0)}
+    if brotli:
+        encodings['br'] = brotli.compress(data, quality=11)
+    return f"dashboard.{digest}.{extension}", {'etag': digest, 'mimetype': ASSET_MIMETYPES[extension], 'encodings': encodings}
+
+def build_dashboard_assets():
+    """Split dashboard.html into a template shell plus hashed, precompressed CSS/JS assets"""
+    with open(DASHBOARD_TEMPLATE, encoding='utf-8') as f:
+        html = f.read()
+    assets = {}
+    
+    # All stylesheets become one bundle linked where the first one was
+    styles = re.findall(r'<style>(.*?)</style>', html, flags=re.S)
+    if styles:
+        name, asset = build_asset("\n".join(styles), 'css')
+        assets[name] = asset
+        link = f'<link rel="stylesheet" href="/assets/{name}">'
+        html = re.sub(r'<style>.*?</style>', link, html, count=1, flags=re.S)
+        html = re.sub(r'<style>.*?</style>', '', html, flags=re.S)
+    
+    # Scripts stay separate and in place so execution order is unchanged
+    def externalize_script(match):
+        name, asset = build_asset(match.group(1), 'js')
+        assets[name] = asset
+        return f'<script src="/assets/{name}"></script>'
+    html = re.sub(r'<script>(.*?)</script>', externalize_script, html, flags=re.S)
+    
+    return {
+        'mtime': os.path.getmtime(DASHBOARD_TEMPLATE),
+        'shell': app.jinja_env.from_string(html),
+        'assets': assets
+    }
+
+def get_dashboard_build():
+    global _dashboard_build
+    build = _dashboard_build
+    if build is None or (app.config['TEMPLATES_AUTO_RELOAD'] and os.path.getmtime(DASHBOARD_TEMPLATE) != build['mtime']):
+        with _dashboard_build_lock:
+            if _dashboard_build is build:
+                _dashboard_build = build_dashboard_assets()
+                print(f"📦 Built {len(_dashboard_build['assets'])} dashboard assets")
+            build = _dashboard_build
+    return build
 
 # Flask Routes
-@app.route('/')
+@route('/')
 def dashboard():
-    import time
-    return render_template('dashboard.html', status=bot_status, timestamp=int(time.time()))
+    shell = get_dashboard_build()['shell']
+    return shell.render(status=bot_status, timestamp=int(time.time()))
 
-@app.route('/new')
+@route('/assets/<name>')
+def dashboard_asset(name):
+    """Serve a hashed dashboard asset in the best encoding the client accepts"""
+    asset = get_dashboard_build()['assets'].get(name)
+    if not asset:
+        return jsonify({"success": False, "error": "Asset not found"}), 404
+    
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in asset['encodings'] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    
+    if request.if_none_match.contains(asset['etag']):
+        response = Response(status=304)
+    else:
+        response = Response(asset['encodings'][encoding], mimetype=asset['mimetype'])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(asset['etag'])
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@route('/new')
 def new_dashboard():
     import time
     return render_template('dashboard_new.html', status=bot_status, timestamp=int(time.time()))
 
-@app.route('/test_new')
+@route('/test_new')
 def test_new():
     return '''
     <!DOCTYPE html>
@@ -1084,7 +3917,7 @@ def test_new():
     </html>
     '''
 
-@app.route('/force_refresh.html')
+@route('/force_refresh.html')
 def force_refresh():
     return '''
 <!DOCTYPE html>
@@ -1142,7 +3975,7 @@ def force_refresh():
 </html>
     '''
 
-@app.route('/test')
+@route('/test')
 def test_page():
     return '''
 <!DOCTYPE html>
@@ -1159,30 +3992,166 @@ def test_page():
 </html>
     '''
 
-@app.route('/api/status')
+@route('/api/status')
 def api_status():
     return jsonify(bot_status)
 
-@app.route('/api/roles')
-def api_roles():
-    if not bot.guilds:
-        return jsonify([])
+@route('/api/health')
+def api_health():
+    """Gateway readiness and the state of each background service"""
+    try:
+        if BOT_MODE == 'dashboard':
+            health = ipc_call('health', timeout=5)
+        else:
+            health = {"gateway": gateway_info(), "services": supervisor.health()}
+        return jsonify({"success": True, **health})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint; dashboard workers relay the gateway's metrics"""
+    try:
+        text = ipc_call('metrics', timeout=5)["text"] if BOT_MODE == 'dashboard' else metrics.render()
+        return Response(text, mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        return Response(f"# metrics unavailable: {e}\n", status=503, mimetype='text/plain')
+
+def admin_authorized():
+    """None when the request carries ADMIN_TOKEN, else the error response"""
+    if not ADMIN_TOKEN:
+        return jsonify({"success": False, "error": "Admin endpoints are disabled; set ADMIN_TOKEN"}), 403
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    return None
+
+@route('/api/admin/profile')
+def admin_profile():
+    """Sample CPU stacks for ?seconds=N; ?format=folded returns the collapsed stacks as a file"""
+    denied = admin_authorized()
+    if denied:
+        return denied
+    try:
+        seconds = min(max(float(request.args.get('seconds', 10)), 0.1), PROFILE_MAX_SECONDS)
+        if BOT_MODE == 'dashboard':
+            # The gateway profiles its loop over IPC while this worker profiles its request threads
+            local = {}
+            worker = threading.Thread(target=lambda: local.update(run_profile(seconds, 'dashboard;')), daemon=True)
+            worker.start()
+            profile = ipc_call('profile', {"seconds": seconds}, timeout=seconds + 15)
+            worker.join()
+            if not profile.get("success"):
+                return jsonify(profile)
+            profile["collapsed"] += local.get("collapsed", "")
+            profile["dashboard"] = {key: local.get(key) for key in ("seconds", "samples", "overhead_percent")}
+        else:
+            profile = {"success": True, **run_profile(seconds)}
+        
+        if request.args.get('format') == 'folded':
+            return Response(profile["collapsed"], mimetype='text/plain', headers={
+                'Content-Disposition': f'attachment; filename="profile_{int(time.time())}.folded"',
+                'Cache-Control': 'no-store'
+            })
+        return jsonify(profile)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+def admin_memory_action(action, params):
+    """A memory action on the gateway (over IPC from a dashboard worker), plus the worker's own report"""
+    if BOT_MODE != 'dashboard':
+        return {"success": True, **memory_action(action, params)}
+    result = ipc_call('memory', dict(params, action=action), timeout=60)
+    if action == 'report' and result.get("success"):
+        result["dashboard"] = memory_report()
+    return result
+
+@route('/api/admin/memory')
+def admin_memory():
+    """Resident memory, live views/tasks/members, pending operation results and cache sizes"""
+    denied = admin_authorized()
+    if denied:
+        return denied
+    try:
+        return jsonify(admin_memory_action('report', {}))
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@route('/api/admin/memory/snapshot', methods=['POST', 'DELETE'])
+def admin_memory_snapshot():
+    """POST diffs a tracemalloc snapshot against the previous one (?limit=25&group=lineno|traceback); DELETE stops tracing"""
+    denied = admin_authorized()
+    if denied:
+        return denied
+    try:
+        if request.method == 'DELETE':
+            return jsonify(admin_memory_action('stop', {}))
+        params = {"limit": min(int(request.args.get('limit', 25)), 200), "group": request.args.get('group', 'lineno')}
+        return jsonify(admin_memory_action('snapshot', params))
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@route('/api/bootstrap')
+def api_bootstrap():
+    """All first-paint data for the dashboard in a single response"""
+    global _bootstrap_cache
+    try:
+        # Reuse the last body while nothing has changed and it is younger than the TTL
+        cached = _bootstrap_cache
+        now = time.time()
+        if cached and cached[0] == change_feed.version and cached[1] is guild_snapshot and cached[2] > now:
+            entry = cached[3]
+        else:
+            (version, snapshot), entry = build_bootstrap_body()
+            _bootstrap_cache = (version, snapshot, now + BOOTSTRAP_CACHE_SECONDS, entry)
+        
+        return entry_response(entry, f'private, max-age={int(BOOTSTRAP_CACHE_SECONDS)}')
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@route('/api/events')
+def api_events():
+    """Server-sent change notifications; idle dashboards cost nothing but a keepalive"""
+    try:
+        last_version = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_version = change_feed.version
+    
+    def stream():
+        version = last_version
+        yield "retry: 3000\n\n"
+        if version > change_feed.version:
+            # Event IDs from another worker or an earlier gateway run
+            version = change_feed.version
+            yield f"id: {version}\nevent: resync\ndata: {{}}\n\n"
+        while True:
+            events, missed = change_feed.wait(version, timeout=15)
+            if missed:
+                # Too far behind to replay; the client reloads everything
+                version = change_feed.version
+                yield f"id: {version}\nevent: resync\ndata: {{}}\n\n"
+                continue
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event_version, topic, data in events:
+                version = event_version
+                yield f"id: {event_version}\nevent: {topic}\ndata: {json.dumps(data or {}, default=str)}\n\n"
     
-    guild = bot.guilds[0]
-    roles = [{"id": str(role.id), "name": role.name, "color": str(role.color)} for role in guild.roles if not role.managed and role.name != "@everyone"]
-    return jsonify(roles)
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@route('/api/roles')
+def api_roles():
+    return snapshot_response("roles")
 
-@app.route('/api/channels')
+@route('/api/channels')
 def api_channels():
-    if not bot.guilds:
-        return jsonify([])
-    
-    guild = bot.guilds[0]
-    channels = [{"id": str(channel.id), "name": channel.name, "type": str(channel.type)} for channel in guild.channels if hasattr(channel, 'send')]
-    print(f"API Channels called, returning {len(channels)} channels")
-    return jsonify(channels)
+    return snapshot_response("channels")
 
-@app.route('/api/getnow', methods=['GET', 'POST'])
+@route('/api/getnow', methods=['GET', 'POST'])
 def api_getnow():
     if request.method == 'POST':
         data = request.json
@@ -1193,7 +4162,7 @@ def api_getnow():
         role_id = data.get('role_id')
         
         # Store in database
-        conn = sqlite3.connect('marketing_bot.db')
+        conn = db_connect()
         cursor = conn.cursor()
         cursor.execute('''
             INSERT OR REPLACE INTO get_now_buttons 
@@ -1202,45 +4171,20 @@ def api_getnow():
         ''', (button_id, button_text, button_style, channel_id, role_id))
         conn.commit()
         conn.close()
+        notify_change("getnow")
         
         return jsonify({"success": True, "message": "Get Now button created!"})
     
     else:
         # Return existing buttons
-        conn = sqlite3.connect('marketing_bot.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM get_now_buttons')
-        buttons = cursor.fetchall()
-        conn.close()
-        
-        return jsonify([{
-            "id": row[0],
-            "button_id": row[1],
-            "button_text": row[2],
-            "button_style": row[3],
-            "channel_id": row[4],
-            "role_id": row[6]
-        } for row in buttons])
-
+        return paged_response(getnow_page)
 
 
-@app.route('/api/leads')
+@route('/api/leads')
 def api_leads():
-    conn = sqlite3.connect('marketing_bot.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM leads ORDER BY timestamp DESC LIMIT 100')
-    leads = cursor.fetchall()
-    conn.close()
-    
-    return jsonify([{
-        "id": row[0],
-        "user_id": row[1],
-        "username": row[2],
-        "action": row[3],
-        "timestamp": row[4]
-    } for row in leads])
+    return paged_response(leads_page)
 
-@app.route('/api/bot-customize', methods=['GET', 'POST'])
+@route('/api/bot-customize', methods=['GET', 'POST'])
 def api_bot_customize():
     if request.method == 'POST':
         data = request.json
@@ -1258,7 +4202,7 @@ def api_bot_customize():
             return jsonify({"success": False, "error": "Activity text is required"})
         
         # Store in database
-        conn = sqlite3.connect('marketing_bot.db')
+        conn = db_connect()
         cursor = conn.cursor()
         cursor.execute('DELETE FROM bot_customization')
         cursor.execute('''
@@ -1267,28 +4211,17 @@ def api_bot_customize():
         ''', (bot_name, bot_status, activity_type, activity_text, is_active))
         conn.commit()
         conn.close()
+        notify_change("customization")
         
         # Update bot status if active - queue the operation
-        if is_active and bot.user:
+        if is_active and gateway_info()["user"]:
             try:
-                # Create operation ID
-                operation_id = str(uuid.uuid4())
-                
-                # Queue the bot customization operation
-                operation = {
-                    'id': operation_id,
-                    'type': 'bot_customize',
-                    'data': {
-                        'bot_name': bot_name,
-                        'bot_status': bot_status,
-                        'activity_type': activity_type,
-                        'activity_text': activity_text
-                    }
-                }
-                
-                operation_queue.put(operation)
-                print(f"🔍 Queued Bot Customization operation: {operation_id}")
-                
+                queue_operation('bot_customize', {
+                    'bot_name': bot_name,
+                    'bot_status': bot_status,
+                    'activity_type': activity_type,
+                    'activity_text': activity_text
+                })
             except Exception as e:
                 print(f"Warning: Could not queue bot customization: {e}")
         
@@ -1296,27 +4229,12 @@ def api_bot_customize():
     
     else:
         # Return current customization
-        conn = sqlite3.connect('marketing_bot.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM bot_customization ORDER BY updated_at DESC LIMIT 1')
-        customization = cursor.fetchone()
+        conn = db_connect()
+        customization = customization_payload(conn.cursor())
         conn.close()
-        
-        if customization:
-            return jsonify({
-                "success": True,
-                "customization": {
-                    "name": customization[1],
-                    "status": customization[2],
-                    "activity_type": customization[3],
-                    "activity_text": customization[4],
-                    "active": bool(customization[5])
-                }
-            })
-        else:
-            return jsonify({"success": True, "customization": None})
+        return jsonify(customization)
 
-@app.route('/api/bot-avatar', methods=['POST'])
+@route('/api/bot-avatar', methods=['POST'])
 def api_bot_avatar():
     """Queue Bot Avatar operation for the bot to handle"""
     try:
@@ -1341,43 +4259,22 @@ def api_bot_avatar():
         if file_size > 8 * 1024 * 1024:  # 8MB
             return jsonify({"success": False, "error": "File too large. Maximum size is 8MB."})
         
-        # Read file data
-        avatar_data = avatar_file.read()
-        
-        if not bot.user:
+        if not gateway_info()["user"]:
             return jsonify({"success": False, "error": "Bot is not ready"})
         
-        # Create operation ID
-        operation_id = str(uuid.uuid4())
-        
-        # Queue the operation
-        operation = {
-            'id': operation_id,
-            'type': 'bot_avatar',
-            'data': {
-                'avatar_data': avatar_data
-            }
-        }
-        
-        operation_queue.put(operation)
-        print(f"🔍 Queued Bot Avatar operation: {operation_id}")
-        
-        # Wait for result (with timeout)
-        timeout = 30  # 30 seconds timeout
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            if operation_id in operation_results:
-                result = operation_results.pop(operation_id)
-                return jsonify(result)
-            time.sleep(0.1)
+        # Normalize and store the file, then hand the bot only its hash
+        try:
+            avatar_sha256 = store_image_variant(avatar_file.read(), 'avatar')
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)})
+        set_media_ref("bot_avatar", avatar_sha256)
         
-        return jsonify({"success": False, "error": "Operation timeout"})
+        return jsonify(run_operation('bot_avatar', {'avatar_sha256': avatar_sha256}))
             
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/quick-dm', methods=['POST'])
+@route('/api/quick-dm', methods=['POST'])
 def api_quick_dm():
     """Queue Quick DM operation for the bot to handle"""
     try:
@@ -1390,49 +4287,47 @@ def api_quick_dm():
         if not role_id or not message:
             return jsonify({"success": False, "error": "Role ID and message are required"})
         
-        if not bot.guilds:
+        gateway = gateway_info()
+        if not gateway["guilds"]:
             return jsonify({"success": False, "error": "Bot is not connected to any servers"})
         
-        if not bot.is_ready():
+        if not gateway["ready"]:
             return jsonify({"success": False, "error": "Bot is not ready yet. Please wait a moment and try again."})
         
-        # Create operation ID
-        operation_id = str(uuid.uuid4())
-        
-        # Queue the operation
-        operation = {
-            'id': operation_id,
-            'type': 'quick_dm',
-            'data': {
-                'role_id': role_id,
-                'title': title,
-                'message': message,
-                'include_logo': include_logo
-            }
-        }
-        
-        operation_queue.put(operation)
-        print(f"🔍 Queued Quick DM operation: {operation_id}")
-        
-        # Wait for result (with timeout)
-        timeout = 30  # 30 seconds timeout
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            if operation_id in operation_results:
-                result = operation_results.pop(operation_id)
-                return jsonify(result)
-            time.sleep(0.1)
-        
-        return jsonify({"success": False, "error": "Operation timeout"})
+        return jsonify(run_operation('quick_dm', {
+            'role_id': role_id,
+            'title': title,
+            'message': message,
+            'include_logo': include_logo
+        }))
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/server-logo', methods=['POST'])
+@route('/api/server-logo', methods=['GET', 'POST', 'DELETE'])
 def api_server_logo():
-    """Handle server logo upload"""
+    """Get, upload or remove the server logo"""
     try:
+        if request.method == 'GET':
+            ref = get_media_ref("server_logo")
+            if not ref:
+                return jsonify({"success": True, "logo_url": None})
+            return jsonify({"success": True, "logo_url": ref["external_url"] or f"/media/{ref['sha256']}"})
+        
+        if request.method == 'DELETE':
+            delete_media_ref("server_logo")
+            notify_change("logo")
+            return jsonify({"success": True, "message": "Server logo removed"})
+        
+        # A logo URL hosted elsewhere is stored as-is
+        if request.is_json:
+            logo_url = (request.json.get('logo_url') or '').strip()
+            if not logo_url.startswith(('http://', 'https://')):
+                return jsonify({"success": False, "error": "Logo URL must start with http:// or https://"})
+            set_media_ref("server_logo", external_url=logo_url)
+            notify_change("logo")
+            return jsonify({"success": True, "message": "Server logo updated successfully!"})
+        
         if 'logo' not in request.files:
             return jsonify({"success": False, "error": "No logo file provided"})
         
@@ -1454,29 +4349,38 @@ def api_server_logo():
         if file_size > 8 * 1024 * 1024:  # 8MB
             return jsonify({"success": False, "error": "File too large. Maximum size is 8MB."})
         
-        # Read file data and convert to base64 for storage
-        import base64
-        logo_data = logo_file.read()
-        logo_base64 = base64.b64encode(logo_data).decode('utf-8')
-        
-        # Store in database
-        conn = sqlite3.connect('marketing_bot.db')
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM server_logo')
-        cursor.execute('INSERT INTO server_logo (logo_data) VALUES (?)', (logo_base64,))
-        conn.commit()
-        conn.close()
-        
-        # Update global variable
-        global server_logo_url
-        server_logo_url = f"data:image/{logo_file.filename.rsplit('.', 1)[1].lower()};base64,{logo_base64}"
+        # Normalize off-thread and store; identical uploads share one file
+        try:
+            logo_sha256 = store_image_variant(logo_file.read(), 'logo')
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)})
+        set_media_ref("server_logo", logo_sha256)
+        notify_change("logo")
         
-        return jsonify({"success": True, "message": "Server logo updated successfully!"})
+        return jsonify({"success": True, "message": "Server logo updated successfully!", "logo_url": f"/media/{logo_sha256}"})
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/setdm', methods=['POST'])
+@route('/media/<sha256>')
+def media(sha256):
+    """Serve a stored blob; content-addressed, so it can be cached forever"""
+    if not re.fullmatch(r'[0-9a-f]{64}', sha256) or not os.path.exists(media_path(sha256)):
+        return jsonify({"success": False, "error": "Media not found"}), 404
+    
+    conn = db_connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT content_type FROM media_blobs WHERE sha256 = ?', (sha256,))
+    row = cursor.fetchone()
+    conn.close()
+    
+    # conditional=True handles If-None-Match and Range requests
+    response = send_file(os.path.abspath(media_path(sha256)), mimetype=row[0] if row else 'application/octet-stream',
+                         conditional=True, etag=sha256, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@route('/api/setdm', methods=['POST'])
 def api_setdm():
     """Set role DM configuration"""
     try:
@@ -1494,18 +4398,15 @@ def api_setdm():
         if not role_name or not message:
             return jsonify({"success": False, "error": "Role name and message are required"})
         
-        # Get the role ID from the bot
+        # Get the role ID from the guild snapshot
         role_id = None
-        for guild in bot.guilds:
-            for role in guild.roles:
-                if role.name == role_name:
-                    role_id = str(role.id)
-                    break
-            if role_id:
+        for role in json.loads(guild_snapshot["roles"].body):
+            if role["name"] == role_name:
+                role_id = role["id"]
                 break
         
         # Store in database
-        conn = sqlite3.connect('marketing_bot.db')
+        conn = db_connect()
         cursor = conn.cursor()
         
         # Insert or update role DM (use role_id if found, otherwise use role_name for backward compatibility)
@@ -1517,44 +4418,26 @@ def api_setdm():
         
         conn.commit()
         conn.close()
+        notify_change("roledms")
         
         return jsonify({"success": True, "message": "Role DM set successfully!"})
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/roledms')
+@route('/api/roledms')
 def api_roledms():
     """Get role DMs"""
     try:
-        conn = sqlite3.connect('marketing_bot.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM role_dms')
-        role_dms = cursor.fetchall()
-        conn.close()
-        
-        return jsonify([{
-            "id": row[0],
-            "role_id": row[1],
-            "role_name": row[2],
-            "title": row[3],  # dm_title
-            "message": row[4],  # dm_message
-            "claim": bool(row[5]),  # claim_button
-            "claim_role": row[6],  # claim_role_id
-            "button_text": row[7],
-            "button_color": row[8] if len(row) > 8 else 'success',  # button_color
-            "button_emoji": row[9] if len(row) > 9 else '🎁',  # button_emoji
-            "include_logo": bool(row[10]) if len(row) > 10 else bool(row[8])  # include_logo
-        } for row in role_dms])
-        
+        return paged_response(roledms_page)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/roledms/<role_dm_id>', methods=['DELETE'])
+@route('/api/roledms/<role_dm_id>', methods=['DELETE'])
 def api_delete_roledm(role_dm_id):
     """Delete a role DM"""
     try:
-        conn = sqlite3.connect('marketing_bot.db')
+        conn = db_connect()
         cursor = conn.cursor()
         
         # Delete the role DM
@@ -1566,57 +4449,40 @@ def api_delete_roledm(role_dm_id):
         
         conn.commit()
         conn.close()
+        notify_change("roledms", deleted_id=role_dm_id)
         
         return jsonify({"success": True, "message": "Role DM deleted successfully!"})
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/server-emojis')
+@route('/api/server-emojis')
 def api_server_emojis():
     """Get server emojis for the emoji picker"""
-    try:
-        if not bot.guilds:
-            return jsonify({"success": False, "error": "Bot is not connected to any servers"})
-        
-        guild = bot.guilds[0]
-        emojis = []
-        
-        for emoji in guild.emojis:
-            emojis.append({
-                "id": str(emoji.id),
-                "name": emoji.name,
-                "animated": emoji.animated,
-                "url": str(emoji.url),
-                "display": f"<{'a' if emoji.animated else ''}:{emoji.name}:{emoji.id}>"
-            })
-        
-        return jsonify({
-            "success": True,
-            "emojis": emojis,
-            "count": len(emojis)
-        })
-        
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+    return snapshot_response("server_emojis")
 
-@app.route('/api/analytics/overview')
+@route('/api/analytics/overview')
 def api_analytics_overview():
-    conn = sqlite3.connect('marketing_bot.db')
+    conn = tracking_reader()
     cursor = conn.cursor()
     
-    # Get total interactions
-    cursor.execute('SELECT COUNT(*) FROM user_tracking')
+    # Get total interactions (raw partitions plus compacted days)
+    cursor.execute('SELECT COUNT(*) FROM user_tracking_all')
     total_interactions = cursor.fetchone()[0]
+    cursor.execute('SELECT COALESCE(SUM(events), 0) FROM user_tracking_daily')
+    total_interactions += cursor.fetchone()[0]
     
-    # Get unique users
-    cursor.execute('SELECT COUNT(DISTINCT user_id) FROM user_tracking')
+    # Get unique users (raw retention window only)
+    cursor.execute('SELECT COUNT(DISTINCT user_id) FROM user_tracking_all')
     unique_users = cursor.fetchone()[0]
     
     # Get interaction types breakdown
     cursor.execute('''
-        SELECT interaction_type, COUNT(*) as count 
-        FROM user_tracking 
+        SELECT interaction_type, SUM(count) as count FROM (
+            SELECT interaction_type, COUNT(*) as count FROM user_tracking_all GROUP BY interaction_type
+            UNION ALL
+            SELECT interaction_type, SUM(events) as count FROM user_tracking_daily GROUP BY interaction_type
+        )
         GROUP BY interaction_type 
         ORDER BY count DESC
     ''')
@@ -1640,28 +4506,91 @@ def api_analytics_overview():
     ''')
     top_buttons = [{"id": row[0], "text": row[1], "clicks": row[2], "unique_clicks": row[3], "last_clicked": row[4]} for row in cursor.fetchall()]
     
-    # Get recent activity
-    cursor.execute('''
-        SELECT user_id, username, interaction_type, timestamp
-        FROM user_tracking 
-        ORDER BY timestamp DESC 
-        LIMIT 20
-    ''')
-    recent_activity = [{"user_id": row[0], "username": row[1], "type": row[2], "timestamp": row[3]} for row in cursor.fetchall()]
-    
     conn.close()
     
+    # Get recent activity, newest partition first so older months are never scanned
+    recent_activity = []
+    for name in reversed(list_tracking_partitions()):
+        try:
+            part = sqlite3.connect(tracking_partition_path(name), timeout=30, factory=TimedConnection)
+            rows = part.execute('''
+                SELECT user_id, user_name, interaction_type, timestamp
+                FROM user_tracking 
+                ORDER BY timestamp DESC 
+                LIMIT ?
+            ''', (20 - len(recent_activity),)).fetchall()
+            part.close()
+        except sqlite3.Error:
+            continue
+        recent_activity.extend({"user_id": row[0], "user": row[1], "type": row[2], "timestamp": row[3]} for row in rows)
+        if len(recent_activity) >= 20:
+            break
+    
     return jsonify({
-        "total_interactions": total_interactions,
-        "unique_users": unique_users,
-        "interaction_breakdown": interaction_breakdown,
-        "top_links": top_links,
-        "top_buttons": top_buttons,
-        "recent_activity": recent_activity
+        "success": True,
+        "analytics": {
+            "total_interactions": total_interactions,
+            "unique_users": unique_users,
+            "interaction_breakdown": interaction_breakdown,
+            "top_links": top_links,
+            "top_buttons": top_buttons,
+            "recent_activity": recent_activity
+        }
     })
 
 
-@app.route('/api/track-interaction', methods=['POST'])
+@route('/api/analytics/insights')
+def api_analytics_insights():
+    """Serve the insights precomputed by the background engine"""
+    try:
+        conn = db_connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT insight_type, insight_data, confidence_score, generated_at
+            FROM ai_insights
+            WHERE is_active = 1
+            ORDER BY confidence_score DESC, id
+        ''')
+        rows = cursor.fetchall()
+        conn.close()
+        
+        insights = []
+        for insight_type, insight_data, confidence, generated_at in rows:
+            details = json.loads(insight_data)
+            insights.append({
+                "type": insight_type,
+                "data": details.get("summary", ""),
+                "details": details,
+                "confidence": confidence,
+                "generated_at": generated_at
+            })
+        
+        return jsonify({"success": True, "insights": insights})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@route('/api/analytics/export')
+def api_analytics_export():
+    """Stream raw tracking events (or daily aggregates with ?dataset=daily) as CSV or NDJSON"""
+    if request.args.get('dataset') == 'daily':
+        rows = iter_query_chunks(db_connect, '''
+            SELECT day, interaction_type, events, unique_users
+            FROM user_tracking_daily
+            ORDER BY day
+        ''')
+        return export_response(rows, ["day", "interaction_type", "events", "unique_users"], "analytics_daily")
+    
+    def partition_rows():
+        # One partition at a time, oldest first, so only one cursor is ever open
+        for name in list_tracking_partitions():
+            yield from iter_query_chunks(
+                lambda: sqlite3.connect(tracking_partition_path(name), timeout=30, factory=TimedConnection),
+                f"SELECT {', '.join(TRACKING_COLUMNS)} FROM user_tracking ORDER BY id"
+            )
+    
+    return export_response(partition_rows(), list(TRACKING_COLUMNS), "analytics")
+
+@route('/api/track-interaction', methods=['POST'])
 def api_track_interaction():
     data = request.json
     user_id = data.get('user_id')
@@ -1679,7 +4608,7 @@ def api_track_interaction():
     if not user_id or not interaction_type:
         return jsonify({"success": False, "error": "user_id and interaction_type are required"})
     
-    conn = sqlite3.connect('marketing_bot.db')
+    conn = tracking_connect()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -1693,35 +4622,44 @@ def api_track_interaction():
     
     return jsonify({"success": True, "message": "Interaction tracked successfully"})
 
-@app.route('/api/clear-analytics', methods=['POST'])
+@route('/api/clear-analytics', methods=['POST'])
 def api_clear_analytics():
     try:
-        conn = sqlite3.connect('marketing_bot.db')
+        # Swap out the raw partitions; the old files are deleted in the background
+        clear_tracking_partitions()
+        
+        conn = db_connect()
         cursor = conn.cursor()
         
-        # Clear all tracking data
-        cursor.execute('DELETE FROM user_tracking')
+        # Clear the small derived tables
+        cursor.execute('DELETE FROM user_tracking_daily')
+        cursor.execute('DELETE FROM tracking_compacted_partitions')
+        # The recreated partitions number their rows from 1 again, so the rollup starts over too
+        cursor.execute('DELETE FROM user_tracking_hourly')
+        cursor.execute('DELETE FROM rollup_watermarks')
         cursor.execute('DELETE FROM link_analytics')
         cursor.execute('DELETE FROM button_analytics')
         cursor.execute('DELETE FROM ai_insights')
         
         conn.commit()
         conn.close()
+        notify_change("analytics")
         
         return jsonify({"success": True, "message": "Analytics data cleared successfully"})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/clear-cache', methods=['POST'])
+@route('/api/clear-cache', methods=['POST'])
 def api_clear_cache():
     """Clear bot cache for debugging"""
     try:
         # Clear any cached data
         global bot_status
         bot_status = {"running": False, "guilds": [], "commands": [], "last_sync": None}
+        notify_change("status", **bot_status)
         
         # Clear database cache (if any)
-        conn = sqlite3.connect('marketing_bot.db')
+        conn = db_connect()
         conn.close()
         
         print("🧹 Bot cache cleared")
@@ -1729,57 +4667,30 @@ def api_clear_cache():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/opt-outs')
+@route('/api/opt-outs')
 def api_opt_outs():
     try:
-        conn = sqlite3.connect('marketing_bot.db')
-        cursor = conn.cursor()
-        
-        # Get opt-out statistics
-        cursor.execute('''
-            SELECT COUNT(*) as total_opt_outs,
-                   COUNT(CASE WHEN created_at >= datetime('now', '-7 days') THEN 1 END) as recent_opt_outs
-            FROM marketing_opt_outs 
-            WHERE opt_out_type = 'marketing'
-        ''')
-        
-        stats = cursor.fetchone()
-        
-        # Get recent opt-outs
-        cursor.execute('''
-            SELECT username, created_at 
-            FROM marketing_opt_outs 
-            WHERE opt_out_type = 'marketing' 
-            ORDER BY created_at DESC 
-            LIMIT 10
-        ''')
-        
-        recent_opt_outs = cursor.fetchall()
-        
+        conn = db_connect()
+        summary = opt_out_summary(conn.cursor())
         conn.close()
-        
-        return jsonify({
-            "success": True,
-            "total_opt_outs": stats[0],
-            "recent_opt_outs": stats[1],
-            "recent_list": [{"username": row[0], "date": row[1]} for row in recent_opt_outs]
-        })
+        return jsonify(summary)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/test-functions', methods=['POST'])
+@route('/api/test-functions', methods=['POST'])
 def api_test_functions():
     try:
         data = request.json
         clear_rate_limits = data.get('clear_rate_limits', False)
         
         # Get bot status
-        bot_online = bot.is_ready() and bot.user is not None
-        guilds_connected = len(bot.guilds) if bot.guilds else 0
-        commands_synced = len(bot.commands) if bot.commands else 0
+        gateway = gateway_info()
+        bot_online = gateway["ready"] and gateway["user"] is not None
+        guilds_connected = gateway["guilds"]
+        commands_synced = gateway["commands"]
         
         # Get database stats
-        conn = sqlite3.connect('marketing_bot.db')
+        conn = db_connect()
         cursor = conn.cursor()
         
         # Role DMs configured
@@ -1808,22 +4719,22 @@ def api_test_functions():
             # For now, just log that it was requested
             print("🧪 Rate limits cleared for testing")
         
-        conn.close()
-        
         # Get server data
         roles_count = 0
         channels_count = 0
         logging_channels_count = 0
         
-        if bot.guilds:
-            guild = bot.guilds[0]
-            roles_count = len(guild.roles)
-            channels_count = len(guild.channels)
+        if guilds_connected:
+            snapshot = guild_snapshot
+            roles_count = len(json.loads(snapshot["roles"].body))
+            channels_count = len(json.loads(snapshot["channels"].body))
             
             # Count logging channels
             cursor.execute('SELECT COUNT(*) FROM logging_channels')
             logging_channels_count = cursor.fetchone()[0]
         
+        conn.close()
+        
         return jsonify({
             "success": True,
             "results": {
@@ -1848,19 +4759,20 @@ def api_test_functions():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/sync', methods=['POST'])
+@route('/api/sync', methods=['POST'])
 def api_sync():
     try:
         # Sync bot commands
-        if bot.is_ready():
+        gateway = gateway_info()
+        if gateway["ready"]:
             # Commands are already synced when bot starts
             # Just return current status
             return jsonify({
                 "success": True,
                 "message": "Commands are already synced",
-                "commands_count": len(bot.commands),
-                "guilds_connected": len(bot.guilds),
-                "bot_user": str(bot.user) if bot.user else "Unknown"
+                "commands_count": gateway["commands"],
+                "guilds_connected": gateway["guilds"],
+                "bot_user": gateway["user"] or "Unknown"
             })
         else:
             return jsonify({
@@ -1870,19 +4782,11 @@ def api_sync():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/emojis')
+@route('/api/emojis')
 def api_emojis():
-    try:
-        if not bot.guilds:
-            return jsonify([])
-        
-        guild = bot.guilds[0]
-        emojis = [{"id": str(emoji.id), "name": emoji.name, "url": str(emoji.url)} for emoji in guild.emojis]
-        return jsonify(emojis)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+    return snapshot_response("emojis")
 
-@app.route('/api/marketing', methods=['POST'])
+@route('/api/marketing', methods=['POST'])
 def api_marketing():
     try:
         data = request.json
@@ -1901,7 +4805,7 @@ def api_marketing():
         campaign_key = str(uuid.uuid4())[:8]
         
         # Store campaign in database
-        conn = sqlite3.connect('marketing_bot.db')
+        conn = db_connect()
         cursor = conn.cursor()
         
         # Parse interval properly
@@ -1938,197 +4842,73 @@ def api_marketing():
         
         conn.commit()
         conn.close()
+        notify_change("campaigns", key=campaign_key, is_active=True)
         
         return jsonify({"success": True, "message": "Marketing campaign started!", "campaign_key": campaign_key})
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/test-simple-dm', methods=['POST'])
+@route('/api/test-simple-dm', methods=['POST'])
 def api_test_simple_dm():
     """Simple test to see if bot can send DMs at all"""
     try:
         data = request.json
         user_id = int(data.get('user_id'))
         
-        if not bot.guilds:
+        if not gateway_info()["guilds"]:
             return jsonify({"success": False, "error": "Bot is not connected to any servers"})
         
-        guild = bot.guilds[0]
-        member = guild.get_member(user_id)
-        
-        if not member:
-            return jsonify({"success": False, "error": "User not found in server"})
-        
-        # Try to send a simple test DM
-        import asyncio
-        import threading
-        
-        def send_test_dm():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                print(f"🔍 Creating DM channel for {member.name}...")
-                dm_channel = loop.run_until_complete(member.create_dm())
-                print(f"✅ DM channel created for {member.name}")
-                
-                print(f"🔍 Sending test message to {member.name}...")
-                loop.run_until_complete(dm_channel.send("🧪 Test DM from bot - this is a test message"))
-                print(f"✅ Test message sent successfully to {member.name}")
-                return True
-            except discord.Forbidden as e:
-                print(f"🚫 DMs disabled for {member.name}: {e}")
-                return False
-            except Exception as e:
-                print(f"❌ Test DM failed for {member.name}: {e}")
-                return False
-            finally:
-                loop.close()
-        
-        result = [False]
-        exception = [None]
-        
-        def run_test():
-            try:
-                result[0] = send_test_dm()
-            except Exception as e:
-                exception[0] = e
-        
-        thread = threading.Thread(target=run_test)
-        thread.start()
-        thread.join(timeout=5)
-        
-        if thread.is_alive():
+        result = run_operation('test_simple_dm', {'user_id': user_id}, timeout=5)
+        if result.get("error") == "Operation timeout":
             return jsonify({"success": False, "error": "Test DM timeout"})
-        elif exception[0]:
-            return jsonify({"success": False, "error": f"Test DM exception: {exception[0]}"})
-        elif result[0]:
-            return jsonify({"success": True, "message": "Test DM sent successfully"})
-        else:
-            return jsonify({"success": False, "error": "Test DM failed"})
+        return jsonify(result)
             
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/test-dm-permissions', methods=['POST'])
+@route('/api/test-dm-permissions', methods=['POST'])
 def api_test_dm_permissions():
     """Queue Test DM Permissions operation for the bot to handle"""
     try:
         data = request.json
         role_id = int(data.get('role_id'))
         
-        if not bot.guilds:
+        gateway = gateway_info()
+        if not gateway["guilds"]:
             return jsonify({"success": False, "error": "Bot is not connected to any servers"})
         
-        if not bot.is_ready():
+        if not gateway["ready"]:
             return jsonify({"success": False, "error": "Bot is not ready yet. Please wait a moment and try again."})
         
-        # Create operation ID
-        operation_id = str(uuid.uuid4())
-        
-        # Queue the operation
-        operation = {
-            'id': operation_id,
-            'type': 'test_dm_permissions',
-            'data': {
-                'role_id': role_id
-            }
-        }
-        
-        operation_queue.put(operation)
-        print(f"🔍 Queued Test DM Permissions operation: {operation_id}")
-        
-        # Wait for result (with timeout)
-        timeout = 30  # 30 seconds timeout
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            if operation_id in operation_results:
-                result = operation_results.pop(operation_id)
-                return jsonify(result)
-            time.sleep(0.1)
-        
-        return jsonify({"success": False, "error": "Operation timeout"})
+        return jsonify(run_operation('test_dm_permissions', {'role_id': role_id}))
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/optouts')
+@route('/api/optouts')
 def api_optouts():
     """Get opt-out statistics"""
     try:
-        conn = sqlite3.connect('marketing_bot.db')
-        cursor = conn.cursor()
-        
-        # Total opt-outs
-        cursor.execute('SELECT COUNT(*) FROM marketing_opt_outs')
-        total_optouts = cursor.fetchone()[0]
-        
-        # This week opt-outs
-        cursor.execute('''
-            SELECT COUNT(*) FROM marketing_opt_outs 
-            WHERE created_at >= datetime('now', '-7 days')
-        ''')
-        this_week_optouts = cursor.fetchone()[0]
-        
-        # Get opt-out list
-        cursor.execute('''
-            SELECT user_id, username, created_at 
-            FROM marketing_opt_outs 
-            ORDER BY created_at DESC
-        ''')
-        optouts = cursor.fetchall()
-        
-        conn.close()
-        
-        return jsonify({
-            "success": True,
-            "total_optouts": total_optouts,
-            "this_week_optouts": this_week_optouts,
-            "optouts": [{
-                "user_id": row[0],
-                "username": row[1],
-                "created_at": row[2]
-            } for row in optouts]
-        })
-        
+        return paged_response(optouts_page)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/optouts/export')
+@route('/api/optouts/export')
 def api_optouts_export():
-    """Export opt-out data as CSV"""
-    try:
-        conn = sqlite3.connect('marketing_bot.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT user_id, username, opt_out_type, created_at 
-            FROM marketing_opt_outs 
-            ORDER BY created_at DESC
-        ''')
-        optouts = cursor.fetchall()
-        conn.close()
-        
-        # Create CSV data
-        csv_data = "User ID,Username,Opt-Out Type,Created At\n"
-        for row in optouts:
-            csv_data += f"{row[0]},{row[1]},{row[2]},{row[3]}\n"
-        
-        return jsonify({
-            "success": True,
-            "csv_data": csv_data,
-            "filename": f"optouts_{int(time.time())}.csv"
-        })
-        
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+    """Stream opt-out data as CSV or NDJSON"""
+    rows = iter_query_chunks(db_connect, '''
+        SELECT user_id, username, opt_out_type, created_at 
+        FROM marketing_opt_outs 
+        ORDER BY created_at DESC
+    ''')
+    return export_response(rows, ["User ID", "Username", "Opt-Out Type", "Created At"], "optouts")
 
-@app.route('/api/optouts/<user_id>', methods=['DELETE'])
+@route('/api/optouts/<user_id>', methods=['DELETE'])
 def api_delete_optout(user_id):
     """Remove an opt-out"""
     try:
-        conn = sqlite3.connect('marketing_bot.db')
+        conn = db_connect()
         cursor = conn.cursor()
         
         # Delete the opt-out
@@ -2140,13 +4920,14 @@ def api_delete_optout(user_id):
         
         conn.commit()
         conn.close()
+        notify_change("optouts", removed_user_id=user_id)
         
         return jsonify({"success": True, "message": "Opt-out removed successfully!"})
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/campaigns', methods=['GET', 'POST'])
+@route('/api/campaigns', methods=['GET', 'POST'])
 def api_campaigns():
     """Get or create marketing campaigns"""
     if request.method == 'POST':
@@ -2155,42 +4936,11 @@ def api_campaigns():
     else:
         # Return existing campaigns
         try:
-            conn = sqlite3.connect('marketing_bot.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM marketing_campaigns')
-            campaigns = cursor.fetchall()
-            conn.close()
-            
-            def format_interval(minutes):
-                if minutes == 0:
-                    return "once"
-                elif minutes < 60:
-                    return f"{minutes}min"
-                elif minutes < 1440:  # Less than 24 hours
-                    hours = minutes // 60
-                    return f"{hours}h"
-                else:
-                    days = minutes // 1440
-                    return f"{days}d"
-            
-            return jsonify([{
-                "id": row[0],
-                "key": row[1],  # campaign_id
-                "name": row[2],
-                "message": row[3],
-                "channel_id": row[4],
-                "interval": format_interval(row[5]),  # interval_minutes formatted
-                "is_active": bool(row[6]),
-                "role_names": row[7].split(',') if row[7] else [],  # role_names
-                "claim": bool(row[8]) if len(row) > 8 else False,  # claim
-                "claim_role": row[9] if len(row) > 9 else '',  # claim_role
-                "include_server_logo": bool(row[10]) if len(row) > 10 else False  # include_server_logo
-            } for row in campaigns if row[6]])  # Only return active campaigns
-            
+            return paged_response(campaigns_page)
         except Exception as e:
             return jsonify({"success": False, "error": str(e)})
 
-@app.route('/api/stop_campaign', methods=['POST'])
+@route('/api/stop_campaign', methods=['POST'])
 def api_stop_campaign():
     """Stop a marketing campaign"""
     try:
@@ -2200,7 +4950,7 @@ def api_stop_campaign():
         if not campaign_key:
             return jsonify({"success": False, "error": "Campaign key is required"})
         
-        conn = sqlite3.connect('marketing_bot.db')
+        conn = db_connect()
         cursor = conn.cursor()
         
         # Deactivate the campaign
@@ -2212,33 +4962,185 @@ def api_stop_campaign():
         
         conn.commit()
         conn.close()
+        notify_change("campaigns", key=campaign_key, is_active=False)
         
         return jsonify({"success": True, "message": "Campaign stopped successfully!"})
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+# Module loaded: everything above is import-time cost
+startup_phase("imports")
+
 # Run functions
+async def graceful_shutdown(error=None):
+    """Stop taking work, let in-flight sends finish or checkpoint, then release resources"""
+    print("🛑 Bot shutting down...")
+    
+    # No new dashboard operations
+    if ipc_server is not None:
+        ipc_server.close()
+    
+    # Services finish their current send and checkpoint while the connection is still up
+    await supervisor.stop(timeout=SHUTDOWN_TIMEOUT)
+    
+    # Log shutdown to web dashboard while the loop and session are alive
+    if error is None:
+        await log_activity("shutdown", success=True)
+        await update_bot_status("paused", "Bot shutting down")
+    else:
+        await log_activity("error", success=False, error_message=str(error))
+    await close_api_session()
+    shutdown_process_pool()
+    trace_exporter.flush()
+    if gateway_recorder is not None:
+        gateway_recorder.close()
+    flush_logs()
+
+async def run_bot_async():
+    global bot_loop
+    bot_loop = (asyncio.get_running_loop(), threading.get_ident())
+    stop_requested = asyncio.Event()
+    if threading.current_thread() is threading.main_thread():
+        # Railway sends SIGTERM on every deploy
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop_requested.set)
+    
+    async with bot:
+        gateway = asyncio.ensure_future(bot.start(DISCORD_BOT_TOKEN))
+        stop = asyncio.ensure_future(stop_requested.wait())
+        done, _ = await asyncio.wait({gateway, stop}, return_when=asyncio.FIRST_COMPLETED)
+        stop.cancel()
+        error = gateway.exception() if gateway in done else None
+        await graceful_shutdown(error)
+    
+    if error is not None:
+        raise error
+
+def start_metrics_server():
+    """Serve /metrics on METRICS_PORT from a daemon thread, for processes without a dashboard"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass  # A scrape every few seconds would drown out the bot's own output
+    
+    port = METRICS_PORT + (CLUSTER_ID or 0)
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Metrics at http://0.0.0.0:{port}/metrics")
+
 def run_bot():
     try:
-        bot.run(DISCORD_BOT_TOKEN)
-    except KeyboardInterrupt:
-        print("🛑 Bot shutting down...")
-        # Log shutdown to web dashboard
-        asyncio.run(log_activity("shutdown", success=True))
-        asyncio.run(update_bot_status("paused", "Bot shutting down"))
+        discord.utils.setup_logging()
+        init_database()
+        startup_phase("database")
+        if METRICS_PORT:
+            start_metrics_server()
+        asyncio.run(run_bot_async())
     except Exception as e:
         print(f"❌ Bot error: {e}")
-        # Log error to web dashboard
-        asyncio.run(log_activity("error", success=False, error_message=str(e)))
 
 def run_dashboard():
     port = int(os.environ.get('PORT', 5000))
+    create_app()
+    get_dashboard_build()
+    start_database_jobs()
     app.run(host='0.0.0.0', port=port, debug=False)
 
+def run_gateway():
+    """Run the bot as its own process, serving dashboards over IPC"""
+    change_feed.version = int(time.time() * 1000)  # Event IDs keep increasing across restarts
+    run_bot()
+
+def run_cluster_launcher():
+    """Run one gateway process per shard cluster, restarting any that exit"""
+    def start_cluster(cluster_id):
+        shard_ids = cluster_shard_ids(cluster_id)
+        print(f"🚀 Starting cluster {cluster_id} with shards {shard_ids}")
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=dict(
+            os.environ,
+            BOT_MODE='gateway',
+            CLUSTER_ID=str(cluster_id),
+            SHARD_IDS=','.join(str(shard_id) for shard_id in shard_ids)
+        ))
+    
+    # SIGTERM unwinds through the finally below, which passes it on to every cluster
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    clusters = {cluster_id: start_cluster(cluster_id) for cluster_id in range(SHARD_CLUSTERS)}
+    try:
+        while True:
+            time.sleep(5)
+            for cluster_id, process in list(clusters.items()):
+                if process.poll() is not None:
+                    print(f"❌ Cluster {cluster_id} exited with code {process.returncode}, restarting")
+                    clusters[cluster_id] = start_cluster(cluster_id)
+    finally:
+        for process in clusters.values():
+            process.terminate()
+        for process in clusters.values():
+            process.wait(timeout=SHUTDOWN_TIMEOUT + 10)
+
+def dashboard_app():
+    """WSGI entry point for the dashboard process, e.g. gunicorn 'bot:dashboard_app()'"""
+    create_app()
+    get_dashboard_build()
+    if BOT_MODE == 'dashboard':
+        threading.Thread(target=follow_gateway, daemon=True).start()
+    return app
+
+def dashboard_command():
+    port = int(os.environ.get('PORT', 5000))
+    return [
+        sys.executable, '-m', 'gunicorn',
+        '--workers', str(DASHBOARD_WORKERS),
+        '--worker-class', 'gthread',
+        '--threads', str(DASHBOARD_THREADS),
+        '--bind', f'0.0.0.0:{port}',
+        '--chdir', os.path.dirname(os.path.abspath(__file__)),
+        'bot:dashboard_app()'
+    ]
+
 if __name__ == "__main__":
+    if BOT_MODE in ('gateway', 'split') and SHARD_CLUSTERS > 1 and CLUSTER_ID is None:
+        dashboard_process = None
+        if BOT_MODE == 'split':
+            dashboard_process = subprocess.Popen(dashboard_command(), env=dict(os.environ, BOT_MODE='dashboard'))
+        try:
+            run_cluster_launcher()
+        finally:
+            if dashboard_process:
+                dashboard_process.terminate()
+                dashboard_process.wait(timeout=10)
+    elif BOT_MODE == 'gateway':
+        print(f"🚀 Starting gateway process (IPC at {ipc_socket_path()})...")
+        run_gateway()
+    elif BOT_MODE == 'dashboard':
+        print(f"🌐 Starting dashboard with {DASHBOARD_WORKERS} workers...")
+        os.execv(sys.executable, dashboard_command())
+    elif BOT_MODE == 'split':
+        print("🚀 Starting gateway and dashboard processes...")
+        dashboard_process = subprocess.Popen(dashboard_command(), env=dict(os.environ, BOT_MODE='dashboard'))
+        try:
+            run_gateway()
+        finally:
+            dashboard_process.terminate()
+            dashboard_process.wait(timeout=10)
     # Check if running on Railway (production) or locally
-    if os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('PORT'):
+    elif os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('PORT'):
         print("🚀 Starting bot on Railway...")
         # On Railway, just run the bot (no dashboard)
         run_bot()
@@ -1,2 +1,2 @@
 #!/bin/bash
-python bot.py
+exec python bot.py
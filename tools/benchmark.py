@@ -0,0 +1,338 @@
+"""Offline throughput benchmark for campaigns, Quick DM and dashboard message templates
+
+    python tools/benchmark.py
+    python tools/benchmark.py --members 5000 --scenarios campaign,quick_dm
+    python tools/benchmark.py --json results.json --baseline baseline.json --tolerance 0.2
+
+Starts tools/mock_discord.py in this process and runs every scenario in a fresh
+bot process pointed at it, so each one goes through the real gateway login,
+services and send path. Reports messages per second, p50/p99 send latency and
+peak memory per scenario. With --baseline it exits non-zero when throughput or
+p99 latency regress by more than --tolerance, so it can gate CI.
+
+Scenarios:
+  campaign   a one-time campaign to every member, run by handle_marketing_campaigns
+  quick_dm   a Quick DM to every member, queued like the dashboard does
+  template   dashboard message templates sent by main_bot_loop to --sample-members
+  role_dm    --sample-members gain a role with a role DM, sent by the role DM workers
+  cluster_campaign
+             the campaign with SHARD_CLUSTERS=2: members are split between two guilds
+             on different shards, and the second cluster runs in its own process
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+from mock_discord import MockDiscord, BENCH_ROLE_ID, GUILD_ID  # noqa: E402
+
+SCENARIOS = ('campaign', 'quick_dm', 'template', 'role_dm', 'cluster_campaign')
+CAMPAIGN_SCENARIOS = ('campaign', 'cluster_campaign')
+ROLE_DM_ROLE_ID = GUILD_ID + 3
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+
+# Bot process side
+def run_scenario(scenario, result_path, expected, timeout):
+    """Run one scenario inside this (fresh) bot process and write its measurements"""
+    sys.path.insert(0, REPO_DIR)
+    import bot as marketing_bot
+
+    sends = []
+    record_dm_send = marketing_bot.record_dm_send
+
+    def record(kind, status, started, campaign=''):
+        sends.append((status, started, time.perf_counter()))
+        record_dm_send(kind, status, started, campaign)
+
+    marketing_bot.record_dm_send = record
+    marketing_bot.init_database()
+    if scenario in CAMPAIGN_SCENARIOS:
+        conn = marketing_bot.db_connect()
+        conn.execute('''
+            INSERT INTO marketing_campaigns (campaign_id, name, message, channel_id, interval_minutes, is_active, role_names, claim, claim_role, include_server_logo)
+            VALUES ('benchmark', 'Benchmark', 'Benchmark campaign message', '', 0, 1, 'Bench', 0, '', 0)
+        ''')
+        conn.commit()
+        conn.close()
+    elif scenario == 'role_dm':
+        conn = marketing_bot.db_connect()
+        conn.execute("INSERT INTO role_dms (role_id, role_name, dm_title, dm_message) VALUES (?, 'BenchRoleDM', 'Benchmark', 'Benchmark role DM')", (str(ROLE_DM_ROLE_ID),))
+        conn.commit()
+        conn.close()
+
+    async def finished():
+        if scenario in CAMPAIGN_SCENARIOS:
+            conn = marketing_bot.db_connect()
+            try:
+                row = conn.execute("SELECT finished_at FROM campaign_runs WHERE campaign_id = 'benchmark'").fetchone()
+            finally:
+                conn.close()
+            return bool(row and row[0])
+        if scenario == 'quick_dm':
+            return operation_id in marketing_bot.operation_results
+        return len(sends) >= expected
+
+    async def main():
+        nonlocal operation_id
+        runner = asyncio.ensure_future(marketing_bot.run_bot_async())
+        deadline = time.monotonic() + timeout
+        while not marketing_bot.bot.is_ready():
+            if runner.done() or time.monotonic() > deadline:
+                raise RuntimeError("Bot never became ready")
+            await asyncio.sleep(0.05)
+        # With MEMBER_CACHE=compact role changes are only seen once the guild is indexed
+        while marketing_bot.MEMBER_CACHE == 'compact' and any(guild.id not in marketing_bot.member_index.guilds for guild in marketing_bot.bot.guilds):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Members were never indexed")
+            await asyncio.sleep(0.05)
+        ready_rss = current_rss()
+        open('ready', 'w').close()
+        if scenario == 'quick_dm':
+            operation_id = marketing_bot.queue_operation('quick_dm', {'role_id': str(BENCH_ROLE_ID), 'title': '', 'message': 'Benchmark Quick DM', 'include_logo': False})
+        while not await finished():
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Scenario {scenario} did not finish within {timeout}s")
+            await asyncio.sleep(0.05)
+        if scenario in CAMPAIGN_SCENARIOS and len(sends) < expected:
+            raise RuntimeError(f"Campaign finished after reaching {len(sends)} of {expected} members")
+        # Shut down the way Railway does, through the SIGTERM drain
+        signal.raise_signal(signal.SIGTERM)
+        await runner
+        return ready_rss
+
+    operation_id = None
+    ready_rss = asyncio.run(main())
+
+    delivered = [end - started for status, started, end in sends if status == 'sent']
+    duration = (max(end for _, _, end in sends) - min(started for _, started, _ in sends)) if sends else 0
+    result = {
+        "scenario": scenario,
+        "attempts": len(sends),
+        "sent": len(delivered),
+        "dm_disabled": sum(1 for status, _, _ in sends if status == 'dm_disabled'),
+        "errors": sum(1 for status, _, _ in sends if status == 'error'),
+        "duration": round(duration, 3),
+        "messages_per_second": round(len(delivered) / duration, 2) if duration else 0,
+        "p50_ms": round(percentile(delivered, 0.5) * 1000, 1) if delivered else None,
+        "p99_ms": round(percentile(delivered, 0.99) * 1000, 1) if delivered else None,
+        "ready_rss_mb": round(ready_rss / 1024 / 1024, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+    with open(result_path, 'w') as f:
+        json.dump(result, f)
+
+
+def current_rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+# Harness side
+def cluster_ready(socket_path):
+    """Whether the gateway process serving `socket_path` reports itself ready"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(socket_path)
+            sock.sendall(b'{"method": "health"}\n')
+            return json.loads(sock.makefile('rb').readline())["gateway"]["ready"]
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+async def grant_role(mock, count, role_id):
+    """Dispatch a member update giving each of the first `count` members `role_id`"""
+    for index in range(count):
+        member = mock.member_payload(index)
+        member["roles"].append(str(role_id))
+        await mock.dispatch("GUILD_MEMBER_UPDATE", dict(member, guild_id=str(GUILD_ID)))
+
+
+class MockThread:
+    """Runs the mock Discord server on its own event loop so bot processes can be driven synchronously"""
+
+    def __init__(self, mock):
+        self.mock = mock
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.mock.start(), self.loop).result()
+        return self.mock
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.mock.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def run_benchmark(args):
+    mock = MockDiscord(members=args.members, sample_members=args.sample_members, latency=args.latency_ms / 1000,
+                       global_limit=args.global_limit, forbidden_rate=args.forbidden_rate, rate_limit_rate=args.rate_limit_rate,
+                       roles=[[ROLE_DM_ROLE_ID, "BenchRoleDM", 3]])
+    results = []
+    mock_thread = MockThread(mock)
+    with mock_thread, tempfile.TemporaryDirectory() as workdir:
+        for scenario in args.scenarios:
+            bot_id = f"benchmark-{scenario}"
+            if scenario == 'template':
+                mock.configs[bot_id] = {"active": True, "config": {
+                    "message_templates": [{"message": "Hi {username}, benchmark message from {server_name}"}],
+                    "target_roles": ["BenchSample"],
+                    "affiliate_id": "benchmark"
+                }}
+            scenario_dir = os.path.join(workdir, scenario)
+            os.makedirs(scenario_dir)
+            result_path = os.path.join(scenario_dir, 'result.json')
+            env = dict(
+                os.environ,
+                DISCORD_BOT_TOKEN='mock-token',
+                DISCORD_API_BASE=mock.url,
+                API_BASE_URL=mock.url,
+                BOT_ID=bot_id,
+                BOT_MODE='gateway',
+                IPC_SOCKET=os.path.join(scenario_dir, 'ipc.sock'),
+                DATABASE_PATH=os.path.join(scenario_dir, 'marketing_bot.db'),
+                TRACKING_DIR=os.path.join(scenario_dir, 'tracking'),
+                MEDIA_DIR=os.path.join(scenario_dir, 'media'),
+                MEMBER_CACHE=args.member_cache
+            )
+            env.pop('METRICS_PORT', None)
+            expected = mock.sample_members if scenario in ('template', 'role_dm') else mock.members
+
+            print(f"⏱️ Running {scenario} against {args.members} members...")
+            mock.stats.clear()
+            cluster = None
+            if scenario == 'cluster_campaign':
+                # Cluster 1 runs bot.py as the launcher would; the measured process below is cluster 0
+                env.update(SHARD_COUNT='2', SHARD_CLUSTERS='2', CLUSTER_ID='0', SHARD_IDS='0')
+                cluster = subprocess.Popen(
+                    [sys.executable, os.path.join(REPO_DIR, 'bot.py')],
+                    env=dict(env, CLUSTER_ID='1', SHARD_IDS='1'), cwd=scenario_dir,
+                    stdout=None if args.verbose else subprocess.DEVNULL,
+                    stderr=None if args.verbose else subprocess.DEVNULL
+                )
+                deadline = time.monotonic() + args.timeout
+                while not cluster_ready(env['IPC_SOCKET'] + '.1') and cluster.poll() is None and time.monotonic() < deadline:
+                    time.sleep(0.1)
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--run-scenario', scenario, '--result', result_path,
+                 '--expected', str(expected), '--timeout', str(args.timeout)],
+                env=env, cwd=scenario_dir,
+                stdout=None if args.verbose else subprocess.DEVNULL,
+                stderr=None if args.verbose else subprocess.PIPE
+            )
+            if scenario == 'role_dm':
+                while not os.path.exists(os.path.join(scenario_dir, 'ready')) and process.poll() is None:
+                    time.sleep(0.1)
+                if process.poll() is None:
+                    asyncio.run_coroutine_threadsafe(grant_role(mock, expected, ROLE_DM_ROLE_ID), mock_thread.loop).result()
+            _, stderr = process.communicate()
+            if cluster:
+                cluster.terminate()
+                cluster.wait()
+            if process.returncode != 0 or not os.path.exists(result_path):
+                print(f"❌ Scenario {scenario} failed (exit {process.returncode})")
+                if stderr:
+                    print(stderr.decode('utf-8', 'replace')[-2000:])
+                results.append({"scenario": scenario, "failed": True})
+                continue
+            with open(result_path) as f:
+                result = json.load(f)
+            result["rate_limited"] = sum(count for key, count in mock.stats.items() if key.startswith('429_'))
+            results.append(result)
+    return results
+
+
+def print_results(results):
+    print(f"{'scenario':<16} {'sent':>7} {'no DMs':>7} {'errors':>7} {'429s':>6} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'peak MB':>8}")
+    for result in results:
+        if result.get("failed"):
+            print(f"{result['scenario']:<16} failed")
+            continue
+        print(f"{result['scenario']:<16} {result['sent']:>7} {result['dm_disabled']:>7} {result['errors']:>7} {result['rate_limited']:>6} "
+              f"{result['messages_per_second']:>8} {result['p50_ms'] or '-':>8} {result['p99_ms'] or '-':>8} {result['peak_rss_mb']:>8}")
+
+
+def regressions(results, baseline, tolerance):
+    """Describe every scenario that is slower than `baseline` by more than `tolerance`"""
+    previous = {result["scenario"]: result for result in baseline.get("results", [])}
+    problems = []
+    for result in results:
+        before = previous.get(result["scenario"])
+        if result.get("failed"):
+            problems.append(f"{result['scenario']} failed")
+        elif before and not before.get("failed"):
+            if result["messages_per_second"] < before["messages_per_second"] * (1 - tolerance):
+                problems.append(f"{result['scenario']} throughput {result['messages_per_second']} msg/s vs {before['messages_per_second']} baseline")
+            if before.get("p99_ms") and result["p99_ms"] and result["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+                problems.append(f"{result['scenario']} p99 {result['p99_ms']} ms vs {before['p99_ms']} ms baseline")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__.split('\n\n', 1)[1])
+    parser.add_argument('--scenarios', type=lambda value: value.split(','), default=list(SCENARIOS))
+    parser.add_argument('--members', type=int, default=500, help='synthetic guild size')
+    parser.add_argument('--sample-members', type=int, default=10, help='members the template scenario messages (it sends one per second)')
+    parser.add_argument('--member-cache', choices=('full', 'compact'), default='full')
+    parser.add_argument('--latency-ms', type=float, default=30, help='mean mock REST latency')
+    parser.add_argument('--global-limit', type=int, default=50, help='requests per second before global 429s')
+    parser.add_argument('--forbidden-rate', type=float, default=0.02, help='share of members with DMs disabled')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.01, help='share of sends answered with a shared 429')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds per scenario')
+    parser.add_argument('--json', help='write the results here')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression against the baseline')
+    parser.add_argument('--verbose', action='store_true', help="show the bot processes' output")
+    parser.add_argument('--run-scenario', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    parser.add_argument('--expected', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        run_scenario(args.run_scenario, args.result, args.expected, args.timeout)
+        return
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = run_benchmark(args)
+    print_results(results)
+    settings = {key: getattr(args, key) for key in ('members', 'sample_members', 'member_cache', 'latency_ms', 'global_limit', 'forbidden_rate', 'rate_limit_rate')}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+
+    problems = [f"{result['scenario']} failed" for result in results if result.get("failed")]
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = regressions(results, json.load(f), args.tolerance)
+    for problem in problems:
+        print(f"❌ {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+"""HTTP load test for the dashboard API
+
+    python tools/loadtest.py
+    python tools/loadtest.py --tracking-rows 5000000 --concurrency 64 --duration 30
+    python tools/loadtest.py --mode all --json results.json --compare previous.json
+    python tools/loadtest.py --target http://localhost:5000 --scenarios roles,optouts
+
+Seeds a database with --tracking-rows tracking events (kept in --data-dir and
+reused while the seed settings match), starts the bot against
+tools/mock_discord.py with the dashboard served the way --mode deploys it
+(split: gunicorn workers plus a gateway process; all: the single-process Flask
+dev server) and drives each scenario for --duration seconds from --concurrency
+clients. Reports requests per second, latency percentiles, errors and SQLite
+lock errors per endpoint, and saves them as JSON to compare runs over time.
+
+Scenarios: track_interaction, analytics_overview, optouts, roles, quick_dm, and
+mixed, a dashboard-like blend of all five.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import aiohttp
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+from mock_discord import MockDiscord, FIRST_MEMBER_ID, GUILD_ID, SAMPLE_ROLE_ID  # noqa: E402
+from benchmark import MockThread, percentile  # noqa: E402
+
+INTERACTION_TYPES = ('button_click', 'link_click', 'dm_open', 'command', 'reaction')
+TRACKED_USERS = 50000
+
+
+# Request scripts: each returns (endpoint, method, path, json body)
+def track_interaction(rng):
+    user = rng.randrange(TRACKED_USERS)
+    return ('POST /api/track-interaction', 'POST', '/api/track-interaction', {
+        "user_id": str(FIRST_MEMBER_ID + user),
+        "user_name": f"member{user}",
+        "interaction_type": rng.choice(INTERACTION_TYPES),
+        "interaction_data": {"source": "loadtest"},
+        "server_id": str(GUILD_ID)
+    })
+
+
+def analytics_overview(rng):
+    return ('GET /api/analytics/overview', 'GET', '/api/analytics/overview', None)
+
+
+def optouts(rng):
+    return ('GET /api/optouts', 'GET', '/api/optouts?limit=50', None)
+
+
+def roles(rng):
+    return ('GET /api/roles', 'GET', '/api/roles', None)
+
+
+def quick_dm(rng):
+    # BenchSample keeps each Quick DM to a handful of mock members
+    return ('POST /api/quick-dm', 'POST', '/api/quick-dm', {"role_id": str(SAMPLE_ROLE_ID), "title": "", "message": "Load test"})
+
+
+SCENARIOS = {
+    'track_interaction': [(1, track_interaction)],
+    'analytics_overview': [(1, analytics_overview)],
+    'optouts': [(1, optouts)],
+    'roles': [(1, roles)],
+    'quick_dm': [(1, quick_dm)],
+    'mixed': [(70, track_interaction), (14, roles), (10, optouts), (5, analytics_overview), (1, quick_dm)],
+}
+
+
+# Seeding (runs in a subprocess that imports the bot)
+def seed_database(tracking_rows, opt_outs):
+    sys.path.insert(0, REPO_DIR)
+    import bot as marketing_bot
+
+    marketing_bot.init_database()
+    rng = random.Random(1)
+    now = datetime.utcnow()
+    months = []
+    for offset in range(marketing_bot.TRACKING_RAW_MONTHS):
+        year, month = divmod(now.year * 12 + now.month - 1 - offset, 12)
+        months.append((year, month + 1))
+
+    for index, (year, month) in enumerate(months):
+        rows_in_month = tracking_rows // len(months) + (tracking_rows % len(months) if index == 0 else 0)
+        last_day = now.day if (year, month) == (now.year, now.month) else 28
+        conn = marketing_bot.tracking_connect(marketing_bot.tracking_partition_name(datetime(year, month, 1)))
+        for start in range(0, rows_in_month, 50000):
+            rows = []
+            for _ in range(min(50000, rows_in_month - start)):
+                user = rng.randrange(TRACKED_USERS)
+                timestamp = f"{year:04d}-{month:02d}-{rng.randint(1, last_day):02d} {rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+                rows.append((str(FIRST_MEMBER_ID + user), f"member{user}", rng.choice(INTERACTION_TYPES), '{"source": "seed"}',
+                             str(GUILD_ID), None, None, timestamp, '127.0.0.1', 'loadtest-seed', f"seed-{user}"))
+            conn.executemany('''
+                INSERT INTO user_tracking (user_id, user_name, interaction_type, interaction_data, server_id, channel_id, message_id, timestamp, ip_address, user_agent, session_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+        conn.close()
+        print(f"📦 Seeded {rows_in_month} tracking rows for {year:04d}-{month:02d}")
+
+    conn = marketing_bot.db_connect()
+    conn.executemany('INSERT OR IGNORE INTO marketing_opt_outs (user_id, username, opt_out_type) VALUES (?, ?, ?)',
+                     [(str(FIRST_MEMBER_ID + user), f"member{user}", 'marketing') for user in range(opt_outs)])
+    conn.executemany('INSERT INTO link_analytics (link_url, link_type, click_count, unique_clicks, first_clicked, last_clicked) VALUES (?, ?, ?, ?, ?, ?)',
+                     [(f"https://example.com/{n}", 'affiliate', rng.randrange(10000), rng.randrange(1000), '2024-01-01', '2024-06-01') for n in range(200)])
+    conn.executemany('INSERT INTO button_analytics (button_id, button_text, button_type, click_count, unique_clicks, first_clicked, last_clicked) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     [(f"button_{n}", f"Button {n}", 'claim', rng.randrange(10000), rng.randrange(1000), '2024-01-01', '2024-06-01') for n in range(200)])
+    conn.commit()
+    conn.close()
+    print(f"📦 Seeded {opt_outs} opt-outs")
+
+
+def prepare_data(args, env):
+    """Seed --data-dir unless it already holds a seed with the same settings"""
+    marker_path = os.path.join(args.data_dir, 'seed.json')
+    seed = {"tracking_rows": args.tracking_rows, "opt_outs": args.opt_outs}
+    if os.path.exists(marker_path):
+        with open(marker_path) as f:
+            if json.load(f) == seed:
+                print(f"📦 Reusing seeded data in {args.data_dir}")
+                return
+    for name in os.listdir(args.data_dir):
+        if name in ('marketing_bot.db', 'marketing_bot.db-wal', 'marketing_bot.db-shm', 'tracking', 'seed.json'):
+            path = os.path.join(args.data_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    started = time.monotonic()
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--seed', '--tracking-rows', str(args.tracking_rows), '--opt-outs', str(args.opt_outs)],
+                   env=dict(env, BOT_MODE='dashboard'), cwd=args.data_dir, check=True)
+    with open(marker_path, 'w') as f:
+        json.dump(seed, f)
+    print(f"📦 Seeding took {time.monotonic() - started:.1f}s")
+
+
+# Server under test
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, env, log):
+    port = free_port()
+    env = dict(env, PORT=str(port), DASHBOARD_WORKERS=str(args.workers))
+    if args.mode == 'split':
+        command = [sys.executable, os.path.join(REPO_DIR, 'bot.py')]
+        env['BOT_MODE'] = 'split'
+    else:
+        # What `python bot.py` does locally: the bot in a thread next to the Flask dev server
+        command = [sys.executable, '-c', f"import sys, threading; sys.path.insert(0, {REPO_DIR!r}); import bot; "
+                   "threading.Thread(target=bot.run_bot, daemon=True).start(); bot.run_dashboard()"]
+        env['BOT_MODE'] = 'all'
+    process = subprocess.Popen(command, env=env, cwd=args.data_dir, stdout=log, stderr=subprocess.STDOUT)
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_until_ready(base_url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                async with session.get(f"{base_url}/api/health") as response:
+                    health = await response.json(content_type=None)
+                    if health.get("gateway", {}).get("ready"):
+                        return
+            except (aiohttp.ClientError, ValueError):
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"Dashboard at {base_url} was not ready within {timeout}s")
+
+
+# Load generation
+async def client(session, base_url, script, deadline, rng, samples):
+    weights = [weight for weight, _ in script]
+    requests = [request for _, request in script]
+    while time.monotonic() < deadline:
+        endpoint, method, path, body = rng.choices(requests, weights)[0](rng)
+        started = time.perf_counter()
+        status, error = 0, None
+        try:
+            async with session.request(method, base_url + path, json=body) as response:
+                status = response.status
+                text = await response.text()
+            if status >= 400:
+                error = f"HTTP {status}"
+            if response.content_type == 'application/json':
+                data = json.loads(text)
+                if isinstance(data, dict) and data.get("success") is False:
+                    error = data.get("error") or "success: false"
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            error = f"{type(e).__name__}: {e}"
+        samples.append((endpoint, time.perf_counter() - started, status, error))
+
+
+def log_size(path):
+    return os.path.getsize(path) if path and os.path.exists(path) else 0
+
+
+def count_lock_errors(path, offset):
+    """'database is locked' tracebacks the server logged since `offset`"""
+    if not path:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read().count(b'database is locked')
+
+
+async def run_scenario(name, base_url, args, log_path):
+    samples = []
+    offset = log_size(log_path)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=args.request_timeout)) as session:
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(client(session, base_url, SCENARIOS[name], deadline, random.Random(n), samples) for n in range(args.concurrency)))
+        elapsed = time.monotonic() - started
+
+    endpoints = []
+    for endpoint in sorted({sample[0] for sample in samples}):
+        own = [sample for sample in samples if sample[0] == endpoint]
+        latencies = [sample[1] for sample in own]
+        errors = [sample[3] for sample in own if sample[3]]
+        endpoints.append({
+            "endpoint": endpoint,
+            "requests": len(own),
+            "requests_per_second": round(len(own) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+            "p90_ms": round(percentile(latencies, 0.9) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "max_ms": round(max(latencies) * 1000, 1),
+            "errors": len(errors),
+            "lock_errors": sum(1 for error in errors if 'locked' in error),
+            "sample_errors": sorted(set(errors))[:3]
+        })
+    return {
+        "scenario": name,
+        "duration": round(elapsed, 2),
+        "concurrency": args.concurrency,
+        "requests": len(samples),
+        "requests_per_second": round(len(samples) / elapsed, 1),
+        "server_lock_errors": count_lock_errors(log_path, offset),
+        "endpoints": endpoints
+    }
+
+
+def print_scenario(result, previous=None):
+    before = {}
+    if previous:
+        before = {endpoint["endpoint"]: endpoint for endpoint in previous.get("endpoints", [])}
+    print(f"\n📊 {result['scenario']}: {result['requests_per_second']} req/s over {result['duration']}s, "
+          f"{result['server_lock_errors'] if result['server_lock_errors'] is not None else '?'} lock errors in the server log")
+    print(f"  {'endpoint':<30} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7} {'locked':>7}")
+    for endpoint in result["endpoints"]:
+        line = (f"  {endpoint['endpoint']:<30} {endpoint['requests_per_second']:>8} {endpoint['p50_ms']:>8} {endpoint['p90_ms']:>8} "
+                f"{endpoint['p99_ms']:>8} {endpoint['max_ms']:>8} {endpoint['errors']:>7} {endpoint['lock_errors']:>7}")
+        old = before.get(endpoint["endpoint"])
+        if old:
+            line += f"   (was {old['requests_per_second']} req/s, p99 {old['p99_ms']} ms)"
+        print(line)
+        for error in endpoint["sample_errors"]:
+            print(f"      ⚠️ {error[:120]}")
+
+
+async def run_load(args, base_url, log_path):
+    await wait_until_ready(base_url, None)
+    results = []
+    for name in args.scenarios:
+        print(f"⏱️ Running {name} for {args.duration}s with {args.concurrency} clients...")
+        results.append(await run_scenario(name, base_url, args, log_path))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__.split('\n\n', 1)[1])
+    parser.add_argument('--scenarios', type=lambda value: value.split(','), default=['track_interaction', 'analytics_overview', 'optouts', 'roles', 'quick_dm', 'mixed'])
+    parser.add_argument('--duration', type=float, default=15, help='seconds per scenario')
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent clients')
+    parser.add_argument('--request-timeout', type=float, default=60)
+    parser.add_argument('--mode', choices=('split', 'all'), default='split', help='how the dashboard is served')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers in split mode')
+    parser.add_argument('--target', help='load an already running dashboard instead of starting one')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'marketing-bot-loadtest'))
+    parser.add_argument('--tracking-rows', type=int, default=2000000)
+    parser.add_argument('--opt-outs', type=int, default=20000)
+    parser.add_argument('--members', type=int, default=200, help='mock guild size')
+    parser.add_argument('--json', help='write the results here')
+    parser.add_argument('--compare', help='results file from an earlier run to show next to this one')
+    parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_database(args.tracking_rows, args.opt_outs)
+        return
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {result["scenario"]: result for result in json.load(f)["scenarios"]}
+
+    settings = {key: getattr(args, key) for key in ('mode', 'workers', 'concurrency', 'duration', 'tracking_rows', 'opt_outs', 'target')}
+    if args.target:
+        results = asyncio.run(run_load(args, args.target.rstrip('/'), None))
+    else:
+        os.makedirs(args.data_dir, exist_ok=True)
+        log_path = os.path.join(args.data_dir, 'server.log')
+        mock = MockDiscord(members=args.members, sample_members=5, latency=0.02)
+        with MockThread(mock):
+            env = dict(
+                os.environ,
+                DISCORD_BOT_TOKEN='mock-token',
+                DISCORD_API_BASE=mock.url,
+                API_BASE_URL=mock.url,
+                DATABASE_PATH=os.path.join(args.data_dir, 'marketing_bot.db'),
+                TRACKING_DIR=os.path.join(args.data_dir, 'tracking'),
+                MEDIA_DIR=os.path.join(args.data_dir, 'media'),
+                IPC_SOCKET=os.path.join(args.data_dir, 'ipc.sock'),
+                INSIGHTS_INTERVAL='3600'
+            )
+            prepare_data(args, env)
+            with open(log_path, 'ab') as log:
+                process, base_url = start_server(args, env, log)
+                print(f"🚀 Started {args.mode} dashboard at {base_url} (log: {log_path})")
+                try:
+                    asyncio.run(wait_until_ready(base_url, process))
+                    results = asyncio.run(run_load(args, base_url, log_path))
+                finally:
+                    process.send_signal(signal.SIGTERM)
+                    try:
+                        process.wait(timeout=30)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+
+    for result in results:
+        print_scenario(result, previous.get(result["scenario"]))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"settings": settings, "finished_at": datetime.utcnow().isoformat() + "Z", "scenarios": results}, f, indent=2)
+        print(f"\n💾 Results saved to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
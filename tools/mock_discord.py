@@ -0,0 +1,360 @@
+"""Local stand-in for Discord's REST API, gateway and the dashboard API
+
+Serves one synthetic guild per shard over a websocket gateway (a single shard
+gets every member; with more, members are dealt out across the shards' guilds)
+and answers the REST calls
+the bot makes when sending DMs, with Discord's rate-limit headers, a global
+requests-per-second limit, occasional 429s and 403s for members who have DMs
+disabled. Used by tools/benchmark.py, tools/loadtest.py and tools/replay.py; it
+can also be run on its own:
+
+    python tools/mock_discord.py --port 8787 --members 5000
+
+and the bot pointed at it with DISCORD_API_BASE=http://127.0.0.1:8787.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from aiohttp import web, WSMsgType
+
+APPLICATION_ID = 1000000000000000000
+BOT_USER_ID = 1000000000000000001
+GUILD_ID = 1100000000000000000
+BENCH_ROLE_ID = GUILD_ID + 1         # Every synthetic member
+SAMPLE_ROLE_ID = GUILD_ID + 2        # The first `sample_members` members
+FIRST_MEMBER_ID = 1200000000000000000
+DM_CHANNEL_OFFSET = 300000000000000000
+CHUNK_SIZE = 1000
+LARGE_THRESHOLD = 250
+
+
+def json_response(data, status=200, headers=None):
+    # discord.py only decodes bodies whose Content-Type is exactly application/json
+    return web.Response(body=json.dumps(data).encode('utf-8'), status=status, headers=headers, content_type='application/json')
+
+
+def snowflake():
+    """A snowflake for the current time, like the ones Discord assigns to messages"""
+    return str(((int(time.time() * 1000) - 1420070400000) << 22) | random.getrandbits(22))
+
+
+class MockDiscord:
+    """Synthetic guild plus the Discord and dashboard endpoints the bot uses"""
+
+    def __init__(self, members=1000, sample_members=10, latency=0.03, global_limit=50,
+                 forbidden_rate=0.02, rate_limit_rate=0.01, channel_limit=5, channel_window=5.0, roles=(), channels=()):
+        self.members = members
+        self.sample_members = min(sample_members, members)
+        self.latency = latency
+        self.global_limit = global_limit
+        self.forbidden_rate = forbidden_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.channel_limit = channel_limit
+        self.channel_window = channel_window
+        self.roles = list(roles)  # Extra [id, name, position] roles, e.g. from a gateway recording
+        self.channels = list(channels)  # Extra [id, name, type] channels
+        self.configs = {}  # bot_id -> getBotConfig response
+        self.stats = Counter()
+        self.url = None
+        self._window = [0.0, 0]  # Start and request count of the current global second
+        self._buckets = {}  # channel id -> [reset_at, remaining]
+        self._runner = None
+        self._gateways = set()  # dispatch functions of identified gateway connections
+        self._guild_shards = {GUILD_ID: (0, 1)}  # guild id -> (shard id, shard count) it was created for
+
+    # Synthetic guild
+    def user_payload(self, index):
+        return {"id": str(FIRST_MEMBER_ID + index), "username": f"member{index}", "discriminator": "0",
+                "global_name": f"Member {index}", "avatar": None, "bot": False}
+
+    def member_payload(self, index):
+        roles = [str(BENCH_ROLE_ID)]
+        if index < self.sample_members:
+            roles.append(str(SAMPLE_ROLE_ID))
+        return {"user": self.user_payload(index), "roles": roles, "nick": None, "joined_at": "2024-01-01T00:00:00+00:00",
+                "deaf": False, "mute": False, "flags": 0}
+
+    def bot_user_payload(self):
+        return {"id": str(BOT_USER_ID), "username": "Benchmark Bot", "discriminator": "0", "global_name": None,
+                "avatar": None, "bot": True, "verified": True, "mfa_enabled": False, "flags": 0}
+
+    def bot_member_payload(self):
+        return {"user": self.bot_user_payload(), "roles": [], "nick": None, "joined_at": "2024-01-01T00:00:00+00:00",
+                "deaf": False, "mute": False, "flags": 0}
+
+    def role_payload(self, role_id, name, position, permissions="0"):
+        return {"id": str(role_id), "name": name, "color": 0, "hoist": False, "position": position,
+                "permissions": permissions, "managed": False, "mentionable": False, "flags": 0}
+
+    def shard_guild_id(self, shard_id, shard_count):
+        """Id of the guild served to `shard_id`; Discord routes guild (id >> 22) % shard_count"""
+        guild_id = GUILD_ID + (((shard_id - (GUILD_ID >> 22)) % shard_count) << 22)
+        self._guild_shards[guild_id] = (shard_id, shard_count)
+        return guild_id
+
+    def guild_indexes(self, guild_id):
+        """Indexes of the synthetic members in `guild_id`"""
+        shard_id, shard_count = self._guild_shards.get(guild_id, (0, 1))
+        return range(shard_id, self.members, shard_count)
+
+    def guild_payload(self, guild_id=GUILD_ID):
+        # Like Discord, large guilds arrive without their members and are chunked on request
+        indexes = self.guild_indexes(guild_id)
+        large = len(indexes) > LARGE_THRESHOLD
+        members = [self.bot_member_payload()]
+        if not large:
+            members += [self.member_payload(index) for index in indexes]
+        return {
+            "id": str(guild_id), "name": "Benchmark Guild", "icon": None, "owner_id": str(FIRST_MEMBER_ID),
+            "roles": [
+                self.role_payload(GUILD_ID, "@everyone", 0, permissions=str((1 << 11) | (1 << 28))),
+                self.role_payload(BENCH_ROLE_ID, "Bench", 1),
+                self.role_payload(SAMPLE_ROLE_ID, "BenchSample", 2)
+            ] + [self.role_payload(role_id, name, position) for role_id, name, position in self.roles
+                 if int(role_id) not in (GUILD_ID, BENCH_ROLE_ID, SAMPLE_ROLE_ID)],
+            "channels": [{"id": str(GUILD_ID + 10), "type": 0, "name": "general", "position": 0, "permission_overwrites": []}] + [
+                {"id": str(channel_id), "type": channel_type, "name": name, "position": position + 1, "permission_overwrites": []}
+                for position, (channel_id, name, channel_type) in enumerate(self.channels)],
+            "emojis": [], "stickers": [], "features": [], "threads": [], "presences": [], "voice_states": [],
+            "stage_instances": [], "guild_scheduled_events": [], "soundboard_sounds": [],
+            "members": members, "member_count": len(indexes) + 1, "large": large, "unavailable": False,
+            "joined_at": "2024-01-01T00:00:00+00:00", "verification_level": 0, "default_message_notifications": 0,
+            "explicit_content_filter": 0, "mfa_level": 0, "premium_tier": 0, "nsfw_level": 0,
+            "preferred_locale": "en-US", "system_channel_flags": 0, "premium_progress_bar_enabled": False
+        }
+
+    def dms_disabled(self, index):
+        """Deterministic set of members who refuse DMs"""
+        return (index * 2654435761) % 10000 < self.forbidden_rate * 10000
+
+    # Server lifecycle
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_get('/gateway', self.gateway)
+        app.router.add_get('/gateway/', self.gateway)
+        app.router.add_post('/functions/{name}', self.dashboard_function)
+        app.router.add_route('*', '/api/v{version}/{path:.*}', self.rest)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{bound_port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    # Gateway
+    async def gateway(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        self.stats["gateway_connections"] += 1
+        sequence = 0
+
+        async def dispatch(event, data):
+            nonlocal sequence
+            sequence += 1
+            await ws.send_str(json.dumps({"op": 0, "t": event, "s": sequence, "d": data}))
+
+        await ws.send_str(json.dumps({"op": 10, "d": {"heartbeat_interval": 41250}}))
+        try:
+            await self.serve_gateway(ws, dispatch)
+        finally:
+            self._gateways.discard(dispatch)
+        return ws
+
+    async def serve_gateway(self, ws, dispatch):
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                break
+            payload = json.loads(message.data)
+            op = payload.get("op")
+            if op == 1:
+                await ws.send_str(json.dumps({"op": 11, "d": None}))
+            elif op == 2:
+                shard = payload["d"].get("shard") or [0, 1]
+                guild_id = self.shard_guild_id(*shard)
+                await dispatch("READY", {
+                    "v": 10, "user": self.bot_user_payload(), "session_id": "mock-session",
+                    "resume_gateway_url": self.url.replace('http', 'ws', 1) + '/gateway',
+                    "guilds": [{"id": str(guild_id), "unavailable": True}],
+                    "application": {"id": str(APPLICATION_ID), "flags": 0}, "shard": shard
+                })
+                await dispatch("GUILD_CREATE", self.guild_payload(guild_id))
+                self._gateways.add(dispatch)
+            elif op == 6:
+                await ws.send_str(json.dumps({"op": 9, "d": False}))  # No resumes: identify again
+            elif op == 8:
+                await self.send_member_chunks(payload["d"], dispatch)
+
+    async def dispatch(self, event, data):
+        """Send a dispatch to every identified gateway connection; returns how many got it"""
+        gateways = list(self._gateways)
+        for send in gateways:
+            await send(event, data)
+        self.stats[f"dispatched_{event}"] += 1
+        return len(gateways)
+
+    async def send_member_chunks(self, request, dispatch):
+        guild_id = int(request["guild_id"])
+        indexes = self.guild_indexes(guild_id)
+        if request.get("user_ids"):
+            requested = [int(user_id) - FIRST_MEMBER_ID for user_id in request["user_ids"]]
+            members = [self.member_payload(index) for index in requested if index in indexes]
+        else:
+            members = [self.bot_member_payload()] + [self.member_payload(index) for index in indexes]
+        chunk_count = max(math.ceil(len(members) / CHUNK_SIZE), 1)
+        for chunk_index in range(chunk_count):
+            chunk = {"guild_id": str(guild_id), "members": members[chunk_index * CHUNK_SIZE:(chunk_index + 1) * CHUNK_SIZE],
+                     "chunk_index": chunk_index, "chunk_count": chunk_count}
+            if request.get("nonce"):
+                chunk["nonce"] = request["nonce"]
+            await dispatch("GUILD_MEMBERS_CHUNK", chunk)
+            self.stats["member_chunks"] += 1
+
+    # REST
+    def global_limited(self):
+        """Retry-after for the global requests-per-second limit, or None"""
+        now = time.monotonic()
+        if now - self._window[0] >= 1:
+            self._window = [now, 0]
+        self._window[1] += 1
+        if self._window[1] > self.global_limit:
+            return self._window[0] + 1 - now
+        return None
+
+    def too_many_requests(self, retry_after, scope, headers=None):
+        self.stats[f"429_{scope}"] += 1
+        # Without Via, discord.py takes a 429 for a Cloudflare ban and gives up instead of retrying
+        headers = dict(headers or {}, **{"Retry-After": str(math.ceil(retry_after)), "X-RateLimit-Scope": scope, "Via": "1.1 google"})
+        if scope == 'global':
+            headers["X-RateLimit-Global"] = "true"
+        body = {"message": "You are being rate limited.", "retry_after": round(retry_after, 3), "global": scope == 'global'}
+        return json_response(body, status=429, headers=headers)
+
+    def channel_bucket(self, channel_id):
+        """Per-channel message bucket headers, and the retry-after if it is exhausted"""
+        now = time.time()
+        bucket = self._buckets.get(channel_id)
+        if bucket is None or now >= bucket[0]:
+            bucket = self._buckets[channel_id] = [now + self.channel_window, self.channel_limit]
+        retry_after = None
+        if bucket[1] <= 0:
+            retry_after = bucket[0] - now
+        else:
+            bucket[1] -= 1
+        headers = {
+            "X-RateLimit-Limit": str(self.channel_limit),
+            "X-RateLimit-Remaining": str(max(bucket[1], 0)),
+            "X-RateLimit-Reset": f"{bucket[0]:.3f}",
+            "X-RateLimit-Reset-After": f"{max(bucket[0] - now, 0):.3f}",
+            "X-RateLimit-Bucket": "mock-channel-messages"
+        }
+        return headers, retry_after
+
+    async def rest(self, request):
+        path = '/' + request.match_info['path'].rstrip('/')
+        method = request.method
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        retry_after = self.global_limited()
+        if retry_after is not None:
+            return self.too_many_requests(retry_after, 'global')
+
+        if method == 'GET' and path == '/users/@me':
+            return json_response(self.bot_user_payload())
+        if method == 'GET' and path == '/oauth2/applications/@me':
+            return json_response({
+                "id": str(APPLICATION_ID), "name": "Benchmark Bot", "description": "", "icon": None,
+                "bot_public": False, "bot_require_code_grant": False, "owner": self.user_payload(0),
+                "verify_key": "0" * 64, "flags": 0, "team": None
+            })
+        if method == 'GET' and path in ('/gateway', '/gateway/bot'):
+            return json_response({"url": self.url.replace('http', 'ws', 1) + '/gateway', "shards": 1,
+                                      "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 1}})
+        if method == 'POST' and path == '/users/@me/channels':
+            recipient_id = int((await request.json())["recipient_id"])
+            self.stats["dm_channels"] += 1
+            index = recipient_id - FIRST_MEMBER_ID
+            recipient = self.user_payload(index) if 0 <= index < self.members else {"id": str(recipient_id), "username": "user", "discriminator": "0", "avatar": None}
+            return json_response({"id": str(recipient_id + DM_CHANNEL_OFFSET), "type": 1, "last_message_id": None, "recipients": [recipient]})
+        if method == 'POST' and path.startswith('/channels/') and path.endswith('/messages'):
+            return await self.create_message(request, path.split('/')[2])
+        if method == 'POST' and path.startswith('/interactions/') and path.endswith('/callback'):
+            self.stats["interaction_responses"] += 1
+            body = await request.json() if request.content_type == 'application/json' else {}
+            return json_response({"interaction": {"id": path.split('/')[2], "type": 3, "response_message_loading": False,
+                                                  "response_message_ephemeral": bool((body.get("data") or {}).get("flags", 0) & 64)}})
+        if method == 'PUT' and path.startswith('/guilds/') and '/members/' in path and '/roles/' in path:
+            self.stats["role_grants"] += 1
+            return web.Response(status=204)
+
+        self.stats["unknown_routes"] += 1
+        return json_response({"message": "404: Not Found", "code": 0}, status=404)
+
+    async def create_message(self, request, channel_id):
+        headers, retry_after = self.channel_bucket(channel_id)
+        if retry_after is not None:
+            return self.too_many_requests(retry_after, 'user', headers)
+        if random.random() < self.rate_limit_rate:
+            return self.too_many_requests(random.uniform(0.05, 0.5), 'shared', headers)
+
+        index = int(channel_id) - DM_CHANNEL_OFFSET - FIRST_MEMBER_ID
+        if 0 <= index < self.members and self.dms_disabled(index):
+            self.stats["403"] += 1
+            return json_response({"message": "Cannot send messages to this user", "code": 50007}, status=403, headers=headers)
+
+        body = await request.json() if request.content_type == 'application/json' else {}
+        self.stats["messages"] += 1
+        return json_response({
+            "id": snowflake(), "channel_id": channel_id, "type": 0, "content": body.get("content") or "",
+            "author": self.bot_user_payload(), "embeds": body.get("embeds") or [], "components": body.get("components") or [],
+            "attachments": [], "mentions": [], "mention_roles": [], "mention_everyone": False, "pinned": False, "tts": False,
+            "timestamp": datetime.now(timezone.utc).isoformat(), "edited_timestamp": None, "flags": 0
+        }, headers=headers)
+
+    # Dashboard API
+    async def dashboard_function(self, request):
+        name = request.match_info['name']
+        self.stats[f"dashboard_{name}"] += 1
+        if name == 'getBotConfig':
+            payload = await request.json()
+            return json_response(self.configs.get(payload.get("bot_id"), {"active": False}))
+        return json_response({"success": True})
+
+
+async def serve(args):
+    mock = MockDiscord(members=args.members, sample_members=args.sample_members, latency=args.latency_ms / 1000,
+                       global_limit=args.global_limit, forbidden_rate=args.forbidden_rate, rate_limit_rate=args.rate_limit_rate)
+    url = await mock.start(args.host, args.port)
+    print(f"🧪 Mock Discord with {args.members} members at {url}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await mock.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--members', type=int, default=1000)
+    parser.add_argument('--sample-members', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=30)
+    parser.add_argument('--global-limit', type=int, default=50, help='requests per second before global 429s')
+    parser.add_argument('--forbidden-rate', type=float, default=0.02, help='share of members with DMs disabled')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.01, help='share of sends answered with a shared 429')
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,346 @@
+"""Replay a gateway recording against the mock Discord
+
+    GATEWAY_RECORD_FILE=gateway.jsonl.gz python bot.py         # record in production
+    python tools/replay.py gateway.jsonl.gz                    # replay at the original pace
+    python tools/replay.py gateway.jsonl.gz --speed 20 --database marketing_bot.db --json replay.json
+    python tools/replay.py gateway.jsonl.gz --speed 0          # as fast as the gateway takes them
+
+Rebuilds the busiest recorded guild in tools/mock_discord.py. Its role and
+channel ids are kept, so a copy of the production database (--database) applies
+its role DMs unchanged. Every recorded user becomes a synthetic member, so DMs
+land on the mock. A fresh bot process connects, and the recorded dispatches go
+out over its gateway at --speed times the original pace. Synthetic members start
+with only the Bench role, so each member's first update reads as gaining all of
+its recorded roles.
+
+Reports, per event handler, the number of calls, p50/p99/max run time and the
+peak number running at once, plus how long the bot took to drain after the last
+event (including the role DMs still queued for its workers), the DMs it sent and
+its event loop lag.
+"""
+import argparse
+import asyncio
+import functools
+import gzip
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+from mock_discord import MockDiscord, BOT_USER_ID, DM_CHANNEL_OFFSET, FIRST_MEMBER_ID, GUILD_ID  # noqa: E402
+from benchmark import MockThread, percentile  # noqa: E402
+
+TIMED_HANDLERS = ('on_member_join', 'on_member_update', 'on_member_remove', 'on_raw_member_remove', 'on_message', 'on_member_roles_added')
+DONE_EVENT = 'REPLAY_DONE'
+
+
+# Recording
+def load_recording(path):
+    """Guild snapshots, recorded bot user ids and [time, event, payload] entries in time order"""
+    guilds, bot_user_ids, events = {}, set(), []
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short when the bot was killed
+                if isinstance(entry, list):
+                    events.append(entry)
+                elif "guild" in entry:
+                    guilds[entry["guild"]["id"]] = entry["guild"]
+                elif entry.get("recording", {}).get("bot_user_id"):
+                    bot_user_ids.add(entry["recording"]["bot_user_id"])
+        except (EOFError, OSError) as e:
+            print(f"⚠️ Recording ends early ({e}); replaying what was read")
+    events.sort(key=lambda entry: entry[0])
+    return guilds, bot_user_ids, events
+
+
+class IdMap:
+    """Rewrites recorded ids: the guild onto the mock guild, users onto synthetic members"""
+
+    def __init__(self, guild_id, bot_user_ids):
+        self.ids = {guild_id: str(GUILD_ID)}
+        self.ids.update((user_id, str(BOT_USER_ID)) for user_id in bot_user_ids)
+        self.members = 0
+
+    def user(self, user_id):
+        if user_id not in self.ids:
+            self.ids[user_id] = str(FIRST_MEMBER_ID + self.members)
+            self.members += 1
+        return self.ids[user_id]
+
+    def collect(self, event, data):
+        for key in ('user', 'author'):
+            if isinstance(data.get(key), dict) and 'id' in data[key]:
+                self.user(data[key]['id'])
+        for mention in data.get('mentions') or []:
+            self.user(mention['id'])
+        if event == 'MESSAGE_CREATE' and not data.get('guild_id') and 'author' in data:
+            # The mock's DM channel for a member is its id plus DM_CHANNEL_OFFSET
+            self.ids[data['channel_id']] = str(int(self.user(data['author']['id'])) + DM_CHANNEL_OFFSET)
+
+    def apply(self, value):
+        if isinstance(value, dict):
+            return {key: self.apply(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.apply(item) for item in value]
+        if isinstance(value, str):
+            return self.ids.get(value, value)
+        return value
+
+
+def prepare_replay(path):
+    guilds, bot_user_ids, events = load_recording(path)
+    if not events:
+        raise SystemExit(f"❌ No events in {path}")
+    busiest = Counter(data.get('guild_id') for _, _, data in events if data.get('guild_id')).most_common(1)
+    guild_id = busiest[0][0] if busiest else None
+    events = [entry for entry in events if entry[2].get('guild_id') in (None, guild_id)]
+    ids = IdMap(guild_id, bot_user_ids)
+    for _, event, data in events:
+        ids.collect(event, data)
+    return guilds.get(guild_id), [(at, event, ids.apply(data)) for at, event, data in events], ids.members
+
+
+async def send_events(mock, events, speed):
+    """Dispatch the events at `speed` times their recorded pace; returns how far sending fell behind"""
+    started = time.monotonic()
+    first = events[0][0]
+    behind = 0
+    for count, (at, event, data) in enumerate(events):
+        if speed > 0:
+            delay = (at - first) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                behind = max(behind, -delay)
+        elif count % 100 == 0:
+            await asyncio.sleep(0)
+        await mock.dispatch(event, data)
+    await mock.dispatch(DONE_EVENT, {"events": len(events)})
+    return time.monotonic() - started, behind
+
+
+# Bot process side
+def run_bot(workdir, timeout):
+    """Connect to the mock, time the event handlers while the replay runs, then write the results"""
+    sys.path.insert(0, REPO_DIR)
+    import bot as marketing_bot
+
+    bot = marketing_bot.bot
+    durations = {}
+    in_flight = [0, 0]  # Current and peak handlers running
+
+    def timed(name, handler):
+        runs = durations.setdefault(name, [])
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+            started = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                runs.append(time.perf_counter() - started)
+                in_flight[0] -= 1
+        return wrapper
+
+    for name in TIMED_HANDLERS:
+        if getattr(bot, name, None) is not None:
+            setattr(bot, name, timed(name, getattr(bot, name)))
+        if name in bot.extra_events:
+            bot.extra_events[name] = [timed(f"{name} ({listener.__name__})", listener) for listener in bot.extra_events[name]]
+
+    dm_statuses = Counter()
+    record_dm_send = marketing_bot.record_dm_send
+
+    def record(kind, status, started, campaign=''):
+        dm_statuses[status] += 1
+        record_dm_send(kind, status, started, campaign)
+
+    marketing_bot.record_dm_send = record
+    marketing_bot.init_database()
+
+    async def main():
+        done = asyncio.Event()
+        bot._connection.parsers[DONE_EVENT] = lambda data: done.set()
+        lags = []
+
+        async def sample_lag():
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(0.05)
+                lags.append(time.perf_counter() - started - 0.05)
+
+        runner = asyncio.ensure_future(marketing_bot.run_bot_async())
+        deadline = time.monotonic() + timeout
+        while not bot.is_ready():
+            if runner.done() or time.monotonic() > deadline:
+                raise RuntimeError("Bot never became ready")
+            await asyncio.sleep(0.05)
+        # With MEMBER_CACHE=compact role changes are only seen once the guild is indexed
+        while marketing_bot.MEMBER_CACHE == 'compact' and any(guild.id not in marketing_bot.member_index.guilds for guild in bot.guilds):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Members were never indexed")
+            await asyncio.sleep(0.05)
+        sampler = asyncio.ensure_future(sample_lag())
+        open(os.path.join(workdir, 'ready'), 'w').close()
+
+        await asyncio.wait_for(done.wait(), max(deadline - time.monotonic(), 1))
+        done_at = time.perf_counter()
+        # Drained once no handler has run and no role DM has been queued for half a second
+        quiet_since = time.perf_counter()
+        while time.perf_counter() - quiet_since < 0.5:
+            if in_flight[0] or marketing_bot.role_dm_queue.pending():
+                quiet_since = time.perf_counter()
+            if time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.01)
+        drain = max(quiet_since - done_at, 0)
+        sampler.cancel()
+        signal.raise_signal(signal.SIGTERM)
+        await runner
+        return drain, lags
+
+    drain, lags = asyncio.run(main())
+    result = {
+        "handlers": [{
+            "handler": name,
+            "calls": len(runs),
+            "p50_ms": round(percentile(runs, 0.5) * 1000, 2) if runs else None,
+            "p99_ms": round(percentile(runs, 0.99) * 1000, 2) if runs else None,
+            "max_ms": round(max(runs) * 1000, 2) if runs else None,
+            "total_s": round(sum(runs), 3)
+        } for name, runs in sorted(durations.items())],
+        "peak_in_flight": in_flight[1],
+        "drain_seconds": round(drain, 3),
+        "dms": dict(dm_statuses),
+        "loop_lag_p99_ms": round(percentile(lags, 0.99) * 1000, 1) if lags else None,
+        "loop_lag_max_ms": round(max(lags) * 1000, 1) if lags else None
+    }
+    with open(os.path.join(workdir, 'result.json'), 'w') as f:
+        json.dump(result, f)
+
+
+# Harness side
+def copy_database(source, destination):
+    """Consistent copy of a live SQLite database, WAL included"""
+    with sqlite3.connect(source) as src, sqlite3.connect(destination) as dst:
+        src.backup(dst)
+
+
+def run_replay(args):
+    guild, events, members = prepare_replay(args.recording)
+    span = events[-1][0] - events[0][0]
+    print(f"🎞️ {len(events)} events over {span:.1f}s from {members} users in {guild['name'] if guild else 'an unrecorded guild'}")
+    mock = MockDiscord(members=max(members, 1), sample_members=0, latency=args.latency_ms / 1000,
+                       global_limit=args.global_limit, forbidden_rate=args.forbidden_rate, rate_limit_rate=0,
+                       roles=guild["roles"] if guild else (), channels=guild["channels"] if guild else ())
+
+    mock_thread = MockThread(mock)
+    with mock_thread, tempfile.TemporaryDirectory() as workdir:
+        if args.database:
+            copy_database(args.database, os.path.join(workdir, 'marketing_bot.db'))
+        env = dict(
+            os.environ,
+            DISCORD_BOT_TOKEN='mock-token',
+            DISCORD_API_BASE=mock.url,
+            API_BASE_URL=mock.url,
+            BOT_ID='replay',
+            BOT_MODE='gateway',
+            IPC_SOCKET=os.path.join(workdir, 'ipc.sock'),
+            DATABASE_PATH=os.path.join(workdir, 'marketing_bot.db'),
+            TRACKING_DIR=os.path.join(workdir, 'tracking'),
+            MEDIA_DIR=os.path.join(workdir, 'media'),
+            MEMBER_CACHE=args.member_cache
+        )
+        for name in ('METRICS_PORT', 'GATEWAY_RECORD_FILE'):
+            env.pop(name, None)
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--run-bot', workdir, '--timeout', str(args.timeout)],
+            env=env, cwd=workdir, stdout=None if args.verbose else subprocess.DEVNULL,
+            stderr=None if args.verbose else subprocess.PIPE
+        )
+        deadline = time.monotonic() + 120
+        while not os.path.exists(os.path.join(workdir, 'ready')):
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise SystemExit(f"❌ Bot did not start:\n{process.communicate()[1].decode('utf-8', 'replace')[-2000:] if process.stderr else ''}")
+            time.sleep(0.1)
+
+        print(f"▶️ Replaying at {'full speed' if args.speed <= 0 else f'{args.speed}x'}...")
+        replay_seconds, behind = asyncio.run_coroutine_threadsafe(send_events(mock, events, args.speed), mock_thread.loop).result()
+        _, stderr = process.communicate()
+        result_path = os.path.join(workdir, 'result.json')
+        if process.returncode != 0 or not os.path.exists(result_path):
+            raise SystemExit(f"❌ Bot exited with {process.returncode}:\n{stderr.decode('utf-8', 'replace')[-2000:] if stderr else ''}")
+        with open(result_path) as f:
+            result = json.load(f)
+
+    result.update({
+        "events": len(events),
+        "users": members,
+        "recorded_seconds": round(span, 3),
+        "replay_seconds": round(replay_seconds, 3),
+        "max_behind_schedule_s": round(behind, 3),
+        "speed": args.speed,
+        "member_cache": args.member_cache
+    })
+    return result
+
+
+def print_result(result):
+    print(f"\n{'handler':<50} {'calls':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>9} {'total s':>8}")
+    for handler in result["handlers"]:
+        print(f"{handler['handler']:<50} {handler['calls']:>7} {handler['p50_ms'] or '-':>8} {handler['p99_ms'] or '-':>8} "
+              f"{handler['max_ms'] or '-':>9} {handler['total_s']:>8}")
+    print(f"\n{result['events']} events replayed in {result['replay_seconds']}s (recorded over {result['recorded_seconds']}s, "
+          f"at most {result['max_behind_schedule_s']}s behind schedule)")
+    print(f"Peak handlers in flight: {result['peak_in_flight']}, drained {result['drain_seconds']}s after the last event")
+    print(f"DMs: {', '.join(f'{count} {status}' for status, count in sorted(result['dms'].items())) or 'none'}")
+    print(f"Event loop lag: p99 {result['loop_lag_p99_ms']} ms, max {result['loop_lag_max_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__.split('\n\n', 1)[1])
+    parser.add_argument('recording', nargs='?', help='file written through GATEWAY_RECORD_FILE')
+    parser.add_argument('--speed', type=float, default=1, help='multiple of the recorded pace; 0 sends as fast as possible')
+    parser.add_argument('--database', help='database to copy for the replay, e.g. production config')
+    parser.add_argument('--member-cache', choices=('full', 'compact'), default='full')
+    parser.add_argument('--latency-ms', type=float, default=30, help='mean mock REST latency')
+    parser.add_argument('--global-limit', type=int, default=50, help='requests per second before global 429s')
+    parser.add_argument('--forbidden-rate', type=float, default=0.02, help='share of members with DMs disabled')
+    parser.add_argument('--timeout', type=float, default=3600, help='seconds the bot process may run')
+    parser.add_argument('--json', help='write the results here')
+    parser.add_argument('--verbose', action='store_true', help="show the bot process's output")
+    parser.add_argument('--run-bot', metavar='WORKDIR', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_bot:
+        run_bot(args.run_bot, args.timeout)
+        return
+    if not args.recording:
+        parser.error('a recording is required')
+
+    result = run_replay(args)
+    print_result(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
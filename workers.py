@@ -0,0 +1,225 @@
+"""CPU-bound work run in bot.py's process pool: image normalization and the insight engine
+
+Pool workers import only this module, so it must stay free of side effects: no
+Discord client, logging setup, config parsing or other imports from bot.py.
+"""
+import io
+import json
+import os
+import sqlite3
+
+
+# Image normalization
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000  # refuse decompression bombs before decoding
+
+def sniff_image_type(data):
+    """Detect the image type from its magic bytes, ignoring the filename and the client's claimed type"""
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def normalize_image(data, max_size):
+    """Downscale and re-encode an image; runs in a worker process. Returns (bytes, content_type)"""
+    content_type = sniff_image_type(data)
+    if content_type is None:
+        raise ValueError("File is not a PNG, JPEG, GIF or WEBP image")
+    try:
+        from PIL import Image, ImageOps  # Optional: without it uploads are validated but not resized
+    except ImportError:
+        return data, content_type
+    
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > IMAGE_MAX_PIXELS:
+            raise ValueError("Image dimensions are too large")
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError("Could not read image file") from e
+    
+    # Animated images would lose their frames, so they are only checked, not re-encoded
+    if getattr(image, 'is_animated', False):
+        return data, content_type
+    
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+    
+    output = io.BytesIO()
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha:
+        image.convert('RGBA').save(output, format='PNG', optimize=True)
+        result = (output.getvalue(), 'image/png')
+    else:
+        image.convert('RGB').save(output, format='JPEG', quality=88, optimize=True, progressive=True)
+        result = (output.getvalue(), 'image/jpeg')
+    
+    # Never store a "normalized" file that is bigger than what was uploaded and already fit
+    if len(result[0]) >= len(data) and max(Image.open(io.BytesIO(data)).size) <= max_size:
+        return data, content_type
+    return result
+
+
+# Insight engine
+# Insights are computed from incremental rollups and stored in ai_insights, so
+# /api/analytics/insights only ever reads precomputed rows.
+def sample_confidence(sample_size, target):
+    """Confidence that grows with sample size and saturates at `target` observations"""
+    return round(min(1.0, sample_size / float(target)), 2) if target else 0.0
+
+def rollup_tracking_hourly(conn, tracking_dir):
+    """Fold tracking rows added since the last run into user_tracking_hourly"""
+    cursor = conn.cursor()
+    try:
+        names = sorted(f[:-3] for f in os.listdir(tracking_dir) if f.startswith('user_tracking_') and f.endswith('.db'))
+    except FileNotFoundError:
+        names = []
+    
+    for name in names:
+        try:
+            cursor.execute("ATTACH DATABASE ? AS part", (os.path.join(tracking_dir, f"{name}.db"),))
+        except sqlite3.OperationalError:
+            continue
+        try:
+            # Watermarks follow the file, not its name: a clear mid-rollup can only leave
+            # a watermark for the old file behind, never one the recreated file would match
+            source = name
+            try:
+                cursor.execute('SELECT partition_id FROM part.tracking_partition')
+                row = cursor.fetchone()
+                if row:
+                    source = f"{name}:{row[0]}"
+            except sqlite3.OperationalError:
+                pass  # Partition created before files carried an id
+            cursor.execute('SELECT last_id FROM rollup_watermarks WHERE source = ?', (source,))
+            row = cursor.fetchone()
+            last_id = row[0] if row else 0
+            
+            cursor.execute('SELECT MAX(id) FROM part.user_tracking')
+            max_id = cursor.fetchone()[0] or 0
+            if max_id > last_id:
+                cursor.execute('''
+                    INSERT INTO user_tracking_hourly (hour, interaction_type, events)
+                    SELECT strftime('%Y-%m-%d %H:00', timestamp), interaction_type, COUNT(*)
+                    FROM part.user_tracking
+                    WHERE id > ? AND id <= ?
+                    GROUP BY 1, 2
+                    ON CONFLICT(hour, interaction_type) DO UPDATE SET events = events + excluded.events
+                ''', (last_id, max_id))
+                cursor.execute('INSERT OR REPLACE INTO rollup_watermarks (source, last_id) VALUES (?, ?)', (source, max_id))
+                conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
+        finally:
+            cursor.execute("DETACH DATABASE part")
+    
+    # Hourly rows only need to cover the insight window
+    cursor.execute("DELETE FROM user_tracking_hourly WHERE hour < strftime('%Y-%m-%d %H:00', 'now', '-90 days')")
+    conn.commit()
+
+def peak_hour_insight(cursor):
+    cursor.execute('''
+        SELECT substr(hour, 12, 2) AS hour_of_day, SUM(events) AS events
+        FROM user_tracking_hourly
+        WHERE hour >= strftime('%Y-%m-%d %H:00', 'now', '-30 days')
+        GROUP BY hour_of_day
+        ORDER BY events DESC
+    ''')
+    rows = cursor.fetchall()
+    total = sum(row[1] for row in rows)
+    if not total:
+        return None
+    
+    top = rows[:3]
+    share = sum(row[1] for row in top) / float(total)
+    hours = ", ".join(f"{row[0]}:00" for row in top)
+    return ("peak_engagement_hours", {
+        "summary": f"Most engagement happens around {hours} UTC ({share:.0%} of the last 30 days)",
+        "hours": [{"hour": int(row[0]), "events": row[1]} for row in top],
+        "total_events": total
+    }, sample_confidence(total, 1000))
+
+def top_clicked_insight(cursor, table, id_column, label_column, insight_type, noun):
+    cursor.execute(f'''
+        SELECT {id_column}, {label_column}, click_count, unique_clicks
+        FROM {table}
+        WHERE click_count > 0
+        ORDER BY click_count DESC
+        LIMIT 3
+    ''')
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    
+    cursor.execute(f'SELECT COALESCE(SUM(click_count), 0) FROM {table}')
+    total = cursor.fetchone()[0]
+    best = rows[0]
+    return (insight_type, {
+        "summary": f"Best-performing {noun}: {best[1] or best[0]} with {best[2]} clicks ({best[3]} unique)",
+        "top": [{"id": row[0], "label": row[1], "clicks": row[2], "unique_clicks": row[3]} for row in rows],
+        "total_clicks": total
+    }, sample_confidence(total, 200))
+
+def campaign_opt_out_insights(cursor):
+    # A recipient counts against a campaign if they opted out within 7 days of their first delivery
+    cursor.execute('''
+        SELECT d.campaign_id, COUNT(*) AS recipients, COUNT(o.user_id) AS opted_out
+        FROM (
+            SELECT campaign_id, user_id, MIN(sent_at) AS first_sent
+            FROM campaign_deliveries
+            WHERE status = 'sent'
+            GROUP BY campaign_id, user_id
+        ) d
+        LEFT JOIN marketing_opt_outs o
+            ON o.user_id = d.user_id
+            AND o.opt_out_type = 'marketing'
+            AND o.created_at >= d.first_sent
+            AND o.created_at < datetime(d.first_sent, '+7 days')
+        GROUP BY d.campaign_id
+        HAVING recipients > 0
+        ORDER BY opted_out * 1.0 / recipients DESC
+        LIMIT 10
+    ''')
+    insights = []
+    for campaign_id, recipients, opted_out in cursor.fetchall():
+        rate = opted_out / float(recipients)
+        insights.append(("campaign_opt_out_rate", {
+            "summary": f"Campaign {campaign_id}: {rate:.1%} of {recipients} recipients opted out within 7 days",
+            "campaign_id": campaign_id,
+            "recipients": recipients,
+            "opted_out": opted_out,
+            "rate": round(rate, 4)
+        }, sample_confidence(recipients, 500)))
+    return insights
+
+def compute_insights(database_path, tracking_dir):
+    """Refresh rollups and regenerate ai_insights (runs in a worker process)"""
+    conn = sqlite3.connect(database_path, timeout=30)
+    cursor = conn.cursor()
+    try:
+        rollup_tracking_hourly(conn, tracking_dir)
+        
+        insights = [
+            peak_hour_insight(cursor),
+            top_clicked_insight(cursor, 'button_analytics', 'button_id', 'button_text', 'best_buttons', 'button'),
+            top_clicked_insight(cursor, 'link_analytics', 'link_url', 'link_type', 'best_links', 'link'),
+        ]
+        insights.extend(campaign_opt_out_insights(cursor))
+        insights = [insight for insight in insights if insight]
+        
+        # Swap the active set in one transaction so readers never see it half-written
+        cursor.execute('UPDATE ai_insights SET is_active = 0 WHERE is_active = 1')
+        cursor.executemany(
+            'INSERT INTO ai_insights (insight_type, insight_data, confidence_score) VALUES (?, ?, ?)',
+            [(insight_type, json.dumps(data), confidence) for insight_type, data, confidence in insights]
+        )
+        cursor.execute("DELETE FROM ai_insights WHERE is_active = 0 AND generated_at < datetime('now', '-7 days')")
+        conn.commit()
+        return len(insights)
+    finally:
+        conn.close()